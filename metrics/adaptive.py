@@ -0,0 +1,133 @@
+"""Chu kỳ lấy mẫu thích ứng: rút về floor khi metric gần ngưỡng alert hoặc đổi nhanh, giãn dần tới ceiling khi phẳng
+
+Chu kỳ đi theo một thang gấp đôi (floor, 2*floor, 4*floor, ..., ceiling) nên số giá trị 'resolution' gắn vào
+point InfluxDB là hữu hạn. Tăng tốc ngay lập tức (một mẫu nóng là đủ), giảm tốc từng nấc sau vài mẫu yên.
+"""
+import threading
+from collections import namedtuple
+
+# metric: series hoặc họ series như trong rule alert; op: '>'/'>=' (ngưỡng trên) hoặc '<'/'<=' (ngưỡng dưới)
+Watch = namedtuple('Watch', 'metric threshold op')
+
+
+def watches_from_rules(rules):
+    """Mỗi rule so sánh giá trị thô (không phải rate) với ngưỡng khác 0 thành một Watch"""
+    watches = {}
+    for rule in rules:
+        if rule.agg == 'rate' or not rule.threshold:
+            continue
+        watches.setdefault((rule.metric, rule.op), Watch(rule.metric, rule.threshold, rule.op))
+    return list(watches.values())
+
+
+def interval_ladder(floor, ceiling):
+    """floor, 2*floor, 4*floor, ... (không vượt ceiling), kết thúc bằng ceiling"""
+    ladder = []
+    interval = floor
+    while interval < ceiling:
+        ladder.append(interval)
+        interval *= 2
+    ladder.append(ceiling)
+    return ladder
+
+
+class AdaptiveInterval:
+    """Chọn chu kỳ lấy mẫu từ từng snapshot (đã flatten), báo cho các listener khi chu kỳ đổi"""
+
+    def __init__(self, base, floor, ceiling, watches, near=0.8, change=0.1, calm_samples=3):
+        if not 0 < floor <= ceiling:
+            raise ValueError(f"adaptive sampling needs 0 < floor <= ceiling (got {floor}, {ceiling})")
+        self.watches = list(watches)
+        # Gần ngưỡng: giá trị đạt near * ngưỡng (ngưỡng dưới: ngưỡng / near)
+        self.near = near
+        # Đổi nhanh: thay đổi giữa hai mẫu liên tiếp từ change * ngưỡng trở lên
+        self.change = change
+        self.calm_samples = calm_samples
+        self.ladder = interval_ladder(floor, ceiling)
+        # Bắt đầu ở nấc gần chu kỳ cấu hình nhất
+        self.level = min(range(len(self.ladder)), key=lambda i: abs(self.ladder[i] - base))
+        self.changes = 0
+        self.reason = None
+        self._calm = 0
+        self._previous = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return self.ladder[self.level]
+
+    def on_change(self, func):
+        """Đăng ký func(interval) được gọi sau mỗi lần đổi chu kỳ"""
+        self._listeners.append(func)
+
+    def _matching(self, metric, values):
+        if ':' in metric:
+            return [metric] if metric in values else []
+        prefix = metric + ':'
+        return [key for key in values if key == metric or key.startswith(prefix)]
+
+    def _assess(self, values):
+        """('hot', lý do) nếu có series gần ngưỡng/đổi nhanh, ('warm', None) nếu đổi vừa phải, ('calm', None)"""
+        state = 'calm'
+        previous = self._previous
+        for watch in self.watches:
+            upper = watch.op in ('>', '>=')
+            threshold = abs(watch.threshold)
+            for series in self._matching(watch.metric, values):
+                value = values[series]
+                if (value >= watch.threshold * self.near) if upper else (value <= watch.threshold / self.near):
+                    return 'hot', f"{series} {value:g} near {watch.threshold:g}"
+                last = previous.get(series)
+                if last is None:
+                    continue
+                delta = abs(value - last)
+                if delta >= threshold * self.change:
+                    return 'hot', f"{series} changed by {delta:g}"
+                if delta >= threshold * self.change / 2:
+                    state = 'warm'
+        return state, None
+
+    def observe(self, values):
+        """Cập nhật theo một mẫu {series: value}; True nếu chu kỳ vừa đổi"""
+        with self._lock:
+            # Mẫu có thể chỉ gồm series của các collector vừa chạy (mỗi collector một chu kỳ riêng)
+            watched = {series: values[series] for watch in self.watches for series in self._matching(watch.metric, values)}
+            if not watched:
+                # Không có series nào đang theo dõi: không tính là một mẫu yên
+                return False
+            state, reason = self._assess(watched)
+            self._previous.update(watched)
+            level = self.level
+            if state == 'hot':
+                self._calm = 0
+                level = 0
+            elif state == 'calm':
+                self._calm += 1
+                if self._calm >= self.calm_samples and level < len(self.ladder) - 1:
+                    self._calm = 0
+                    level += 1
+                    reason = f"calm for {self.calm_samples} samples"
+            else:
+                self._calm = 0
+            if level == self.level:
+                return False
+            self.level = level
+            self.reason = reason
+            self.changes += 1
+            interval = self.interval
+        for listener in self._listeners:
+            try:
+                listener(interval)
+            except Exception as e:
+                print(f"❌ Adaptive sampling listener failed: {e}")
+        return True
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "ladder": self.ladder,
+            "changes": self.changes,
+            "reason": self.reason,
+            "watches": [f"{w.metric} {w.op} {w.threshold:g}" for w in self.watches]
+        }
@@ -0,0 +1,298 @@
+"""Alert engine theo rule khai báo: cửa sổ trượt avg/p95/rate, điều kiện for-duration và hysteresis khi clear"""
+import json
+import math
+import threading
+from collections import deque
+
+from history import parse_duration
+
+AGGREGATES = ('last', 'avg', 'min', 'max', 'p95', 'rate')
+
+OPERATORS = {
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+}
+
+# Cửa sổ chỉ được đánh giá khi dữ liệu đã phủ ít nhất tỉ lệ này (tránh cảnh báo ngay khi vừa khởi động)
+MIN_WINDOW_COVERAGE = 0.9
+
+
+def _seconds(value):
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return parse_duration(value)
+
+
+class AlertRule:
+    """Một rule: metric (hoặc họ series có nhãn), phép gộp trên cửa sổ, ngưỡng bật/tắt"""
+
+    def __init__(self, name, metric, threshold, op='>', agg='last', window=0, clear=None,
+                 for_seconds=0, repeat=0, severity='warning', summary=None):
+        if op not in OPERATORS:
+            raise ValueError(f"rule '{name}': unknown operator '{op}'")
+        if agg not in AGGREGATES:
+            raise ValueError(f"rule '{name}': unknown aggregate '{agg}'")
+        if agg != 'last' and window <= 0:
+            raise ValueError(f"rule '{name}': aggregate '{agg}' needs a window")
+        self.name = name
+        self.metric = metric
+        self.threshold = float(threshold)
+        self.op = op
+        self.agg = agg
+        self.window = float(window)
+        # Hysteresis: chỉ clear khi giá trị quay về phía bên kia của ngưỡng clear
+        self.clear = float(clear) if clear is not None else self.threshold
+        self.for_seconds = float(for_seconds)
+        self.repeat = float(repeat)
+        self.severity = severity
+        self.summary = summary or name
+        self._compare = OPERATORS[op]
+
+    @classmethod
+    def from_dict(cls, data, default_repeat=0):
+        return cls(
+            name=data['name'],
+            metric=data['metric'],
+            threshold=data['threshold'],
+            op=data.get('op', '>'),
+            agg=data.get('agg', 'last'),
+            window=_seconds(data.get('window')),
+            clear=data.get('clear'),
+            for_seconds=_seconds(data.get('for')),
+            repeat=_seconds(data.get('repeat', default_repeat)),
+            severity=data.get('severity', 'warning'),
+            summary=data.get('summary')
+        )
+
+    def breached(self, value):
+        return self._compare(value, self.threshold)
+
+    def cleared(self, value):
+        # Điều kiện clear là phủ định của điều kiện bật, so với ngưỡng clear
+        return not self._compare(value, self.clear)
+
+    def describe(self):
+        window = f" {self.agg} {self.window:g}s" if self.window else ''
+        return f"{self.metric}{window} {self.op} {self.threshold:g}"
+
+
+def load_rules(path, default_repeat=0):
+    """Đọc rule file JSON: danh sách rule hoặc {"rules": [...]}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('rules', [])
+    return [AlertRule.from_dict(item, default_repeat) for item in data]
+
+
+class WindowBuffer:
+    """Các mẫu (t, v) của một series trong một cửa sổ; mọi rule cùng cửa sổ dùng chung buffer này"""
+
+    __slots__ = ('window', 'samples', 'total', '_tick', '_cache')
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = deque()
+        self.total = 0.0
+        self._tick = None
+        self._cache = {}
+
+    def add(self, t, v):
+        samples = self.samples
+        if samples and t <= samples[-1][0]:
+            # Cùng tick đã được thêm bởi một nhóm rule khác
+            return
+        samples.append((t, v))
+        self.total += v
+        horizon = t - self.window
+        while samples[0][0] < horizon:
+            self.total -= samples.popleft()[1]
+
+    @property
+    def last_time(self):
+        return self.samples[-1][0] if self.samples else None
+
+    def ready(self):
+        if not self.samples:
+            return False
+        if self.window <= 0:
+            return True
+        span = self.samples[-1][0] - self.samples[0][0]
+        return len(self.samples) > 1 and span >= self.window * MIN_WINDOW_COVERAGE
+
+    def aggregate(self, agg, tick):
+        """Giá trị gộp, tính một lần mỗi tick cho mọi rule dùng chung cửa sổ"""
+        if tick != self._tick:
+            self._tick = tick
+            self._cache = {}
+        value = self._cache.get(agg)
+        if value is None and agg not in self._cache:
+            value = self._cache[agg] = self._compute(agg)
+        return value
+
+    def _compute(self, agg):
+        samples = self.samples
+        if agg == 'last':
+            return samples[-1][1]
+        if agg == 'avg':
+            return self.total / len(samples)
+        if agg == 'min':
+            return min(v for _, v in samples)
+        if agg == 'max':
+            return max(v for _, v in samples)
+        if agg == 'p95':
+            ordered = self._cache.get('_sorted')
+            if ordered is None:
+                ordered = self._cache['_sorted'] = sorted(v for _, v in samples)
+            return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+        if agg == 'rate':
+            (t0, v0), (t1, v1) = samples[0], samples[-1]
+            return (v1 - v0) / (t1 - t0) if t1 > t0 else None
+        raise ValueError(agg)
+
+
+class AlertEngine:
+    """Đánh giá mọi rule trên mỗi mẫu; rule cùng (metric, window) được gom nhóm trên cùng buffer"""
+
+    def __init__(self, rules, max_events=1000):
+        self.rules = list(rules)
+        self._lock = threading.Lock()
+        self._groups = {}
+        for rule in self.rules:
+            self._groups.setdefault((rule.metric, rule.window), []).append(rule)
+        self._buffers = {}  # (series, window) -> WindowBuffer
+        self._states = {}  # (rule name, series) -> trạng thái pending/firing
+        self._events = deque(maxlen=max_events)
+        self._listeners = []
+        self._emitted = []
+        self.evaluations = 0
+        self.dropped_events = 0
+
+    def add_listener(self, func):
+        """func(event) được gọi ngay (ngoài lock) cho mỗi sự kiện mới, trước khi check_and_send_alerts drain"""
+        self._listeners.append(func)
+
+    @staticmethod
+    def _label(series):
+        return series.split(':', 1)[1] if ':' in series else None
+
+    def _matching(self, metric, values, families):
+        if ':' in metric:
+            return [metric] if metric in values else []
+        return families.get(metric, ())
+
+    def _emit(self, event):
+        if len(self._events) == self._events.maxlen:
+            self.dropped_events += 1
+        self._events.append(event)
+        if self._listeners:
+            self._emitted.append(event)
+
+    def evaluate(self, timestamp, values):
+        """Đưa một mẫu {series: value} vào các cửa sổ rồi cập nhật trạng thái của từng (rule, series)"""
+        families = {}
+        for key in values:
+            families.setdefault(key.split(':', 1)[0], []).append(key)
+
+        with self._lock:
+            self.evaluations += 1
+            for (metric, window), rules in self._groups.items():
+                for series in self._matching(metric, values, families):
+                    buffer = self._buffers.get((series, window))
+                    if buffer is None:
+                        buffer = self._buffers[(series, window)] = WindowBuffer(window)
+                    buffer.add(timestamp, values[series])
+                    if not buffer.ready():
+                        continue
+                    for rule in rules:
+                        value = buffer.aggregate(rule.agg, timestamp)
+                        if value is not None:
+                            self._step(rule, series, value, timestamp)
+            self._expire(timestamp)
+            emitted, self._emitted = self._emitted, []
+
+        for event in emitted:
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    print(f"❌ Alert listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+    def _step(self, rule, series, value, now):
+        key = (rule.name, series)
+        state = self._states.get(key)
+        if state is None:
+            if rule.breached(value):
+                state = self._states[key] = {"state": "pending", "since": now, "notified_at": None, "value": value}
+            else:
+                return
+        state["value"] = value
+
+        if state["state"] == "pending":
+            if not rule.breached(value):
+                # Chưa đủ for-duration đã hết vi phạm -> bỏ qua, không gửi gì
+                del self._states[key]
+            elif now - state["since"] >= rule.for_seconds:
+                state["state"] = "firing"
+                state["notified_at"] = now
+                self._emit(self._event(rule, series, "firing", state, now))
+            return
+
+        if rule.cleared(value):
+            del self._states[key]
+            self._emit(self._event(rule, series, "resolved", state, now))
+        elif rule.repeat and now - state["notified_at"] >= rule.repeat:
+            state["notified_at"] = now
+            self._emit(self._event(rule, series, "repeat", state, now))
+
+    def _event(self, rule, series, status, state, now):
+        return {
+            "rule": rule.name,
+            "summary": rule.summary,
+            "severity": rule.severity,
+            "series": series,
+            "label": self._label(series),
+            "status": status,
+            "value": round(state["value"], 2),
+            "threshold": rule.threshold if status != "resolved" else rule.clear,
+            "condition": rule.describe(),
+            "since": state["since"],
+            "timestamp": now
+        }
+
+    def _expire(self, now):
+        """Bỏ buffer/trạng thái của series đã biến mất (mount bị gỡ, NIC bị xoá...)"""
+        stale = [key for key, buffer in self._buffers.items()
+                 if now - buffer.last_time > max(buffer.window, 60) * 2]
+        for series, window in stale:
+            del self._buffers[(series, window)]
+            for rule in self._groups.get((series.split(':', 1)[0], window), []) + self._groups.get((series, window), []):
+                self._states.pop((rule.name, series), None)
+
+    def drain(self):
+        """Lấy và xoá các sự kiện firing/resolved/repeat chưa gửi"""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def active(self):
+        with self._lock:
+            return [{"rule": rule, "series": series, **state} for (rule, series), state in self._states.items()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rules": len(self.rules),
+                "window_groups": len(self._groups),
+                "window_buffers": len(self._buffers),
+                "evaluations": self.evaluations,
+                "pending": sum(1 for s in self._states.values() if s["state"] == "pending"),
+                "firing": sum(1 for s in self._states.values() if s["state"] == "firing"),
+                "queued_events": len(self._events),
+                "dropped_events": self.dropped_events
+            }
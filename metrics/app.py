@@ -1,4 +1,4 @@
-from flask import Flask, jsonify
+from aiohttp import web
 import psutil
 import platform
 from datetime import datetime
@@ -7,31 +7,101 @@ import json
 import re
 import os
 import asyncio
-import threading
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from influxdb_client import InfluxDBClient, Point, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
+from sampler import SnapshotCache, MetricsSampler
+from cpu_stats import CpuAccountant
+from rates import NetworkRates, DiskRates
+import procfs
+from cgroups import CgroupMonitor, KINDS as CGROUP_KINDS, cgroup_of
+from psi import PressureMonitor, PressureTriggers, parse_triggers
+from capture import BurstCapture, KernelLogWatcher, SystemProbe
+from influx_writer import BatchWriter, SpillQueue
+from gpu import GpuCollector
+from collectors import Collector, CollectorRegistry, env_bool
+from disk import MountTable, DiskUsageCollector
+from proctable import ProcessTable, SORT_KEYS as PROCESS_SORT_KEYS
+from history import HistoryStore, AGGREGATES as HISTORY_AGGREGATES, flatten_snapshot, parse_duration, parse_since
+from mmstore import MetricsStore
+from adaptive import AdaptiveInterval, watches_from_rules
+from alerts import AlertEngine, AlertRule, load_rules
+from notifier import NotificationDispatcher
+from openmetrics import encode_openmetrics, CONTENT_TYPE as OPENMETRICS_CONTENT_TYPE
+from serving import ResponseFactory, VersionedPayload
+from stream import StreamHub, parse_subscription
+import codec
+from fleet import FleetPoller, parse_targets
+from selfstats import SelfStats
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+routes = web.RouteTableDef()
 
 # InfluxDB Configuration
 INFLUXDB_URL = os.getenv('INFLUXDB_URL')
 INFLUXDB_TOKEN = os.getenv('INFLUXDB_TOKEN')
 INFLUXDB_ORG = os.getenv('INFLUXDB_ORG')
 INFLUXDB_BUCKET = os.getenv('INFLUXDB_BUCKET')
+INFLUXDB_BATCH_SIZE = int(os.getenv('INFLUXDB_BATCH_SIZE', 5000))  # Số point tối đa mỗi request ghi
+INFLUXDB_FLUSH_INTERVAL = float(os.getenv('INFLUXDB_FLUSH_INTERVAL', 10))  # Flush batch ít nhất mỗi X giây
+INFLUXDB_MAX_RETRIES = int(os.getenv('INFLUXDB_MAX_RETRIES', 3))  # Số lần thử ghi trước khi spill ra đĩa
+INFLUXDB_SPOOL_DIR = os.getenv('INFLUXDB_SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'influx_spool'))
+INFLUXDB_SPOOL_MAX_MB = float(os.getenv('INFLUXDB_SPOOL_MAX_MB', 100))  # Dung lượng tối đa của spill buffer, 0 = tắt
 COLLECTION_INTERVAL = int(os.getenv('COLLECTION_INTERVAL', 10))
+SAMPLE_INTERVAL = int(os.getenv('SAMPLE_INTERVAL', min(COLLECTION_INTERVAL, 5)))  # Chu kỳ lấy mẫu nền (giây)
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', SAMPLE_INTERVAL * 3))  # Tuổi tối đa của snapshot trong cache (giây)
+ADAPTIVE_SAMPLING = env_bool('ADAPTIVE_SAMPLING', False)  # Chu kỳ lấy mẫu/export tự co giãn theo độ gần ngưỡng alert
+ADAPTIVE_MIN_INTERVAL = float(os.getenv('ADAPTIVE_MIN_INTERVAL', 1))  # Chu kỳ ngắn nhất khi metric gần ngưỡng hoặc đổi nhanh (giây)
+ADAPTIVE_MAX_INTERVAL = float(os.getenv('ADAPTIVE_MAX_INTERVAL', 30))  # Chu kỳ dài nhất khi mọi metric phẳng (giây)
+ADAPTIVE_NEAR = float(os.getenv('ADAPTIVE_NEAR', 0.8))  # "Gần ngưỡng" = đạt tỉ lệ này của ngưỡng alert
+ADAPTIVE_CHANGE = float(os.getenv('ADAPTIVE_CHANGE', 0.1))  # "Đổi nhanh" = thay đổi giữa hai mẫu từ tỉ lệ này của ngưỡng
+COLLECTOR_WORKERS = int(os.getenv('COLLECTOR_WORKERS', 4))  # Số thread chạy collector song song
+BLOCKING_WORKERS = int(os.getenv('BLOCKING_WORKERS', 4))  # Số thread cho các lời gọi chặn từ event loop
+HTTP_HOST = os.getenv('HTTP_HOST', '0.0.0.0')
+HTTP_PORT = int(os.getenv('HTTP_PORT', 1232))
+HTTP_WORKERS = int(os.getenv('HTTP_WORKERS', 2))  # Số thread encode/nén response
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 75))  # Giữ kết nối keep-alive (giây)
+HTTP_BACKLOG = int(os.getenv('HTTP_BACKLOG', 128))
+HTTP_ENCODINGS = [e.strip() for e in os.getenv('HTTP_ENCODINGS', 'zstd,gzip').split(',') if e.strip()]  # Thứ tự ưu tiên nén
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'json')  # json | orjson
+STREAM_MAX_SUBSCRIBERS = int(os.getenv('STREAM_MAX_SUBSCRIBERS', 100))  # Số client SSE/WebSocket tối đa
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', 15))  # Gửi keep-alive khi không có frame (giây)
+COMPACT_KEYFRAME_INTERVAL = int(os.getenv('COMPACT_KEYFRAME_INTERVAL', 60))  # Số frame delta giữa hai keyframe của định dạng gọn
+AGENT_MODE = os.getenv('AGENT_MODE', 'agent').lower()  # agent | aggregator (poll thêm các agent trong FLEET_TARGETS)
+AGENT_HOSTNAME = os.getenv('AGENT_HOSTNAME') or socket.gethostname()  # Tên host hiển thị và tag "host" trong InfluxDB
+FLEET_TARGETS = parse_targets(os.getenv('FLEET_TARGETS', ''))  # name=http://host:1232,... (chế độ aggregator)
+FLEET_POLL_INTERVAL = float(os.getenv('FLEET_POLL_INTERVAL', 10))  # Chu kỳ poll các agent (giây)
+FLEET_TIMEOUT = float(os.getenv('FLEET_TIMEOUT', 3))  # Timeout mỗi target (giây)
+FLEET_CONCURRENCY = int(os.getenv('FLEET_CONCURRENCY', 50))  # Số request đồng thời tối đa tới các agent
+HISTORY_RETENTION = int(os.getenv('HISTORY_RETENTION', 86400))  # Thời gian giữ lịch sử trong RAM (giây), 0 = tắt
+HISTORY_MAX_SERIES = int(os.getenv('HISTORY_MAX_SERIES', 1000))  # Số series tối đa trong history store
+METRICS_STORE_ENABLED = env_bool('METRICS_STORE_ENABLED', False)  # Bật kho lịch sử trên đĩa (mỗi series cấp phát sẵn ~3.2 MB với tầng mặc định)
+METRICS_STORE_DIR = os.getenv('METRICS_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics_store'))  # Kho lịch sử bền trên đĩa (file mmap)
+METRICS_STORE_TIERS = os.getenv('METRICS_STORE_TIERS', '10s:2d,1m:30d,1h:365d')  # Các tầng rollup step:retention, từ mịn tới thô
+METRICS_STORE_MAX_MB = float(os.getenv('METRICS_STORE_MAX_MB', 1024))  # Dung lượng đĩa tối đa của kho (quyết định số series), 0 = tắt
+METRICS_STORE_FLUSH_INTERVAL = float(os.getenv('METRICS_STORE_FLUSH_INTERVAL', 60))  # Chu kỳ msync kho xuống đĩa (giây)
 
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_ALLOWED_USERS = [uid.strip() for uid in os.getenv('TELEGRAM_ALLOWED_USERS', '').split(',') if uid.strip()] if os.getenv('TELEGRAM_ALLOWED_USERS') else []
 TELEGRAM_AUTO_SEND_CHAT_ID = [cid.strip() for cid in os.getenv('TELEGRAM_AUTO_SEND_CHAT_ID', '').split(',') if cid.strip()] if os.getenv('TELEGRAM_AUTO_SEND_CHAT_ID') else []  # List chat IDs để gửi status tự động
 TELEGRAM_AUTO_SEND_INTERVAL = int(os.getenv('TELEGRAM_AUTO_SEND_INTERVAL', 3600))  # Interval (giây), mặc định 1 giờ
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')  # Bot API khác (vd. fake_botapi.py: http://127.0.0.1:8081/bot)
+TELEGRAM_CONNECTION_POOL_SIZE = int(os.getenv('TELEGRAM_CONNECTION_POOL_SIZE', 8))  # Connection pool của HTTPXRequest
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 25))  # Số message/giây tối đa cho toàn bot
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))  # Số message/giây tối đa cho mỗi chat
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', 3))  # Số message gửi dồn được cho mỗi chat
+TELEGRAM_COALESCE_SECONDS = float(os.getenv('TELEGRAM_COALESCE_SECONDS', 2))  # Gộp các alert bắn trong khoảng này
+TELEGRAM_QUEUE_SIZE = int(os.getenv('TELEGRAM_QUEUE_SIZE', 100))  # Số message chờ tối đa mỗi chat
 
 # Alert Thresholds Configuration
 TELEGRAM_ALERT_CHAT_ID = [cid.strip() for cid in os.getenv('TELEGRAM_ALERT_CHAT_ID', '').split(',') if cid.strip()] if os.getenv('TELEGRAM_ALERT_CHAT_ID') else []  # List chat IDs để gửi cảnh báo
@@ -39,16 +109,44 @@ ALERT_CPU_THRESHOLD = float(os.getenv('ALERT_CPU_THRESHOLD', 80))  # CPU % thres
 ALERT_RAM_THRESHOLD = float(os.getenv('ALERT_RAM_THRESHOLD', 85))  # RAM % threshold
 ALERT_GPU_THRESHOLD = float(os.getenv('ALERT_GPU_THRESHOLD', 90))  # GPU Memory % threshold
 ALERT_DISK_THRESHOLD = float(os.getenv('ALERT_DISK_THRESHOLD', 90))  # Disk % threshold
-ALERT_CHECK_INTERVAL = int(os.getenv('ALERT_CHECK_INTERVAL', 60))  # Kiểm tra mỗi 60s
-ALERT_COOLDOWN = int(os.getenv('ALERT_COOLDOWN', 300))  # Chỉ gửi lại sau 5 phút
-
-# Biến lưu trạng thái alert (tránh spam)
-last_alert_time = {
-    'cpu': 0,
-    'ram': 0,
-    'gpu': 0,
-    'disk': 0
-}
+ALERT_CHECK_INTERVAL = int(os.getenv('ALERT_CHECK_INTERVAL', 10))  # Chu kỳ gửi sự kiện alert (rule được đánh giá trên mỗi mẫu)
+ALERT_COOLDOWN = int(os.getenv('ALERT_COOLDOWN', 300))  # Nhắc lại alert vẫn đang firing sau 5 phút
+ALERT_RULES_FILE = os.getenv('ALERT_RULES_FILE')  # File rule JSON; bỏ trống = rule mặc định theo ALERT_*_THRESHOLD
+ALERT_CPU_PRESSURE_THRESHOLD = float(os.getenv('ALERT_CPU_PRESSURE_THRESHOLD', 50))  # % thời gian có task chờ CPU (PSI cpu some, trung bình 5 phút)
+ALERT_MEMORY_PRESSURE_THRESHOLD = float(os.getenv('ALERT_MEMORY_PRESSURE_THRESHOLD', 10))  # % thời gian mọi task bị chặn vì RAM (PSI memory full)
+ALERT_IO_PRESSURE_THRESHOLD = float(os.getenv('ALERT_IO_PRESSURE_THRESHOLD', 20))  # % thời gian mọi task bị chặn vì IO (PSI io full)
+PSI_TRIGGERS = os.getenv('PSI_TRIGGERS', '')  # Trigger PSI của kernel, vd memory:full:100:2000 (resource:some|full:stall ms:cửa sổ ms)
+
+# Burst Capture Configuration
+CAPTURE_ENABLED = env_bool('CAPTURE_ENABLED', True)  # Lấy mẫu dày khi alert firing hoặc kernel báo OOM kill / hung task
+CAPTURE_INTERVAL_MS = int(os.getenv('CAPTURE_INTERVAL_MS', 100))  # Chu kỳ lấy mẫu trong cửa sổ capture (ms)
+CAPTURE_DURATION = float(os.getenv('CAPTURE_DURATION', 10))  # Độ dài cửa sổ capture (giây)
+CAPTURE_KEEP = int(os.getenv('CAPTURE_KEEP', 10))  # Số capture gần nhất được giữ trong RAM (buffer cấp phát sẵn)
+CAPTURE_COOLDOWN = float(os.getenv('CAPTURE_COOLDOWN', 60))  # Khoảng cách tối thiểu giữa hai lần bắt đầu capture cùng loại trigger (giây)
+CAPTURE_TOP = int(os.getenv('CAPTURE_TOP', 5))  # Số process top CPU ghi lại mỗi lần chụp bảng process (mỗi 5 mẫu)
+CAPTURE_KMSG = env_bool('CAPTURE_KMSG', True)  # Theo dõi /dev/kmsg để capture khi có OOM kill / hung task / lockup
+
+# GPU Configuration
+GPU_BACKEND = os.getenv('GPU_BACKEND', 'auto')  # auto | nvml | smi | fake | none
+GPU_SMI_INTERVAL_MS = int(os.getenv('GPU_SMI_INTERVAL_MS', 1000))  # Chu kỳ của luồng nvidia-smi --loop
+
+# Disk Configuration
+DISK_IGNORE_MOUNT_PREFIXES = [p.strip() for p in os.getenv('DISK_IGNORE_MOUNT_PREFIXES', '/etc/,/usr/,/dev/,/tmp/').split(',') if p.strip()]
+DISK_IGNORE_FSTYPES = [t.strip() for t in os.getenv('DISK_IGNORE_FSTYPES', '').split(',') if t.strip()]
+DISK_STATVFS_TIMEOUT = float(os.getenv('DISK_STATVFS_TIMEOUT', 2))  # Timeout statvfs mỗi chu kỳ (giây)
+DISK_QUARANTINE_SECONDS = int(os.getenv('DISK_QUARANTINE_SECONDS', 300))  # Thời gian cách ly mount bị treo
+
+# Process Configuration
+PROCESS_INTERVAL = int(os.getenv('PROCESS_INTERVAL', max(SAMPLE_INTERVAL, 10)))  # Chu kỳ lấy mẫu bảng process (giây)
+PROCESS_TOP_LIMIT = int(os.getenv('PROCESS_TOP_LIMIT', 50))  # Số process tối đa trả về qua HTTP
+CGROUP_ROOT = os.getenv('CGROUP_ROOT', '/sys/fs/cgroup')  # Mount cgroup v2 (hệ hybrid: tự tìm <CGROUP_ROOT>/unified)
+CGROUP_MAX_GROUPS = int(os.getenv('CGROUP_MAX_GROUPS', 200))  # Số cgroup tối đa trong snapshot (nặng nhất theo CPU rồi RAM)
+CGROUP_RESCAN_INTERVAL = float(os.getenv('CGROUP_RESCAN_INTERVAL', 60))  # Duyệt lại cây định kỳ khi không có inotify (giây)
+CGROUP_PRESSURE = env_bool('CGROUP_PRESSURE', True)  # Đọc thêm cpu/memory/io.pressure của từng cgroup
+PROCFS_FAST_PATH = os.getenv('PROCFS_FAST_PATH', 'auto').lower()  # auto | on | off: đọc CPU/RAM/mạng/disk IO thẳng từ /proc (Linux)
+
+# Chi phí của chính agent: thời gian từng stage, lỗi, độ trễ scheduler/event loop, CPU/RSS của process
+self_stats = SelfStats()
 
 # Initialize InfluxDB client
 influxdb_client = None
@@ -64,50 +162,33 @@ if all([INFLUXDB_URL, INFLUXDB_TOKEN, INFLUXDB_ORG, INFLUXDB_BUCKET]):
 else:
     print("⚠️  InfluxDB not configured - metrics will not be sent to InfluxDB")
 
+# Writer batch: gom point của nhiều chu kỳ thành một request, spill ra đĩa khi InfluxDB down
+influx_writer = None
+
+if write_api:
+    spill_queue = None
+    if INFLUXDB_SPOOL_MAX_MB > 0:
+        # Snapshot được spill ở định dạng gọn và dựng lại line protocol khi replay
+        spill_queue = SpillQueue(INFLUXDB_SPOOL_DIR, int(INFLUXDB_SPOOL_MAX_MB * 1024**2),
+                                 render=lambda metrics: [point.to_line_protocol() for point in build_influx_points(metrics, influx_resolution(metrics))])
+    def write_influx_lines(lines):
+        with self_stats.timer('influx.write'):
+            write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=lines, write_precision=WritePrecision.NS)
+
+    influx_writer = BatchWriter(
+        write_influx_lines,
+        batch_size=INFLUXDB_BATCH_SIZE,
+        flush_interval=INFLUXDB_FLUSH_INTERVAL,
+        max_retries=INFLUXDB_MAX_RETRIES,
+        spill=spill_queue
+    )
+
+# GPU collector: phiên NVML dài hạn, fallback sang một process nvidia-smi --loop chạy nền
+gpu_collector = GpuCollector(backend=GPU_BACKEND, smi_interval_ms=GPU_SMI_INTERVAL_MS)
+
 def get_gpu_info():
-    """Lấy thông tin GPU NVIDIA sử dụng nvidia-smi (GPU đầu tiên)"""
-    try:
-        result = subprocess.run(
-            ['nvidia-smi', '--query-gpu=index,name,temperature.gpu,utilization.gpu,memory.total,memory.used,memory.free,power.draw,power.limit,fan.speed', 
-             '--format=csv,noheader,nounits'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode != 0:
-            return None
-            
-        # Chỉ lấy GPU đầu tiên
-        line = result.stdout.strip().split('\n')[0]
-        if line:
-            parts = [p.strip() for p in line.split(',')]
-            if len(parts) >= 10:
-                mem_total = float(parts[4]) if parts[4] != '[N/A]' else 0
-                mem_used = float(parts[5]) if parts[5] != '[N/A]' else 0
-                mem_free = float(parts[6]) if parts[6] != '[N/A]' else 0
-                mem_free_custom = mem_total - mem_used  # Tính chính xác từ total - used
-                
-                return {
-                    "index": int(parts[0]),
-                    "name": parts[1],
-                    "temperature_c": round(float(parts[2]), 1) if parts[2] != '[N/A]' else None,
-                    "usage_percent": round(float(parts[3]), 1) if parts[3] != '[N/A]' else None,
-                    "memory": {
-                        "total_gb": round(mem_total / 1024, 2),
-                        "used_gb": round(mem_used / 1024, 2),
-                        "free_gb": round(mem_free / 1024, 2),
-                        "free_gb_custom": round(mem_free_custom / 1024, 2),  # total - used
-                        "usage_percent": round((mem_used / mem_total * 100), 2) if mem_total > 0 else 0
-                    },
-                    "power_draw_w": round(float(parts[7]), 1) if parts[7] != '[N/A]' else None,
-                    "power_limit_w": round(float(parts[8]), 1) if parts[8] != '[N/A]' else None,
-                    "fan_speed_percent": round(float(parts[9]), 1) if parts[9] != '[N/A]' else None
-                }
-        
-        return None
-    except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-        return None
+    """Lấy thông tin tất cả GPU NVIDIA (NVML hoặc luồng nvidia-smi), [] nếu không có GPU"""
+    return gpu_collector.collect()
 
 def get_temperature_sensors():
     """Lấy thông tin nhiệt độ từ các cảm biến Linux"""
@@ -162,229 +243,970 @@ def get_battery_info():
     
     return None
 
-def collect_metrics():
-    """Thu thập metrics để trả về hoặc gửi đến InfluxDB"""
-    """Lấy các thông số metrics quan trọng của server"""
-    
-    # CPU metrics
-    cpu_percent = psutil.cpu_percent(interval=1)
-    
-    # Load average (Linux)
+# Fast path Linux: giữ fd của /proc/stat, meminfo, net/dev, diskstats và parse trực tiếp thay cho psutil
+proc_reader = None
+try:
+    proc_reader = procfs.open_reader(PROCFS_FAST_PATH)
+    if proc_reader:
+        print(f"✅ procfs fast path enabled ({proc_reader.root})")
+except OSError as e:
+    print(f"⚠️  procfs fast path unavailable ({e}) - using psutil")
+
+# Tính CPU từ delta cpu_times giữa các lần lấy mẫu, không cần sleep
+cpu_accountant = CpuAccountant(proc_reader.cpu_times if proc_reader else None)
+
+# Tính tốc độ mạng/disk thực theo chu kỳ từ delta bộ đếm của từng NIC và device
+network_rates = NetworkRates(proc_reader.net_io_counters if proc_reader else None)
+disk_rates = DiskRates(proc_reader.disk_io_counters if proc_reader else None)
+
+def sum_rates(items, field, skip=()):
+    """Cộng một trường tốc độ của nhiều NIC/device, bỏ qua giá trị chưa có"""
+    values = [item[field] for key, item in items.items() if key not in skip and item.get(field) is not None]
+    return sum(values) if values else 0
+
+# ============= COLLECTORS =============
+# Mỗi collector trả về một phần của snapshot và chạy theo chu kỳ riêng (cấu hình qua COLLECTOR_<NAME>_*)
+
+def collect_cpu():
+    """CPU usage tổng, từng core và từng mode (delta so với lần lấy mẫu trước)"""
+    cpu_stats = cpu_accountant.sample()
+    return {
+        "physical_cores": psutil.cpu_count(logical=False),
+        "logical_cores": psutil.cpu_count(logical=True),
+        "usage_percent": cpu_stats['usage_percent'],
+        "per_core_percent": cpu_stats['per_core'],
+        "modes_percent": cpu_stats['modes'],
+        "seconds_total": cpu_stats['seconds_total']
+    }
+
+def collect_load():
+    """Load average (Linux)"""
     try:
         load_avg = psutil.getloadavg()
     except (AttributeError, OSError):
         load_avg = (None, None, None)
+    return {
+        "load_1min": round(load_avg[0], 2) if load_avg[0] is not None else None,
+        "load_5min": round(load_avg[1], 2) if load_avg[1] is not None else None,
+        "load_15min": round(load_avg[2], 2) if load_avg[2] is not None else None
+    }
+
+def collect_memory():
+    """RAM usage"""
+    memory = proc_reader.virtual_memory() if proc_reader else psutil.virtual_memory()
+    return {
+        "total_gb": round(memory.total / (1024**3), 2),
+        "used_gb": round(memory.used / (1024**3), 2),
+        "available_gb": round(memory.available / (1024**3), 2),
+        "usage_percent": round(memory.percent, 2),
+        "total_bytes": memory.total,
+        "used_bytes": memory.used,
+        "available_bytes": memory.available
+    }
+
+# Disk usage theo từng mount: bảng partition cache theo mountinfo, statvfs có timeout
+disk_usage_collector = DiskUsageCollector(
+    MountTable(ignore_prefixes=DISK_IGNORE_MOUNT_PREFIXES, ignore_fstypes=DISK_IGNORE_FSTYPES),
+    statvfs_timeout=DISK_STATVFS_TIMEOUT,
+    quarantine_seconds=DISK_QUARANTINE_SECONDS
+)
+
+def collect_disk_usage():
+    """Dung lượng và inode của từng mountpoint, kèm tổng của tất cả partition"""
+    return disk_usage_collector.collect()
+
+def collect_disk_io():
+    """Disk IO - tốc độ theo từng block device"""
+    disk_io = disk_rates.sample()
+    return {
+        "read_mb_per_sec": round(sum_rates(disk_io, 'read_bytes_per_sec') / (1024**2), 2),
+        "write_mb_per_sec": round(sum_rates(disk_io, 'write_bytes_per_sec') / (1024**2), 2),
+        "read_iops": round(sum_rates(disk_io, 'read_iops'), 2),
+        "write_iops": round(sum_rates(disk_io, 'write_iops'), 2),
+        "io": disk_io
+    }
+
+def collect_network():
+    """Network - tốc độ theo từng NIC (tổng không tính loopback)"""
+    net_interfaces = network_rates.sample()
+    # Tổng của mọi NIC lấy từ cùng lần đọc bộ đếm, không đọc lại /proc/net/dev
+    net_io = network_rates.totals
+    loopbacks = [nic for nic in net_interfaces if nic.startswith('lo')]
+    return {
+        "sent_gb": round(net_io.get('bytes_sent', 0) / (1024**3), 2),
+        "recv_gb": round(net_io.get('bytes_recv', 0) / (1024**3), 2),
+        "sent_mb_per_sec": round(sum_rates(net_interfaces, 'sent_bytes_per_sec', loopbacks) / (1024**2), 2),
+        "recv_mb_per_sec": round(sum_rates(net_interfaces, 'recv_bytes_per_sec', loopbacks) / (1024**2), 2),
+        "packets_sent_per_sec": round(sum_rates(net_interfaces, 'sent_packets_per_sec', loopbacks), 2),
+        "packets_recv_per_sec": round(sum_rates(net_interfaces, 'recv_packets_per_sec', loopbacks), 2),
+        "packets_sent": net_io.get('packets_sent', 0),
+        "packets_recv": net_io.get('packets_recv', 0),
+        "errors": net_io.get('errin', 0) + net_io.get('errout', 0),
+        "drops": net_io.get('dropin', 0) + net_io.get('dropout', 0),
+        "interfaces": net_interfaces
+    }
+
+# Bảng process: một lượt process_iter mỗi chu kỳ, CPU% tính từ delta cpu_times của từng PID
+process_table = ProcessTable()
+
+def collect_processes():
+    """Lấy mẫu lại bảng process; /top và /processes đọc bảng mới nhất"""
+    process_table.sample()
+    return process_table.stats()
+
+# Tài nguyên theo container/unit systemd: cây cgroup v2 cache, chỉ duyệt lại khi inotify báo thay đổi
+cgroup_monitor = None
+try:
+    cgroup_monitor = CgroupMonitor(CGROUP_ROOT, max_groups=CGROUP_MAX_GROUPS, rescan_interval=CGROUP_RESCAN_INTERVAL,
+                                   pressure=CGROUP_PRESSURE)
+    print(f"✅ cgroup v2 collector enabled ({cgroup_monitor.root}, {cgroup_monitor.watch_mode})")
+except OSError as e:
+    print(f"⚠️  cgroup collector disabled: {e}")
+
+def collect_cgroups():
+    """CPU/RAM/IO/pids của từng cgroup (container, service, slice) với tốc độ theo chu kỳ"""
+    return cgroup_monitor.sample() if cgroup_monitor else None
+
+# PSI: % thời gian task bị chặn vì thiếu CPU/RAM/IO, tín hiệu tranh chấp tốt hơn CPU%/RAM%
+pressure_monitor = None
+try:
+    pressure_monitor = PressureMonitor()
+except OSError as e:
+    print(f"⚠️  Pressure stall collector disabled: {e}")
+
+# Trigger PSI của kernel (PSI_TRIGGERS), được đăng ký trong main() khi event loop đã chạy
+pressure_triggers = None
+
+def collect_pressure():
+    """Stall time tăng thêm trong chu kỳ (%) và avg10/60/300 của /proc/pressure/{cpu,memory,io}"""
+    return pressure_monitor.sample() if pressure_monitor else None
+
+def process_groups(processes):
+    """Gắn tên container/unit cho một danh sách process nhỏ (top N), đọc /proc/<pid>/cgroup khi cần"""
+    if cgroup_monitor is None:
+        return processes
+    annotated = []
+    for p in processes:
+        path = cgroup_of(p['pid'])
+        annotated.append(dict(p, cgroup=cgroup_monitor.name_of(path) if path else None))
+    return annotated
+
+def collect_agent():
+    """Chi phí của chính agent: CPU/RSS/thread, độ trễ scheduler và event loop, thời gian từng stage"""
+    extra = {}
+    if influx_writer:
+        extra["influx_pending_points"] = influx_writer.pending
+        extra["influx_dropped_points"] = influx_writer.dropped_points + (influx_writer.spill.dropped_lines if influx_writer.spill else 0)
+    if notification_dispatcher:
+        extra["telegram_failed"] = notification_dispatcher.failed
+        extra["telegram_dropped"] = notification_dispatcher.dropped
+    extra["sample_interval_seconds"] = sampler.interval
+    return self_stats.summary(extra)
+
+def collect_system():
+    """Thông tin hệ thống ít thay đổi"""
+    return {
+        "hostname": AGENT_HOSTNAME,
+        "platform": platform.system(),
+        "os_version": platform.release(),
+        "boot_time": psutil.boot_time()
+    }
+
+# Giá trị mặc định khi collector bị tắt hoặc chưa chạy thành công lần nào
+EMPTY_DISK_USAGE = {"total_gb": 0, "used_gb": 0, "free_gb": 0, "usage_percent": 0, "total_bytes": 0, "used_bytes": 0, "free_bytes": 0,
+                    "inodes_total": 0, "inodes_used": 0, "inodes_usage_percent": 0, "mounts": {}, "quarantined": []}
+EMPTY_DISK_IO = {"read_mb_per_sec": 0, "write_mb_per_sec": 0, "read_iops": 0, "write_iops": 0, "io": {}}
+EMPTY_NETWORK = {"sent_gb": 0, "recv_gb": 0, "sent_mb_per_sec": 0, "recv_mb_per_sec": 0, "packets_sent_per_sec": 0,
+                 "packets_recv_per_sec": 0, "packets_sent": 0, "packets_recv": 0, "errors": 0, "drops": 0, "interfaces": {}}
+EMPTY_CPU = {"physical_cores": None, "logical_cores": None, "usage_percent": 0, "per_core_percent": [], "modes_percent": {}, "seconds_total": {}}
+EMPTY_LOAD = {"load_1min": None, "load_5min": None, "load_15min": None}
+EMPTY_MEMORY = {"total_gb": 0, "used_gb": 0, "available_gb": 0, "usage_percent": 0, "total_bytes": 0, "used_bytes": 0, "available_bytes": 0}
+
+collector_registry = CollectorRegistry(max_workers=COLLECTOR_WORKERS, observer=self_stats.observe)
+collector_registry.register(Collector("cpu", collect_cpu, SAMPLE_INTERVAL, timeout=2, default=EMPTY_CPU, adaptive=True))
+collector_registry.register(Collector("load", collect_load, SAMPLE_INTERVAL, timeout=2, default=EMPTY_LOAD, adaptive=True))
+collector_registry.register(Collector("memory", collect_memory, SAMPLE_INTERVAL, timeout=2, default=EMPTY_MEMORY, adaptive=True))
+collector_registry.register(Collector("network", collect_network, SAMPLE_INTERVAL, timeout=2, default=EMPTY_NETWORK, adaptive=True))
+collector_registry.register(Collector("disk_io", collect_disk_io, SAMPLE_INTERVAL, timeout=2, default=EMPTY_DISK_IO, adaptive=True))
+collector_registry.register(Collector("disk", collect_disk_usage, max(SAMPLE_INTERVAL, 30), timeout=DISK_STATVFS_TIMEOUT + 3, default=EMPTY_DISK_USAGE))
+collector_registry.register(Collector("gpu", get_gpu_info, SAMPLE_INTERVAL, timeout=5, default=[], adaptive=True))
+collector_registry.register(Collector("system", collect_system, 300, timeout=2))
+collector_registry.register(Collector("processes", collect_processes, PROCESS_INTERVAL, timeout=10, adaptive=True))
+collector_registry.register(Collector("agent", collect_agent, SAMPLE_INTERVAL, timeout=2, adaptive=True))
+collector_registry.register(Collector("pressure", collect_pressure, SAMPLE_INTERVAL, timeout=2, enabled=pressure_monitor is not None, adaptive=True))
+collector_registry.register(Collector("cgroups", collect_cgroups, SAMPLE_INTERVAL, timeout=5, enabled=cgroup_monitor is not None, adaptive=True))
+# Collector tuỳ chọn (tắt mặc định), bật bằng COLLECTOR_<NAME>_ENABLED=true
+collector_registry.register(Collector("temperatures", get_temperature_sensors, 30, timeout=5, enabled=False))
+collector_registry.register(Collector("fans", get_fan_sensors, 30, timeout=5, enabled=False))
+collector_registry.register(Collector("battery", get_battery_info, 60, timeout=5, enabled=False))
+
+def assemble_snapshot(results):
+    """Ghép kết quả mới nhất của các collector thành snapshot theo format cũ"""
+    system = dict(results.get('system') or collect_system())
+    system["uptime_hours"] = round((time.time() - system['boot_time']) / 3600, 2)
+    gpus = results.get('gpu') or []
     
-    # Memory metrics
-    memory = psutil.virtual_memory()
+    metrics = {
+        "timestamp": datetime.now().isoformat(),
+        "system": system,
+        "cpu": {**(results.get('cpu') or EMPTY_CPU), **(results.get('load') or EMPTY_LOAD)},
+        "memory": results.get('memory') or EMPTY_MEMORY,
+        "disk": {**(results.get('disk') or EMPTY_DISK_USAGE), **(results.get('disk_io') or EMPTY_DISK_IO)},
+        "network": results.get('network') or EMPTY_NETWORK,
+        "gpu": gpus[0] if gpus else None,  # GPU đầu tiên, giữ tương thích với client cũ
+        "gpus": gpus
+    }
     
-    # Disk metrics - tổng hợp tất cả partition
-    disk_total = 0
-    disk_used = 0
-    disk_free = 0
-    seen_devices = set()
+    for name in ('temperatures', 'fans', 'battery', 'agent', 'pressure', 'cgroups'):
+        collector = collector_registry.get(name)
+        if collector and collector.enabled:
+            metrics[name] = results.get(name)
     
-    for partition in psutil.disk_partitions(all=False):
-        # Bỏ qua các mountpoint là file hoặc bind mount trùng lặp
-        if partition.mountpoint.startswith('/etc/') or partition.mountpoint.startswith('/usr/'):
-            continue
-        if partition.mountpoint.startswith('/dev/') or partition.mountpoint.startswith('/tmp/'):
-            continue
-            
-        # Chỉ lấy 1 lần cho mỗi device
-        device_key = f"{partition.device}_{partition.fstype}"
-        if device_key in seen_devices:
-            continue
-        seen_devices.add(device_key)
-        
+    return metrics
+
+def sample_metrics():
+    """Chạy các collector đến hạn rồi ghép snapshot (dùng bởi sampler nền)"""
+    with self_stats.timer('sample'):
+        return assemble_snapshot(collector_registry.run_due())
+
+def collect_metrics():
+    """Thu thập metrics để trả về hoặc gửi đến InfluxDB"""
+    """Chạy ngay tất cả collector đang bật, bỏ qua chu kỳ riêng"""
+    return assemble_snapshot(collector_registry.run_due(force=True))
+
+# Sampler nền dùng chung: endpoint, job định kỳ, alert và lệnh bot đều đọc từ cùng một cache
+snapshot_cache = SnapshotCache(max_age=SNAPSHOT_MAX_AGE)
+# Sampler tick theo collector nhanh nhất; mỗi tick chỉ chạy các collector đã đến hạn
+sampler_tick = min([c.interval for c in collector_registry if c.enabled] or [SAMPLE_INTERVAL])
+sampler = MetricsSampler(sample_metrics, snapshot_cache, sampler_tick)
+
+# Lịch sử gần đây trong RAM: mỗi snapshot được ghi vào ring buffer của từng series
+# Ring tính theo SAMPLE_INTERVAL (chu kỳ ghi của series thường), không theo collector nhanh nhất: một collector
+# 1s không được làm mọi series tốn retention/1s slot. Series chỉ được ghi khi collector của nó có kết quả mới.
+history_store = None
+if HISTORY_RETENTION > 0:
+    history_store = HistoryStore(HISTORY_RETENTION, SAMPLE_INTERVAL, max_series=HISTORY_MAX_SERIES)
+
+# Lịch sử dài hạn trên đĩa: còn nguyên sau restart và khi InfluxDB down, rollup cập nhật ngay trên mỗi lần ghi
+metrics_store = None
+if METRICS_STORE_ENABLED and METRICS_STORE_MAX_MB > 0 and METRICS_STORE_DIR:
+    try:
+        metrics_store = MetricsStore(METRICS_STORE_DIR, METRICS_STORE_TIERS, int(METRICS_STORE_MAX_MB * 1024**2))
+        print(f"✅ Metrics store: {METRICS_STORE_DIR} ({len(metrics_store.series())} series, "
+              f"room for {metrics_store.max_series} at {metrics_store.segment_size / 1024**2:.1f} MB each)")
+    except (OSError, ValueError) as e:
+        print(f"❌ Metrics store disabled: {e}")
+
+def history_backend(since, source=None):
+    """Kho trả lời truy vấn lịch sử: RAM khi còn giữ trọn khoảng since..now, không thì kho trên đĩa"""
+    if source == 'memory' or metrics_store is None:
+        return history_store
+    if source == 'disk' or history_store is None:
+        return metrics_store
+    return history_store if history_store.covers(since) else metrics_store
+
+def default_alert_rules():
+    """Rule mặc định tương đương các ngưỡng ALERT_* cũ, nhưng trên cửa sổ trượt và có hysteresis"""
+    return [
+        AlertRule("cpu_high", "cpu_usage_percent", ALERT_CPU_THRESHOLD, agg="avg", window=300,
+                  clear=ALERT_CPU_THRESHOLD - 10, repeat=ALERT_COOLDOWN, summary="CPU WARNING"),
+        AlertRule("ram_high", "memory_usage_percent", ALERT_RAM_THRESHOLD, agg="avg", window=120,
+                  clear=ALERT_RAM_THRESHOLD - 5, repeat=ALERT_COOLDOWN, summary="RAM WARNING"),
+        AlertRule("disk_full", "mount_usage_percent", ALERT_DISK_THRESHOLD,
+                  clear=ALERT_DISK_THRESHOLD - 2, repeat=ALERT_COOLDOWN, summary="DISK WARNING"),
+        AlertRule("gpu_memory_high", "gpu_memory_usage_percent", ALERT_GPU_THRESHOLD, agg="avg", window=60,
+                  clear=ALERT_GPU_THRESHOLD - 5, repeat=ALERT_COOLDOWN, summary="GPU MEMORY WARNING"),
+        # PSI: stall tăng thêm mỗi chu kỳ; RAM/IO 'full' báo ngay (trigger PSI có thể đánh thức sớm hơn chu kỳ)
+        AlertRule("cpu_pressure", "pressure_some_percent:cpu", ALERT_CPU_PRESSURE_THRESHOLD, agg="avg", window=300,
+                  clear=ALERT_CPU_PRESSURE_THRESHOLD * 0.5, repeat=ALERT_COOLDOWN, summary="CPU PRESSURE"),
+        AlertRule("memory_pressure", "pressure_full_percent:memory", ALERT_MEMORY_PRESSURE_THRESHOLD,
+                  clear=ALERT_MEMORY_PRESSURE_THRESHOLD * 0.5, repeat=ALERT_COOLDOWN, severity="critical", summary="MEMORY PRESSURE"),
+        AlertRule("io_pressure", "pressure_full_percent:io", ALERT_IO_PRESSURE_THRESHOLD,
+                  clear=ALERT_IO_PRESSURE_THRESHOLD * 0.5, repeat=ALERT_COOLDOWN, summary="IO PRESSURE"),
+    ]
+
+# Alert engine đánh giá rule trên mỗi snapshot, sự kiện được bot gửi đi trong check_and_send_alerts
+alert_engine = AlertEngine(load_rules(ALERT_RULES_FILE, ALERT_COOLDOWN) if ALERT_RULES_FILE else default_alert_rules())
+
+def apply_sampling_interval(interval):
+    """Đổi chu kỳ của sampler và các collector thích ứng theo chu kỳ adaptive mới (gọi từ thread của sampler)"""
+    collector_registry.set_scale(interval / SAMPLE_INTERVAL)
+    sampler.interval = min(c.effective_interval for c in collector_registry if c.enabled)
+    # Snapshot giữa hai lần lấy mẫu dài vẫn được coi là mới, không bắt request phải thu thập đồng bộ
+    snapshot_cache.max_age = max(SNAPSHOT_MAX_AGE, sampler.interval * 3)
+
+def export_interval(interval):
+    """Chu kỳ export InfluxDB giữ tỉ lệ COLLECTION_INTERVAL / SAMPLE_INTERVAL, không ngắn hơn chu kỳ lấy mẫu"""
+    return max(interval, COLLECTION_INTERVAL * interval / SAMPLE_INTERVAL)
+
+# Adaptive sampling: theo dõi đúng các metric/ngưỡng của rule alert đang dùng
+ADAPTIVE_STATIC_SERIES = ('mount_usage_percent', 'mount_inodes_usage_percent')
+adaptive_interval = None
+if ADAPTIVE_SAMPLING:
+    # Disk usage do collector 30s không thích ứng cập nhật: lấy mẫu nhanh hơn không làm nó mới hơn
+    watches = [w for w in watches_from_rules(alert_engine.rules) if w.metric.split(':', 1)[0] not in ADAPTIVE_STATIC_SERIES]
+    adaptive_interval = AdaptiveInterval(SAMPLE_INTERVAL, ADAPTIVE_MIN_INTERVAL, ADAPTIVE_MAX_INTERVAL, watches,
+                                         near=ADAPTIVE_NEAR, change=ADAPTIVE_CHANGE)
+    adaptive_interval.on_change(apply_sampling_interval)
+    adaptive_interval.on_change(lambda interval: print(f"🔄 Adaptive sampling: every {interval:g}s ({adaptive_interval.reason})"))
+    apply_sampling_interval(adaptive_interval.interval)
+
+@self_stats.timed('history_alerts')
+def on_snapshot(version, metrics):
+    """Flatten snapshot một lần rồi đưa cho history store (RAM và đĩa) và alert engine
+
+    Chỉ các section có collector vừa chạy lại: giá trị cũ lặp lại ở mỗi tick sẽ thành mẫu trùng,
+    làm lệch cửa sổ alert và khiến adaptive sampling tưởng metric đang phẳng.
+    """
+    timestamp = datetime.fromisoformat(metrics['timestamp']).timestamp()
+    values = flatten_snapshot(metrics, collector_registry.take_updated())
+    if history_store is not None:
+        history_store.record(timestamp, values)
+    if metrics_store is not None:
+        metrics_store.record(timestamp, values)
+    alert_engine.evaluate(timestamp, values)
+    if adaptive_interval is not None:
+        adaptive_interval.observe(values)
+
+sampler.add_listener(on_snapshot)
+
+# Burst capture: buffer cấp phát sẵn, thread lấy mẫu chỉ chạy trong cửa sổ sau một alert firing hoặc sự kiện kernel
+burst_capture = None
+if CAPTURE_ENABLED:
+    try:
+        # PressureMonitor riêng: delta stall của capture (100ms) không được làm lệch mốc của collector pressure
+        capture_pressure = PressureMonitor()
+    except OSError:
+        capture_pressure = None
+    burst_capture = BurstCapture(
+        SystemProbe(
+            cpu_times=proc_reader.cpu_times if proc_reader else None,
+            virtual_memory=proc_reader.virtual_memory if proc_reader else None,
+            net_counters=proc_reader.net_io_counters if proc_reader else None,
+            disk_counters=proc_reader.disk_io_counters if proc_reader else None,
+            pressure=capture_pressure
+        ),
+        interval=CAPTURE_INTERVAL_MS / 1000,
+        duration=CAPTURE_DURATION,
+        keep=CAPTURE_KEEP,
+        cooldown=CAPTURE_COOLDOWN,
+        top=CAPTURE_TOP
+    )
+
+    def on_alert_event(event):
+        """Alert vừa firing -> bắt đầu capture; id được gắn vào sự kiện để tin nhắn alert trỏ tới nó"""
+        if event['status'] != 'firing':
+            return
+        label = f" {event['label']}" if event['label'] else ""
+        capture_id = burst_capture.trigger('alert', f"{event['rule']}{label} = {event['value']}")
+        if capture_id is not None:
+            event['capture'] = capture_id
+
+    alert_engine.add_listener(on_alert_event)
+
+# Theo dõi /dev/kmsg (OOM kill, hung task), khởi động trong main()
+kernel_log_watcher = None
+
+def restore_history_from_spill():
+    """Nạp lại history từ các snapshot còn nằm trong spill (dữ liệu lúc InfluxDB down trước khi restart)"""
+    if history_store is None or not influx_writer or influx_writer.spill is None:
+        return
+    restored = 0
+    for block in influx_writer.spill.snapshot_blocks():
         try:
-            usage = psutil.disk_usage(partition.mountpoint)
-            disk_total += usage.total
-            disk_used += usage.used
-            disk_free += usage.free
-        except (PermissionError, OSError):
-            continue
+            restored += history_store.record_block(block)
+        except ValueError as e:
+            print(f"⚠️  Skipping unreadable spill segment: {e}")
+    if restored:
+        print(f"♻️  Restored {restored} snapshots into history from spill")
+
+# Hàng đợi gửi Telegram, khởi tạo cùng bot trong start_telegram_bot
+notification_dispatcher = None
+
+def get_snapshot():
+    """Lấy snapshot metrics mới nhất từ cache (chỉ thu thập lại khi cache quá cũ)"""
+    return sampler.get_snapshot()
+
+async def get_snapshot_async():
+    """Lấy snapshot trong coroutine, không chặn event loop khi cần thu thập lại"""
+    snapshot = snapshot_cache.get_fresh()
+    if snapshot is None:
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, sampler.get_snapshot)
+    return snapshot
+
+async def get_versioned_snapshot_async():
+    """Như get_snapshot_async nhưng kèm version (khoá cho các cache encode)"""
+    version, snapshot, age = snapshot_cache.get()
+    if snapshot is None or age > snapshot_cache.max_age:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, sampler.get_versioned_snapshot)
+    return version, snapshot
+
+def rate_point(measurement, hostname, timestamp, tag, name, stats):
+    """Tạo Point cho một NIC/device, bỏ các trường chưa có giá trị (chu kỳ đầu tiên)"""
+    point = Point(measurement).tag("host", hostname).tag(tag, name)
+    for field, value in stats.items():
+        if value is not None:
+            point.field(field, value)
+    return point.time(timestamp, WritePrecision.NS)
+
+def build_influx_points(metrics, resolution=None):
+    """Chuyển một snapshot thành danh sách Point cho InfluxDB (resolution: tag chu kỳ export khi bật adaptive sampling)"""
+    points = []
+    hostname = metrics['system']['hostname']
+    timestamp = datetime.fromisoformat(metrics['timestamp'])
     
-    # Disk IO
-    disk_io = psutil.disk_io_counters()
+    # CPU metrics
+    point = Point("cpu") \
+        .tag("host", hostname) \
+        .field("physical_cores", metrics['cpu']['physical_cores']) \
+        .field("logical_cores", metrics['cpu']['logical_cores']) \
+        .field("usage_percent", metrics['cpu']['usage_percent']) \
+        .field("load_1min", metrics['cpu']['load_1min'] or 0) \
+        .field("load_5min", metrics['cpu']['load_5min'] or 0) \
+        .field("load_15min", metrics['cpu']['load_15min'] or 0) \
+        .time(timestamp, WritePrecision.NS)
+    for mode, percent in metrics['cpu']['modes_percent'].items():
+        point.field(f"{mode}_percent", percent)
+    points.append(point)
     
-    # Network metrics
-    net_io = psutil.net_io_counters()
+    # CPU per-core metrics
+    points.extend([
+        Point("cpu_core")
+            .tag("host", hostname)
+            .tag("core", str(i))
+            .field("usage_percent", percent)
+            .time(timestamp, WritePrecision.NS)
+        for i, percent in enumerate(metrics['cpu']['per_core_percent'])
+    ])
     
-    # System info
-    boot_time = datetime.fromtimestamp(psutil.boot_time())
+    # Memory metrics
+    point = Point("memory") \
+        .tag("host", hostname) \
+        .field("total_gb", metrics['memory']['total_gb']) \
+        .field("used_gb", metrics['memory']['used_gb']) \
+        .field("available_gb", metrics['memory']['available_gb']) \
+        .field("usage_percent", metrics['memory']['usage_percent']) \
+        .time(timestamp, WritePrecision.NS)
+    points.append(point)
     
-    # GPU info
-    gpu_info = get_gpu_info()
+    # Disk metrics
+    point = Point("disk") \
+        .tag("host", hostname) \
+        .field("total_gb", metrics['disk']['total_gb']) \
+        .field("used_gb", metrics['disk']['used_gb']) \
+        .field("free_gb", metrics['disk']['free_gb']) \
+        .field("usage_percent", metrics['disk']['usage_percent']) \
+        .field("read_mb_per_sec", metrics['disk']['read_mb_per_sec']) \
+        .field("write_mb_per_sec", metrics['disk']['write_mb_per_sec']) \
+        .field("read_iops", metrics['disk']['read_iops']) \
+        .field("write_iops", metrics['disk']['write_iops']) \
+        .time(timestamp, WritePrecision.NS)
+    points.append(point)
     
-    metrics = {
-        "timestamp": datetime.now().isoformat(),
-        "system": {
-            "hostname": "Ubuntu-Server",
-            "platform": platform.system(),
-            "os_version": platform.release(),
-            "uptime_hours": round((datetime.now() - boot_time).total_seconds() / 3600, 2)
-        },
-        "cpu": {
-            "physical_cores": psutil.cpu_count(logical=False),
-            "logical_cores": psutil.cpu_count(logical=True),
-            "usage_percent": round(cpu_percent, 2),
-            "load_1min": round(load_avg[0], 2) if load_avg[0] is not None else None,
-            "load_5min": round(load_avg[1], 2) if load_avg[1] is not None else None,
-            "load_15min": round(load_avg[2], 2) if load_avg[2] is not None else None
-        },
-        "memory": {
-            "total_gb": round(memory.total / (1024**3), 2),
-            "used_gb": round(memory.used / (1024**3), 2),
-            "available_gb": round(memory.available / (1024**3), 2),
-            "usage_percent": round(memory.percent, 2)
-        },
-        "disk": {
-            "total_gb": round(disk_total / (1024**3), 2),
-            "used_gb": round(disk_used / (1024**3), 2),
-            "free_gb": round(disk_free / (1024**3), 2),
-            "usage_percent": round((disk_used / disk_total * 100), 2) if disk_total > 0 else 0
-        },
-        "network": {
-            "sent_gb": round(net_io.bytes_sent / (1024**3), 2),
-            "recv_gb": round(net_io.bytes_recv / (1024**3), 2),
-            "sent_mb_per_sec": round((net_io.bytes_sent / (1024**2)) / ((datetime.now() - boot_time).total_seconds()), 2),
-            "recv_mb_per_sec": round((net_io.bytes_recv / (1024**2)) / ((datetime.now() - boot_time).total_seconds()), 2),
-            "packets_sent": net_io.packets_sent,
-            "packets_recv": net_io.packets_recv,
-            "errors": net_io.errin + net_io.errout,
-            "drops": net_io.dropin + net_io.dropout
-        },
-        "gpu": gpu_info
-    }
+    # Disk usage per-mount metrics
+    for mountpoint, usage in metrics['disk'].get('mounts', {}).items():
+        points.append(Point("disk_mount")
+            .tag("host", hostname)
+            .tag("mountpoint", mountpoint)
+            .tag("device", usage['device'])
+            .tag("fstype", usage['fstype'])
+            .field("total_bytes", usage['total_bytes'])
+            .field("used_bytes", usage['used_bytes'])
+            .field("free_bytes", usage['free_bytes'])
+            .field("usage_percent", float(usage['usage_percent']))
+            .field("inodes_used", usage['inodes_used'])
+            .field("inodes_free", usage['inodes_free'])
+            .field("inodes_usage_percent", float(usage['inodes_usage_percent']))
+            .time(timestamp, WritePrecision.NS))
     
-    return metrics
-
-def send_to_influxdb(metrics):
-    """Gửi metrics đến InfluxDB"""
-    if not write_api:
-        return False
+    # Disk IO per-device metrics
+    points.extend([
+        rate_point("disk_io", hostname, timestamp, "device", device, stats)
+        for device, stats in metrics['disk']['io'].items()
+    ])
     
-    try:
-        hostname = metrics['system']['hostname']
-        timestamp = datetime.fromisoformat(metrics['timestamp'])
-        
-        # CPU metrics
-        point = Point("cpu") \
-            .tag("host", hostname) \
-            .field("physical_cores", metrics['cpu']['physical_cores']) \
-            .field("logical_cores", metrics['cpu']['logical_cores']) \
-            .field("usage_percent", metrics['cpu']['usage_percent']) \
-            .field("load_1min", metrics['cpu']['load_1min'] or 0) \
-            .field("load_5min", metrics['cpu']['load_5min'] or 0) \
-            .field("load_15min", metrics['cpu']['load_15min'] or 0) \
-            .time(timestamp, WritePrecision.NS)
-        write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
-        
-        # Memory metrics
-        point = Point("memory") \
-            .tag("host", hostname) \
-            .field("total_gb", metrics['memory']['total_gb']) \
-            .field("used_gb", metrics['memory']['used_gb']) \
-            .field("available_gb", metrics['memory']['available_gb']) \
-            .field("usage_percent", metrics['memory']['usage_percent']) \
-            .time(timestamp, WritePrecision.NS)
-        write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
-        
-        # Disk metrics
-        point = Point("disk") \
+    # Network metrics
+    point = Point("network") \
+        .tag("host", hostname) \
+        .field("sent_gb", metrics['network']['sent_gb']) \
+        .field("recv_gb", metrics['network']['recv_gb']) \
+        .field("sent_mb_per_sec", metrics['network']['sent_mb_per_sec']) \
+        .field("recv_mb_per_sec", metrics['network']['recv_mb_per_sec']) \
+        .field("packets_sent", metrics['network']['packets_sent']) \
+        .field("packets_recv", metrics['network']['packets_recv']) \
+        .field("errors", metrics['network']['errors']) \
+        .field("packets_sent_per_sec", metrics['network']['packets_sent_per_sec']) \
+        .field("packets_recv_per_sec", metrics['network']['packets_recv_per_sec']) \
+        .field("drops", metrics['network']['drops']) \
+        .time(timestamp, WritePrecision.NS)
+    points.append(point)
+    
+    # Network per-interface metrics
+    points.extend([
+        rate_point("network_interface", hostname, timestamp, "interface", nic, stats)
+        for nic, stats in metrics['network']['interfaces'].items()
+    ])
+    
+    # GPU metrics (mỗi GPU một point, kèm process đang dùng GPU)
+    for gpu in metrics.get('gpus') or ([metrics['gpu']] if metrics['gpu'] else []):
+        point = Point("gpu") \
             .tag("host", hostname) \
-            .field("total_gb", metrics['disk']['total_gb']) \
-            .field("used_gb", metrics['disk']['used_gb']) \
-            .field("free_gb", metrics['disk']['free_gb']) \
-            .field("usage_percent", metrics['disk']['usage_percent']) \
+            .tag("gpu_index", str(gpu['index'])) \
+            .tag("gpu_name", gpu['name']) \
+            .field("temperature_c", gpu['temperature_c'] or 0) \
+            .field("usage_percent", gpu['usage_percent'] or 0) \
+            .field("memory_total_gb", gpu['memory']['total_gb']) \
+            .field("memory_used_gb", gpu['memory']['used_gb']) \
+            .field("memory_free_gb", gpu['memory']['free_gb']) \
+            .field("memory_free_gb_custom", gpu['memory']['free_gb_custom']) \
+            .field("memory_usage_percent", gpu['memory']['usage_percent']) \
+            .field("power_draw_w", gpu['power_draw_w'] or 0) \
+            .field("power_limit_w", gpu['power_limit_w'] or 0) \
+            .field("fan_speed_percent", gpu['fan_speed_percent'] or 0) \
             .time(timestamp, WritePrecision.NS)
-        write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
+        for clock, mhz in (gpu.get('clocks') or {}).items():
+            if mhz is not None:
+                point.field(f"clock_{clock}", mhz)
+        for kind, count in (gpu.get('ecc_errors') or {}).items():
+            if count is not None:
+                point.field(f"ecc_{kind}_errors", count)
+        if 'throttle_reasons' in gpu:
+            point.field("throttle_reasons", ','.join(gpu['throttle_reasons']))
+        points.append(point)
         
-        # Network metrics
-        point = Point("network") \
+        for proc in gpu.get('processes') or []:
+            points.append(Point("gpu_process")
+                .tag("host", hostname)
+                .tag("gpu_index", str(gpu['index']))
+                .tag("pid", str(proc['pid']))
+                .field("used_memory_mb", float(proc['used_memory_mb']))
+                .time(timestamp, WritePrecision.NS))
+    
+    # System uptime
+    point = Point("system") \
+        .tag("host", hostname) \
+        .field("uptime_hours", metrics['system']['uptime_hours']) \
+        .time(timestamp, WritePrecision.NS)
+    points.append(point)
+    
+    # Mỗi resource PSI một point (tag "resource"): avg của kernel, total và % stall trong chu kỳ
+    for resource, stats in (metrics.get('pressure') or {}).items():
+        point = Point("pressure") \
             .tag("host", hostname) \
-            .field("sent_gb", metrics['network']['sent_gb']) \
-            .field("recv_gb", metrics['network']['recv_gb']) \
-            .field("sent_mb_per_sec", metrics['network']['sent_mb_per_sec']) \
-            .field("recv_mb_per_sec", metrics['network']['recv_mb_per_sec']) \
-            .field("packets_sent", metrics['network']['packets_sent']) \
-            .field("packets_recv", metrics['network']['packets_recv']) \
-            .field("errors", metrics['network']['errors']) \
-            .field("drops", metrics['network']['drops']) \
+            .tag("resource", resource) \
             .time(timestamp, WritePrecision.NS)
-        write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
-        
-        # GPU metrics
-        if metrics['gpu']:
-            gpu = metrics['gpu']
-            point = Point("gpu") \
-                .tag("host", hostname) \
-                .tag("gpu_index", str(gpu['index'])) \
-                .tag("gpu_name", gpu['name']) \
-                .field("temperature_c", gpu['temperature_c'] or 0) \
-                .field("usage_percent", gpu['usage_percent'] or 0) \
-                .field("memory_total_gb", gpu['memory']['total_gb']) \
-                .field("memory_used_gb", gpu['memory']['used_gb']) \
-                .field("memory_free_gb", gpu['memory']['free_gb']) \
-                .field("memory_free_gb_custom", gpu['memory']['free_gb_custom']) \
-                .field("memory_usage_percent", gpu['memory']['usage_percent']) \
-                .field("power_draw_w", gpu['power_draw_w'] or 0) \
-                .field("power_limit_w", gpu['power_limit_w'] or 0) \
-                .field("fan_speed_percent", gpu['fan_speed_percent'] or 0) \
-                .time(timestamp, WritePrecision.NS)
-            write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
-        
-        # System uptime
-        point = Point("system") \
+        for field, value in stats.items():
+            if value is not None:
+                point.field(field, value)
+        points.append(point)
+    
+    # Mỗi cgroup một point, tag theo đường dẫn, tên hiển thị và loại (container/service/slice/...)
+    for path, stats in ((metrics.get('cgroups') or {}).get('groups') or {}).items():
+        point = Point("cgroup") \
             .tag("host", hostname) \
-            .field("uptime_hours", metrics['system']['uptime_hours']) \
+            .tag("cgroup", path) \
+            .tag("name", stats['name']) \
+            .tag("kind", stats['kind']) \
             .time(timestamp, WritePrecision.NS)
-        write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=point)
-        
-        print(f"✅ Metrics sent to InfluxDB at {timestamp}")
+        for field, value in stats.items():
+            if field not in ('name', 'kind') and value is not None:
+                point.field(field, value)
+        points.append(point)
+    
+    # Chi phí của chính agent: một point tổng và một point cho mỗi stage (tag "stage")
+    agent = metrics.get('agent')
+    if agent:
+        point = Point("agent").tag("host", hostname).time(timestamp, WritePrecision.NS)
+        for field, value in agent.items():
+            if field != 'stages' and value is not None:
+                point.field(field, value)
+        points.append(point)
+        points.extend([
+            rate_point("agent", hostname, timestamp, "stage", stage, stats)
+            for stage, stats in agent['stages'].items()
+        ])
+    
+    # Chu kỳ export thay đổi theo adaptive sampling -> query downstream (rate, sum theo thời gian) cần biết độ phân giải
+    if resolution:
+        for point in points:
+            point.tag("resolution", resolution)
+    
+    return points
+
+def influx_resolution(metrics):
+    """Tag resolution khi bật adaptive sampling: chu kỳ export ứng với chu kỳ lấy mẫu lúc chụp snapshot"""
+    if adaptive_interval is None:
+        return None
+    interval = (metrics.get('agent') or {}).get('sample_interval_seconds') or adaptive_interval.interval
+    return f"{export_interval(interval):g}s"
+
+def send_to_influxdb(metrics):
+    """Đưa metrics vào hàng đợi ghi batch của InfluxDB"""
+    if not influx_writer:
+        return False
+    
+    try:
+        with self_stats.timer('influx.build'):
+            points = build_influx_points(metrics, influx_resolution(metrics))
+            influx_writer.enqueue([point.to_line_protocol() for point in points], snapshot=metrics)
         return True
-        
     except Exception as e:
-        print(f"❌ Failed to send metrics to InfluxDB: {e}")
+        print(f"❌ Failed to queue metrics for InfluxDB: {e}")
         return False
 
-def scheduled_collect():
-    """Hàm chạy định kỳ để thu thập và gửi metrics"""
-    metrics = collect_metrics()
+async def scheduled_collect():
+    """Job định kỳ: đưa snapshot mới nhất vào hàng đợi ghi InfluxDB"""
+    metrics = await get_snapshot_async()
     send_to_influxdb(metrics)
 
-@app.route('/metrics', methods=['GET'])
-def get_metrics():
-    """API endpoint để lấy metrics hiện tại"""
-    metrics = collect_metrics()
-    return jsonify(metrics)
+async def flush_metrics_store():
+    """Job định kỳ: msync kho lịch sử trên đĩa (giới hạn dữ liệu mất nếu máy mất điện)"""
+    await asyncio.get_running_loop().run_in_executor(None, metrics_store.flush)
+
+def retune_jobs(scheduler, interval):
+    """Export InfluxDB co giãn cùng chu kỳ lấy mẫu; job gửi alert chỉ được rút ngắn, không chậm hơn ALERT_CHECK_INTERVAL"""
+    if scheduler.get_job('influx_export'):
+        scheduler.reschedule_job('influx_export', trigger='interval', seconds=export_interval(interval))
+    if scheduler.get_job('alert_check'):
+        scheduler.reschedule_job('alert_check', trigger='interval', seconds=min(ALERT_CHECK_INTERVAL, interval))
+
+# Response encode một lần mỗi version snapshot (và mỗi kiểu nén) trên thread pool riêng
+responses = ResponseFactory(
+    ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix="http-encode"),
+    json_encoder=JSON_ENCODER,
+    encodings=HTTP_ENCODINGS
+)
+metrics_payload = VersionedPayload(responses.encode_json)
+openmetrics_payload = VersionedPayload(lambda metrics: encode_openmetrics(metrics).encode('utf-8'))
+
+# Live stream: mỗi snapshot mới được đẩy tới mọi subscriber SSE/WebSocket
+stream_hub = StreamHub(responses.encode_json, max_subscribers=STREAM_MAX_SUBSCRIBERS)
+sampler.add_listener(stream_hub.publish_threadsafe)
+
+# Chế độ aggregator: poll /metrics của cả fleet qua một connection pool dùng chung
+fleet_poller = None
+if AGENT_MODE == 'aggregator':
+    if FLEET_TARGETS:
+        fleet_poller = FleetPoller(FLEET_TARGETS, interval=FLEET_POLL_INTERVAL, timeout=FLEET_TIMEOUT,
+                                   concurrency=FLEET_CONCURRENCY)
+    else:
+        print("⚠️  AGENT_MODE=aggregator but FLEET_TARGETS is empty - running as a standalone agent")
+
+@routes.get('/metrics')
+async def get_metrics(request):
+    """API endpoint để lấy metrics hiện tại (304 nếu If-None-Match khớp version snapshot)"""
+    version, metrics = await get_versioned_snapshot_async()
+    return await responses.versioned(request, version, metrics, metrics_payload, 'application/json')
+
+@routes.get('/metrics/openmetrics')
+async def get_openmetrics(request):
+    """API endpoint cho Prometheus scrape (OpenMetrics text, nén nếu client hỗ trợ)"""
+    version, metrics = await get_versioned_snapshot_async()
+    return await responses.versioned(request, version, metrics, openmetrics_payload, OPENMETRICS_CONTENT_TYPE)
+
+def open_subscription(params):
+    """Tạo subscriber từ tham số client, trả về (subscriber, lỗi)"""
+    try:
+        fields, interval, changes = parse_subscription(params)
+    except ValueError as e:
+        return None, (str(e), 400)
+    subscriber = stream_hub.subscribe(fields, interval, changes)
+    if subscriber is None:
+        return None, (f"too many stream subscribers (max {STREAM_MAX_SUBSCRIBERS})", 503)
+    # Gửi ngay snapshot hiện tại để client không phải chờ tick tiếp theo
+    version, metrics, _ = snapshot_cache.get()
+    if metrics is not None:
+        subscriber.offer(version, metrics)
+    return subscriber, None
+
+@routes.get('/metrics/stream')
+async def stream_metrics(request):
+    """Server-Sent Events: ?fields=cpu,memory.usage_percent&interval=2s&changes=1"""
+    subscriber, error = open_subscription(request.query)
+    if error:
+        return await responses.json(request, {"error": error[0]}, status=error[1])
+    
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                           'X-Accel-Buffering': 'no'})
+    try:
+        await response.prepare(request)
+        while not subscriber.closed:
+            frame = await subscriber.next(timeout=STREAM_HEARTBEAT)
+            if frame is None:
+                if not subscriber.closed:
+                    await response.write(b': keep-alive\n\n')
+                continue
+            body = stream_hub.encode(subscriber, frame)
+            await response.write(b'id: %d\nevent: %s\ndata: %s\n\n' % (frame['version'], frame['type'].encode(), body))
+            if subscriber.min_interval:
+                await asyncio.sleep(subscriber.min_interval)
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        stream_hub.unsubscribe(subscriber)
+    return response
+
+@routes.get('/metrics/ws')
+async def stream_metrics_ws(request):
+    """WebSocket: như /metrics/stream; client gửi JSON {"fields", "interval", "changes"} để đổi subscription"""
+    subscriber, error = open_subscription(request.query)
+    if error:
+        return await responses.json(request, {"error": error[0]}, status=error[1])
+    
+    ws = web.WebSocketResponse(heartbeat=STREAM_HEARTBEAT)
+    await ws.prepare(request)
+    
+    async def read_commands():
+        async for message in ws:
+            if message.type != web.WSMsgType.TEXT:
+                continue
+            try:
+                subscriber.update(*parse_subscription(json.loads(message.data)))
+                version, metrics, _ = snapshot_cache.get()
+                if metrics is not None:
+                    subscriber.offer(version, metrics)
+            except (ValueError, TypeError, AttributeError) as e:
+                await ws.send_str(json.dumps({"type": "error", "error": str(e)}))
+        subscriber.close()
+    
+    reader = asyncio.create_task(read_commands())
+    try:
+        while not subscriber.closed:
+            frame = await subscriber.next()
+            if frame is None:
+                continue
+            await ws.send_str(stream_hub.encode(subscriber, frame).decode('utf-8'))
+            if subscriber.min_interval:
+                await asyncio.sleep(subscriber.min_interval)
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        reader.cancel()
+        stream_hub.unsubscribe(subscriber)
+        await ws.close()
+    return ws
+
+@routes.get('/metrics/compact')
+async def stream_metrics_compact(request):
+    """Stream nhị phân định dạng gọn (codec.py): schema một lần mỗi kết nối, sau đó keyframe/delta"""
+    subscriber, error = open_subscription(request.query)
+    if error:
+        return await responses.json(request, {"error": error[0]}, status=error[1])
+    # Định dạng gọn tự delta so với frame trước nên luôn lấy snapshot đầy đủ
+    subscriber.changes_only = False
+    encoder = codec.SnapshotEncoder(keyframe_interval=COMPACT_KEYFRAME_INTERVAL)
+    
+    response = web.StreamResponse(headers={'Content-Type': codec.CONTENT_TYPE, 'Cache-Control': 'no-cache'})
+    loop = asyncio.get_running_loop()
+    try:
+        await response.prepare(request)
+        await response.write(codec.MAGIC)
+        while not subscriber.closed:
+            frame = await subscriber.next(timeout=STREAM_HEARTBEAT)
+            if frame is None:
+                if not subscriber.closed:
+                    # Message rỗng (độ dài 0) làm keep-alive
+                    await response.write(b'\0\0\0\0')
+                continue
+            data = {**frame['data'], 'timestamp': frame['timestamp']}
+            await response.write(await loop.run_in_executor(responses.executor, encoder.encode_framed, data))
+            if subscriber.min_interval:
+                await asyncio.sleep(subscriber.min_interval)
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        stream_hub.unsubscribe(subscriber)
+    return response
+
+HISTORY_SOURCES = ('auto', 'memory', 'disk')
 
-@app.route('/send', methods=['POST'])
-def send_metrics():
+@routes.get('/metrics/history')
+async def get_metrics_history(request):
+    """API endpoint lịch sử: ?metric=&since=&step=&source= (RAM cho khoảng gần, kho trên đĩa cho khoảng dài)"""
+    if history_store is None and metrics_store is None:
+        return await responses.json(request, {"error": "history is disabled (HISTORY_RETENTION=0, METRICS_STORE_ENABLED=false)"}, status=404)
+    
+    metric = request.query.get('metric')
+    if not metric:
+        # Không có metric -> liệt kê các series đang lưu
+        names = set(history_store.series()) if history_store else set()
+        names.update(metrics_store.series() if metrics_store else ())
+        return await responses.json(request, {
+            **(history_store.stats() if history_store else {}),
+            "store": metrics_store.stats() if metrics_store else None,
+            "metrics": sorted(names)
+        })
+    
+    now = time.time()
+    source = request.query.get('source', 'auto')
+    try:
+        since = parse_since(request.query.get('since', '1h'), now)
+        step = parse_duration(request.query['step']) if request.query.get('step') else None
+    except ValueError as e:
+        return await responses.json(request, {"error": str(e)}, status=400)
+    if step is not None and step <= 0:
+        return await responses.json(request, {"error": "step must be positive"}, status=400)
+    if source not in HISTORY_SOURCES:
+        return await responses.json(request, {"error": f"source must be one of: {', '.join(HISTORY_SOURCES)}"}, status=400)
+    
+    backend = history_backend(since, source)
+    if backend is None:
+        return await responses.json(request, {"error": f"history source '{source}' is disabled"}, status=404)
+    keys = backend.match(metric)
+    if not keys:
+        return await responses.json(request, {"error": f"unknown metric '{metric}'"}, status=404)
+    
+    def query():
+        # Kho trên đĩa giải mã thẳng trên mmap; chạy trong executor để truy vấn dài không chặn event loop
+        return {key: backend.query(key, since, now, step) for key in keys}
+    
+    series = await asyncio.get_running_loop().run_in_executor(None, query)
+    return await responses.json(request, {
+        "metric": metric,
+        "since": since,
+        "until": now,
+        "step": step,
+        "source": "memory" if backend is history_store else "disk",
+        "resolution": backend.interval if backend is history_store else backend.tier_for(since, step, now).step,
+        "columns": ["timestamp", *HISTORY_AGGREGATES] if step else ["timestamp", "value"],
+        "series": series
+    })
+
+def get_process_table():
+    """Danh sách process mới nhất; lần đầu (chưa có mẫu) thì lấy mẫu ngay"""
+    if process_table.sampled_at is None:
+        process_table.sample()
+    return process_table.processes
+
+@routes.get('/processes')
+async def get_processes(request):
+    """API endpoint top N process theo cpu/mem/rss/io/files từ bảng process mới nhất"""
+    sort = request.query.get('sort', 'cpu')
+    if sort not in PROCESS_SORT_KEYS:
+        return await responses.json(request, {"error": f"sort must be one of: {', '.join(PROCESS_SORT_KEYS)}"}, status=400)
+    try:
+        limit = min(max(int(request.query.get('limit', 10)), 1), PROCESS_TOP_LIMIT)
+    except ValueError:
+        return await responses.json(request, {"error": "limit must be an integer"}, status=400)
+    
+    processes = await asyncio.get_running_loop().run_in_executor(None, get_process_table)
+    return await responses.json(request, {
+        "sort": sort,
+        **process_table.stats(),
+        "processes": process_groups(process_table.top(limit, sort, processes))
+    })
+
+@routes.get('/captures')
+async def list_captures(request):
+    """Các burst capture còn giữ (mới nhất trước) kèm tóm tắt"""
+    if not burst_capture:
+        return await responses.json(request, {"error": "burst capture is disabled"}, status=404)
+    summaries = [capture.summary(CAPTURE_TOP) for capture in burst_capture.list()]
+    return await responses.json(request, {**burst_capture.stats(), "captures": summaries})
+
+@routes.post('/captures')
+async def start_capture(request):
+    """Bắt đầu một capture thủ công (vẫn tuân theo cooldown)"""
+    if not burst_capture:
+        return await responses.json(request, {"error": "burst capture is disabled"}, status=404)
+    capture_id = burst_capture.trigger('manual', request.query.get('reason', 'HTTP request'))
+    if capture_id is None:
+        return await responses.json(request, {"error": "a capture is running or in cooldown"}, status=429)
+    return await responses.json(request, {"id": capture_id, "url": f"/captures/{capture_id}"}, status=202)
+
+@routes.get('/captures/{id}')
+async def get_capture(request):
+    """Toàn bộ một capture: offsets, từng cột theo thời gian và các lần chụp bảng process"""
+    capture = None
+    if burst_capture and request.match_info['id'].isdigit():
+        capture = burst_capture.get(int(request.match_info['id']))
+    if capture is None:
+        return await responses.json(request, {"error": "capture not found"}, status=404)
+    return await responses.json(request, capture.to_dict())
+
+@routes.get('/fleet')
+async def get_fleet(request):
+    """Fleet view (chế độ aggregator): trạng thái từng host và percentile trên các host đang up"""
+    if fleet_poller is None:
+        return await responses.json(request, {"error": "fleet view requires AGENT_MODE=aggregator and FLEET_TARGETS"}, status=404)
+    return await responses.json(request, fleet_poller.view())
+
+@routes.get('/fleet/top')
+async def get_fleet_top(request):
+    """Top process trên toàn fleet, hỏi /processes của các agent song song"""
+    if fleet_poller is None:
+        return await responses.json(request, {"error": "fleet view requires AGENT_MODE=aggregator and FLEET_TARGETS"}, status=404)
+    sort = request.query.get('sort', 'cpu')
+    if sort not in PROCESS_SORT_KEYS:
+        return await responses.json(request, {"error": f"sort must be one of: {', '.join(PROCESS_SORT_KEYS)}"}, status=400)
+    try:
+        limit = min(max(int(request.query.get('limit', 10)), 1), PROCESS_TOP_LIMIT)
+    except ValueError:
+        return await responses.json(request, {"error": "limit must be an integer"}, status=400)
+    return await responses.json(request, {"sort": sort, "processes": await fleet_poller.top_processes(sort, limit)})
+
+@routes.post('/send')
+async def send_metrics(request):
     """API endpoint để gửi metrics lên InfluxDB ngay lập tức"""
-    metrics = collect_metrics()
-    success = send_to_influxdb(metrics)
-    return jsonify({
+    metrics = await get_snapshot_async()
+    success = send_to_influxdb(metrics) and await asyncio.get_running_loop().run_in_executor(None, influx_writer.flush, 30)
+    return await responses.json(request, {
         "success": success,
         "message": "Metrics sent to InfluxDB" if success else "Failed to send metrics"
     })
 
-@app.route('/health', methods=['GET'])
-def health_check():
+def check_influxdb():
+    """Gọi health của InfluxDB (chặn, chạy trong executor)"""
+    if not influxdb_client:
+        return "not configured"
+    try:
+        influxdb_client.health()
+        return "connected"
+    except Exception:
+        return "disconnected"
+
+@routes.get('/health')
+async def health_check(request):
     """Kiểm tra trạng thái kết nối InfluxDB"""
-    influxdb_status = "connected" if influxdb_client else "not configured"
-    if influxdb_client:
-        try:
-            influxdb_client.health()
-            influxdb_status = "connected"
-        except:
-            influxdb_status = "disconnected"
+    influxdb_status = await asyncio.get_running_loop().run_in_executor(None, check_influxdb)
+    
+    version, _, age = snapshot_cache.get()
+    writer_status = None
+    if influx_writer:
+        writer_status = {
+            "pending_points": influx_writer.pending,
+            "written_points": influx_writer.written_points,
+            "write_requests": influx_writer.write_requests,
+            "spilled_segments": len(influx_writer.spill) if influx_writer.spill else 0,
+            "corrupt_segments": influx_writer.spill.corrupt_segments if influx_writer.spill else 0,
+            "dropped_points": influx_writer.dropped_points + (influx_writer.spill.dropped_lines if influx_writer.spill else 0)
+        }
     
-    return jsonify({
+    return await responses.json(request, {
         "status": "healthy",
         "influxdb": influxdb_status,
-        "collection_interval": COLLECTION_INTERVAL
+        "influxdb_writer": writer_status,
+        "collection_interval": COLLECTION_INTERVAL,
+        "sampler": {
+            "interval": sampler.interval,
+            "snapshot_version": version,
+            "snapshot_age_seconds": round(age, 2) if age is not None else None,
+            "max_age_seconds": snapshot_cache.max_age
+        },
+        "collectors": collector_registry.stats(),
+        "history": history_store.stats() if history_store else None,
+        "metrics_store": metrics_store.stats() if metrics_store else None,
+        "alerts": {**alert_engine.stats(), "active": alert_engine.active()},
+        "pressure_triggers": pressure_triggers.stats() if pressure_triggers else None,
+        "captures": {**burst_capture.stats(), "kernel_log": kernel_log_watcher.stats() if kernel_log_watcher else None} if burst_capture else None,
+        "adaptive_sampling": adaptive_interval.stats() if adaptive_interval else None,
+        "notifications": notification_dispatcher.stats() if notification_dispatcher else None,
+        "http": responses.stats(metrics=metrics_payload, openmetrics=openmetrics_payload),
+        "stream": stream_hub.stats(),
+        "fleet": fleet_poller.stats() if fleet_poller else None,
+        "agent": self_stats.stats()
     })
 
 # ============= TELEGRAM BOT COMMANDS =============
@@ -406,6 +1228,7 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📊 *Thông tin tổng quan:*
 /info - Thông tin hệ thống tổng quát
 /status - Trạng thái hệ thống
+/status all - Trạng thái cả fleet (chế độ aggregator)
 
 💻 *Thông tin chi tiết:*
 /cpu - Thông tin CPU
@@ -413,7 +1236,9 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /disk - Thông tin ổ cứng
 /gpu - Thông tin GPU (nếu có)
 /network - Thông tin mạng
-/top - Các process đang chạy (top 10)
+/top [cpu|mem|io|files] [local] - Top 10 processes (cả fleet ở chế độ aggregator)
+/containers [cpu|mem|io] [all] - Container / service systemd nặng nhất (cgroup v2)
+/history <metric> [1h|1d|7d|30d|1y] - Lịch sử min/avg/max của một metric (RAM hoặc kho trên đĩa)
 
 🆔 *Thông tin bot:*
 /userid - Xem User ID của bạn
@@ -429,7 +1254,7 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    metrics = collect_metrics()
+    metrics = await get_snapshot_async()
     sys = metrics['system']
     cpu = metrics['cpu']
     mem = metrics['memory']
@@ -438,7 +1263,7 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     info_text = f"""🖥️ *THÔNG TIN HỆ THỐNG*
 
 *Hệ điều hành:*
-• Hostname: `Ubuntu-Server`
+• Hostname: `{sys['hostname']}`
 • Platform: {sys['platform']} {sys['os_version']}
 • Uptime: {sys['uptime_hours']} giờ
 
@@ -458,10 +1283,9 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Free: {disk['free_gb']} GB
 """
     
-    if metrics['gpu']:
-        gpu = metrics['gpu']
+    for gpu in metrics['gpus']:
         info_text += f"""
-*GPU:*
+*GPU {gpu['index']}:*
 • Name: {gpu['name']}
 • Memory: {gpu['memory']['used_gb']}/{gpu['memory']['total_gb']} GB ({gpu['memory']['usage_percent']}%)
 • Temp: {gpu['temperature_c']}°C
@@ -469,13 +1293,63 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(info_text, parse_mode='Markdown')
 
+# Số host tối đa liệt kê trong /status all để message không vượt giới hạn 4096 ký tự của Telegram
+FLEET_STATUS_ROWS = 30
+
+def format_fleet_status(view):
+    """Một message cho cả fleet: percentile từng chỉ số, các host nặng nhất và các host mất kết nối"""
+    def fmt(value):
+        return f"{value:.1f}" if value is not None else '-'
+    
+    total = len(view['hosts'])
+    text = f"🌐 *FLEET STATUS* - {view['up']}/{total} up"
+    if view['stale']:
+        text += f", {view['stale']} stale"
+    if view['down']:
+        text += f", {view['down']} down"
+    text += "\n\n"
+    
+    labels = (('cpu_percent', 'CPU %'), ('memory_percent', 'RAM %'), ('max_mount_percent', 'Disk % (mount đầy nhất)'),
+              ('load_1min', 'Load 1m'), ('gpu_memory_percent', 'GPU mem %'))
+    for field, label in labels:
+        stats = view['summary'].get(field)
+        if stats:
+            text += f"*{label}:* p50 {fmt(stats['p50'])} · p90 {fmt(stats['p90'])} · p99 {fmt(stats['p99'])} · max {fmt(stats['max'])}\n"
+    
+    up = sorted((row for row in view['hosts'] if row['status'] != 'down'),
+                key=lambda row: row['cpu_percent'] or 0, reverse=True)
+    if up:
+        text += "\n```\n"
+        text += f"{'HOST':<18} {'CPU%':>6} {'RAM%':>6} {'DISK%':>6}\n"
+        for row in up[:FLEET_STATUS_ROWS]:
+            mark = '*' if row['status'] == 'stale' else ''
+            text += f"{(row['host'] + mark)[:18]:<18} {fmt(row['cpu_percent']):>6} {fmt(row['memory_percent']):>6} {fmt(row['max_mount_percent']):>6}\n"
+        text += "```"
+        if len(up) > FLEET_STATUS_ROWS:
+            text += f"\n_… và {len(up) - FLEET_STATUS_ROWS} host khác_"
+    
+    down = [row for row in view['hosts'] if row['status'] == 'down']
+    if down:
+        text += "\n\n⚠️ *Mất kết nối:*\n```\n"
+        for row in down[:FLEET_STATUS_ROWS]:
+            text += f"{row['host'][:30]}: {(row['error'] or 'no data')[:40]}\n"
+        text += "```"
+    return text
+
 async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Hiển thị trạng thái hệ thống"""
+    """Hiển thị trạng thái hệ thống (/status all: cả fleet ở chế độ aggregator)"""
     if not check_authorization(update.effective_user.id):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    metrics = collect_metrics()
+    if context.args and context.args[0].lower() == 'all':
+        if fleet_poller is None:
+            await update.message.reply_text("❌ /status all cần AGENT_MODE=aggregator và FLEET_TARGETS")
+            return
+        await update.message.reply_text(format_fleet_status(fleet_poller.view()), parse_mode='Markdown')
+        return
+    
+    metrics = await get_snapshot_async()
     
     # Tạo thanh progress bar
     def make_bar(percent, length=10):
@@ -509,12 +1383,19 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Errors: {net['errors']}
 """
     
+    # Pressure stall: % thời gian bị chặn vì thiếu tài nguyên (avg10 của kernel)
+    pressure = metrics.get('pressure')
+    if pressure:
+        status_text += "\n⏳ *Pressure (avg10 some/full):*\n"
+        for resource, stats in pressure.items():
+            full = f"{stats['full_avg10']}%" if 'full_avg10' in stats else "-"
+            status_text += f"• {resource}: {stats['some_avg10']}% / {full}\n"
+    
     # GPU Memory (không hiện GPU Compute nữa)
-    if metrics['gpu']:
-        gpu = metrics['gpu']
+    for gpu in metrics['gpus']:
         gpu_mem_bar = make_bar(gpu['memory']['usage_percent'])
         status_text += f"""
-🎮 *GPU Memory:* {gpu['memory']['usage_percent']}%
+🎮 *GPU {gpu['index']} Memory:* {gpu['memory']['usage_percent']}%
 {gpu_mem_bar}
 {gpu['memory']['used_gb']}/{gpu['memory']['total_gb']} GB
 """
@@ -527,12 +1408,13 @@ async def cmd_cpu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    metrics = collect_metrics()
+    metrics = await get_snapshot_async()
     cpu = metrics['cpu']
     
-    # Lấy thông tin per-core
-    per_core = psutil.cpu_percent(interval=1, percpu=True)
-    core_info = '\n'.join([f"Core {i}: {percent}%" for i, percent in enumerate(per_core)])
+    # Per-core và per-mode lấy từ cùng snapshot, không sleep trong event loop
+    core_info = '\n'.join([f"Core {i}: {percent}%" for i, percent in enumerate(cpu['per_core_percent'])])
+    modes = cpu['modes_percent']
+    mode_info = '\n'.join([f"• {mode}: {modes[mode]}%" for mode in ('user', 'system', 'iowait', 'steal', 'irq', 'softirq') if mode in modes])
     
     cpu_text = f"""
 💻 **THÔNG TIN CPU**
@@ -547,6 +1429,9 @@ async def cmd_cpu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • 5 min: {cpu['load_5min']}
 • 15 min: {cpu['load_15min']}
 
+**Usage per Mode:**
+{mode_info}
+
 **Usage per Core:**
 {core_info}
 """
@@ -559,7 +1444,7 @@ async def cmd_ram(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    metrics = collect_metrics()
+    metrics = await get_snapshot_async()
     mem = metrics['memory']
     
     # Lấy thêm thông tin swap
@@ -589,7 +1474,7 @@ async def cmd_disk(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    metrics = collect_metrics()
+    metrics = await get_snapshot_async()
     disk = metrics['disk']
     
     disk_text = f"""💿 *THÔNG TIN Ổ CỨNG*
@@ -598,8 +1483,28 @@ async def cmd_disk(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Used: {disk['used_gb']} GB
 • Free: {disk['free_gb']} GB
 • Usage: {disk['usage_percent']}%
+
+*Inodes:* {disk.get('inodes_usage_percent', 0)}%
+"""
+    
+    for mountpoint, usage in sorted(disk.get('mounts', {}).items()):
+        disk_text += f"• `{mountpoint}`: {usage['usage_percent']}% ({round(usage['used_bytes'] / (1024**3), 1)}/{round(usage['total_bytes'] / (1024**3), 1)} GB), inodes {usage['inodes_usage_percent']}%\n"
+    if disk.get('quarantined'):
+        disk_text += f"⚠️ Mount không phản hồi (tạm bỏ qua): {', '.join(disk['quarantined'])}\n"
+    
+    disk_text += f"""
+*Disk I/O:*
+• Read: {disk['read_mb_per_sec']} MB/s ({disk['read_iops']} IOPS)
+• Write: {disk['write_mb_per_sec']} MB/s ({disk['write_iops']} IOPS)
 """
     
+    for device, io in disk['io'].items():
+        # Từng bộ đếm có thể chưa có tốc độ (device mới, chưa đủ 2 mẫu, hoặc bộ đếm vừa bị reset)
+        iops = [value for value in (io.get('read_iops'), io.get('write_iops')) if value is not None]
+        if not iops:
+            continue
+        disk_text += f"• {device}: {round(sum(iops), 2)} IOPS, await {io['await_ms']} ms, util {io['util_percent']}%\n"
+    
     await update.message.reply_text(disk_text, parse_mode='Markdown')
 
 async def cmd_gpu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -608,22 +1513,25 @@ async def cmd_gpu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    gpu_info = get_gpu_info()
+    metrics = await get_snapshot_async()
+    gpus = metrics['gpus']
     
-    if not gpu_info:
-        await update.message.reply_text("❌ Không tìm thấy GPU hoặc nvidia-smi không khả dụng")
+    if not gpus:
+        await update.message.reply_text("❌ Không tìm thấy GPU hoặc NVML/nvidia-smi không khả dụng")
         return
     
-    gpu = gpu_info
-    gpu_text = f"""
-🎮 **THÔNG TIN GPU**
-
+    gpu_text = "🎮 **THÔNG TIN GPU**\n"
+    for gpu in gpus:
+        clocks = gpu.get('clocks') or {}
+        ecc = gpu.get('ecc_errors') or {}
+        gpu_text += f"""
 **GPU:** {gpu['name']} (Index: {gpu['index']})
 
 **Compute Usage:**
 • GPU Utilization: {gpu['usage_percent']}%
 • Temperature: {gpu['temperature_c']}°C
 • Fan Speed: {gpu['fan_speed_percent']}%
+• Clocks: {clocks.get('graphics_mhz')} / {clocks.get('memory_mhz')} MHz (core/mem)
 
 **Memory Usage:**
 • Total: {gpu['memory']['total_gb']} GB
@@ -635,6 +1543,13 @@ async def cmd_gpu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Power Draw: {gpu['power_draw_w']} W
 • Power Limit: {gpu['power_limit_w']} W
 """
+        if ecc:
+            gpu_text += f"• ECC errors: {ecc.get('corrected')} corrected / {ecc.get('uncorrected')} uncorrected\n"
+        throttles = [reason for reason in gpu.get('throttle_reasons', []) if reason != 'gpu_idle']
+        if throttles:
+            gpu_text += f"• Throttle: {', '.join(throttles)}\n"
+        for proc in (gpu.get('processes') or [])[:5]:
+            gpu_text += f"• PID {proc['pid']}: {proc['used_memory_mb']} MB\n"
     
     await update.message.reply_text(gpu_text, parse_mode='Markdown')
 
@@ -644,7 +1559,7 @@ async def cmd_network(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    metrics = collect_metrics()
+    metrics = await get_snapshot_async()
     net = metrics['network']
     
     # Lấy thông tin network interfaces
@@ -667,12 +1582,15 @@ async def cmd_network(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             if ipv4:
                 interfaces_info.append(f"• {iface_name}: {ipv4} - Speed: {stats.speed} Mbps")
+                rates = net['interfaces'].get(iface_name)
+                if rates and rates['sent_bytes_per_sec'] is not None:
+                    interfaces_info.append(f"  ↑ {round(rates['sent_bytes_per_sec'] / 1024, 1)} KB/s ↓ {round(rates['recv_bytes_per_sec'] / 1024, 1)} KB/s")
     
     net_text = f"""🌐 *THÔNG TIN MẠNG*
 
 *Tổng quan:*
-• Sent: {net['sent_gb']} GB
-• Received: {net['recv_gb']} GB
+• Sent: {net['sent_gb']} GB ({net['sent_mb_per_sec']} MB/s)
+• Received: {net['recv_gb']} GB ({net['recv_mb_per_sec']} MB/s)
 • Packets Sent: {net['packets_sent']}
 • Packets Recv: {net['packets_recv']}
 • Errors: {net['errors']}
@@ -690,44 +1608,154 @@ async def cmd_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
         return
     
-    # Gửi message đang xử lý
-    processing_msg = await update.message.reply_text("⏳ Đang thu thập thông tin processes...")
+    # /top [cpu|mem|io|files] [local] - mặc định sắp theo CPU; aggregator gộp cả fleet trừ khi có 'local'
+    args = [arg.lower() for arg in context.args or []]
+    local = 'local' in args
+    args = [arg for arg in args if arg != 'local']
+    sort = args[0] if args else 'cpu'
+    if sort not in PROCESS_SORT_KEYS:
+        await update.message.reply_text(f"❌ Tiêu chí không hợp lệ. Dùng: /top [{'|'.join(PROCESS_SORT_KEYS)}] [local]")
+        return
     
-    # Lấy danh sách processes với CPU usage đúng (cần interval)
-    cpu_count = psutil.cpu_count()
-    processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'memory_percent']):
-        try:
-            # Lấy CPU percent với interval để có số liệu chính xác
-            cpu_percent = proc.cpu_percent(interval=0.1)
-            # Normalize CPU về 100% (chia cho số cores)
-            cpu_normalized = cpu_percent / cpu_count if cpu_count else cpu_percent
-            pinfo = proc.info
-            processes.append({
-                'pid': pinfo['pid'],
-                'name': pinfo['name'][:20],  # Giới hạn độ dài tên
-                'cpu': cpu_normalized,
-                'mem': pinfo['memory_percent'] or 0
-            })
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            continue
+    if fleet_poller is not None and not local:
+        top_10 = await fleet_poller.top_processes(sort, 10)
+        top_text = f"⚡ *TOP 10 PROCESSES TOÀN FLEET ({sort.upper()})*\n\n```\n"
+        top_text += f"{'HOST':<14} {'PID':<8} {'NAME':<16} {'CPU%':<6} {'MEM%':<6}\n"
+        top_text += "-" * 54 + "\n"
+        for p in top_10:
+            top_text += f"{p['host'][:14]:<14} {p['pid']:<8} {p['name'][:16]:<16} {p['cpu_percent']:<6.1f} {p['memory_percent']:<6.1f}\n"
+        top_text += "```\n"
+        top_text += f"_{fleet_poller.stats()['up']} host đang up_"
+        await update.message.reply_text(top_text, parse_mode='Markdown')
+        return
     
-    # Sort by CPU usage, sau đó by Memory nếu CPU bằng nhau
-    processes.sort(key=lambda x: (x['cpu'], x['mem']), reverse=True)
-    top_10 = processes[:10]
+    # Đọc bảng process mới nhất do sampler nền thu thập, không quét lại từng process
+    if process_table.sampled_at is None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, get_process_table)
+    top_10 = process_groups(process_table.top(10, sort))
+    age = time.time() - process_table.sampled_at
     
-    top_text = "⚡ *TOP 10 PROCESSES (CPU)*\n\n"
+    top_text = f"⚡ *TOP 10 PROCESSES ({sort.upper()})*\n\n"
+    top_text += "```\n"
+    if sort in ('io', 'files'):
+        extra = 'IO KB/s' if sort == 'io' else 'FILES'
+        top_text += f"{'PID':<8} {'NAME':<16} {'CPU%':<6} {extra:<8}\n"
+        top_text += "-" * 42 + "\n"
+        for p in top_10:
+            value = (p['io_bytes_per_sec'] or 0) / 1024 if sort == 'io' else (p['open_files'] or 0)
+            top_text += f"{p['pid']:<8} {p['name'][:16]:<16} {p['cpu_percent']:<6.1f} {value:<8.0f}\n"
+    elif cgroup_monitor is not None:
+        # Thêm cột container/unit systemd chứa process
+        top_text += f"{'PID':<8} {'NAME':<16} {'CPU%':<6} {'MEM%':<6} {'UNIT':<16}\n"
+        top_text += "-" * 56 + "\n"
+        for p in top_10:
+            top_text += f"{p['pid']:<8} {p['name'][:16]:<16} {p['cpu_percent']:<6.1f} {p['memory_percent']:<6.1f} {(p['cgroup'] or '-')[:16]:<16}\n"
+    else:
+        top_text += f"{'PID':<8} {'NAME':<20} {'CPU%':<8} {'MEM%':<8}\n"
+        top_text += "-" * 50 + "\n"
+        for p in top_10:
+            top_text += f"{p['pid']:<8} {p['name'][:20]:<20} {p['cpu_percent']:<8.1f} {p['memory_percent']:<8.1f}\n"
     top_text += "```\n"
-    top_text += f"{'PID':<8} {'NAME':<20} {'CPU%':<8} {'MEM%':<8}\n"
-    top_text += "-" * 50 + "\n"
-    for p in top_10:
-        top_text += f"{p['pid']:<8} {p['name']:<20} {p['cpu']:<8.1f} {p['mem']:<8.1f}\n"
-    top_text += "```"
-    
-    # Xóa message đang xử lý và gửi kết quả
-    await processing_msg.delete()
+    top_text += f"_{len(process_table.processes)} processes, cập nhật {age:.0f}s trước_"
+    
     await update.message.reply_text(top_text, parse_mode='Markdown')
 
+async def cmd_containers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Hiển thị container / service systemd dùng nhiều tài nguyên nhất (cgroup v2)"""
+    if not check_authorization(update.effective_user.id):
+        await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
+        return
+    
+    if cgroup_monitor is None:
+        await update.message.reply_text("❌ Không có cgroup v2 trên máy này")
+        return
+    
+    # /containers [cpu|mem|io] [all] - mặc định chỉ container và service, 'all' gồm cả slice/scope
+    args = [arg.lower() for arg in context.args or []]
+    show_all = 'all' in args
+    args = [arg for arg in args if arg != 'all']
+    sort = args[0] if args else 'cpu'
+    sort_keys = {
+        'cpu': lambda g: g['cpu_percent'] or 0,
+        'mem': lambda g: g['memory_bytes'] or 0,
+        'io': lambda g: (g['io_read_bytes_per_sec'] or 0) + (g['io_write_bytes_per_sec'] or 0)
+    }
+    if sort not in sort_keys:
+        await update.message.reply_text(f"❌ Tiêu chí không hợp lệ. Dùng: /containers [{'|'.join(sort_keys)}] [all]")
+        return
+    
+    metrics = await get_snapshot_async()
+    cgroups = metrics.get('cgroups') or {}
+    kinds = CGROUP_KINDS if show_all else ('container', 'service')
+    groups = [g for g in (cgroups.get('groups') or {}).values() if g['kind'] in kinds]
+    groups.sort(key=sort_keys[sort], reverse=True)
+    
+    text = f"📦 *TOP CONTAINERS / SERVICES ({sort.upper()})*\n\n```\n"
+    if sort == 'io':
+        text += f"{'NAME':<24} {'READ KB/s':<10} {'WRITE KB/s':<10}\n"
+        text += "-" * 46 + "\n"
+        for g in groups[:15]:
+            text += f"{g['name'][:24]:<24} {(g['io_read_bytes_per_sec'] or 0) / 1024:<10.0f} {(g['io_write_bytes_per_sec'] or 0) / 1024:<10.0f}\n"
+    else:
+        text += f"{'NAME':<24} {'CPU%':<7} {'MEM MB':<8} {'PIDS':<5}\n"
+        text += "-" * 46 + "\n"
+        for g in groups[:15]:
+            text += f"{g['name'][:24]:<24} {g['cpu_percent'] or 0:<7.1f} {(g['memory_bytes'] or 0) / (1024**2):<8.0f} {g['pids'] or 0:<5}\n"
+    text += "```\n"
+    text += f"_{len(groups)}/{cgroups.get('count', 0)} cgroup, duyệt lại cây {cgroups.get('rescans', 0)} lần ({cgroups.get('watch')})_"
+    
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+HISTORY_BOT_ROWS = 12
+
+async def cmd_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Hiển thị lịch sử một metric theo HISTORY_BOT_ROWS bucket (RAM cho khoảng gần, kho trên đĩa cho khoảng dài)"""
+    if not check_authorization(update.effective_user.id):
+        await update.message.reply_text("⛔ Bạn không có quyền sử dụng bot này!")
+        return
+    
+    if history_store is None and metrics_store is None:
+        await update.message.reply_text("❌ Lịch sử đang tắt (HISTORY_RETENTION=0, METRICS_STORE_ENABLED=false)")
+        return
+    
+    # /history <metric> [khoảng thời gian] - mặc định 1 ngày
+    args = context.args or []
+    if not args:
+        await update.message.reply_text("❌ Dùng: /history <metric> [1h|1d|7d|30d|1y]\nVí dụ: `/history cpu_usage_percent 7d`", parse_mode='Markdown')
+        return
+    try:
+        span = parse_duration(args[1] if len(args) > 1 else '1d')
+    except ValueError:
+        await update.message.reply_text("❌ Khoảng thời gian không hợp lệ. Ví dụ: 1h, 1d, 7d, 30d, 1y")
+        return
+    
+    now = time.time()
+    since = now - span
+    step = max(1, int(span // HISTORY_BOT_ROWS))
+    backend = history_backend(since)
+    keys = backend.match(args[0])[:4]
+    if not keys:
+        await update.message.reply_text(f"❌ Không có metric `{args[0]}`", parse_mode='Markdown')
+        return
+    series = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: {key: backend.query(key, since, now, step) for key in keys})
+    
+    time_format = '%m-%d %H:%M' if span > 86400 else '%H:%M'
+    source = "RAM" if backend is history_store else "disk"
+    text = f"📈 *HISTORY* `{args[0]}` ({args[1] if len(args) > 1 else '1d'}, {source})\n"
+    for key, rows in series.items():
+        text += f"\n`{key}`\n```\n"
+        text += f"{'TIME':<11} {'MIN':>9} {'AVG':>9} {'MAX':>9}\n"
+        text += "-" * 41 + "\n"
+        for t, low, high, avg, _ in rows[-HISTORY_BOT_ROWS:]:
+            text += f"{datetime.fromtimestamp(t).strftime(time_format):<11} {low:>9.4g} {avg:>9.4g} {high:>9.4g}\n"
+        if not rows:
+            text += "(no data)\n"
+        text += "```"
+    
+    await update.message.reply_text(text, parse_mode='Markdown')
+
 async def cmd_userid(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Hiển thị User ID của người dùng"""
     user = update.effective_user
@@ -787,75 +1815,146 @@ async def cmd_author(update: Update, context: ContextTypes.DEFAULT_TYPE):
 """
     await update.message.reply_text(author_text, parse_mode='Markdown')
 
+ALERT_ICONS = {"critical": "🔴", "warning": "🟠", "info": "🟡"}
+
+def format_alert_event(event):
+    """Một dòng cảnh báo cho sự kiện firing/repeat/resolved của alert engine"""
+    label = f" `{event['label']}`" if event['label'] else ""
+    if event['status'] == 'resolved':
+        return f"✅ *RESOLVED: {event['summary']}*{label}\nValue: {event['value']} (Clear: {event['threshold']:g})"
+    icon = ALERT_ICONS.get(event['severity'], "⚠️")
+    duration = int(event['timestamp'] - event['since'])
+    text = f"{icon} *{event['summary']}*{label}\nValue: {event['value']} (Threshold: {event['threshold']:g})\n`{event['condition']}`"
+    if event['status'] == 'repeat':
+        text += f"\nStill firing for {duration // 60}m {duration % 60}s"
+    if event.get('capture') is not None:
+        text += f"\n📸 Burst capture #{event['capture']} running (`/captures/{event['capture']}`)"
+    return text
+
+# Cột hiển thị trong tóm tắt capture: (field, nhãn, hàm định dạng)
+CAPTURE_SUMMARY_FIELDS = (
+    ('cpu_percent', 'CPU', lambda v: f"{v:.1f}%"),
+    ('iowait_percent', 'IOwait', lambda v: f"{v:.1f}%"),
+    ('memory_percent', 'RAM', lambda v: f"{v:.1f}%"),
+    ('swap_percent', 'Swap', lambda v: f"{v:.1f}%"),
+    ('disk_read_bytes_per_sec', 'Disk R', lambda v: f"{v / 1024**2:.1f}M/s"),
+    ('disk_write_bytes_per_sec', 'Disk W', lambda v: f"{v / 1024**2:.1f}M/s"),
+    ('net_recv_bytes_per_sec', 'Net RX', lambda v: f"{v / 1024**2:.1f}M/s"),
+    ('net_sent_bytes_per_sec', 'Net TX', lambda v: f"{v / 1024**2:.1f}M/s"),
+    ('memory_stall_percent', 'Mem stall', lambda v: f"{v:.1f}%"),
+    ('io_stall_percent', 'IO stall', lambda v: f"{v:.1f}%")
+)
+
+def format_capture_summary(summary):
+    """Tóm tắt gọn của một burst capture: avg/max từng cột và các process dùng CPU nhiều nhất"""
+    text = (f"📸 *Burst capture #{summary['id']}* ({summary['trigger']})\n`{summary['detail']}`\n"
+            f"{summary['samples']} samples @ {summary['interval_ms']}ms over {summary['duration_seconds']:g}s\n\n")
+    text += "```\n"
+    text += f"{'METRIC':<10} {'AVG':>9} {'MAX':>9} {'AT':>6}\n"
+    for field, label, fmt in CAPTURE_SUMMARY_FIELDS:
+        stats = summary['fields'].get(field)
+        if stats is None:
+            continue
+        text += f"{label:<10} {fmt(stats['avg']):>9} {fmt(stats['max']):>9} {stats['peak_at']:>5.1f}s\n"
+    if summary['top_processes']:
+        text += f"\n{'PID':>7} {'NAME':<16} {'CPU%':>6} {'RSS':>8}\n"
+        for p in summary['top_processes']:
+            text += f"{p['pid']:>7} {p['name'][:16]:<16} {p['max_cpu_percent']:>6.1f} {p['max_rss_bytes'] / 1024**2:>7.0f}M\n"
+    text += "```\n"
+    text += f"Full capture: `/captures/{summary['id']}`"
+    return text
+
+def on_capture_done(capture):
+    """Capture xong (thread capture): gửi tóm tắt tới chat nhận alert"""
+    if not TELEGRAM_ALERT_CHAT_ID or notification_dispatcher is None:
+        return
+    text = format_capture_summary(capture.summary(CAPTURE_TOP))
+    text += f"\n🖥️ Host: `{AGENT_HOSTNAME}`"
+    notification_dispatcher.submit_threadsafe(TELEGRAM_ALERT_CHAT_ID, text)
+
+def on_kernel_event(kind, message):
+    """Dòng OOM kill / hung task / lockup trong /dev/kmsg (thread kmsg-watcher)"""
+    print(f"🔔 Kernel event ({kind}): {message}")
+    capture_id = burst_capture.trigger(kind, message[:200])
+    if capture_id is None:
+        return
+    if TELEGRAM_ALERT_CHAT_ID and notification_dispatcher is not None:
+        text = (f"🔴 *KERNEL EVENT: {kind}*\n`{message[:300]}`\n"
+                f"📸 Burst capture #{capture_id} running (`/captures/{capture_id}`)\n🖥️ Host: `{AGENT_HOSTNAME}`")
+        notification_dispatcher.submit_threadsafe(TELEGRAM_ALERT_CHAT_ID, text, coalesce_key='alert')
+
 async def check_and_send_alerts(application):
-    """Kiểm tra ngưỡng và gửi cảnh báo"""
+    """Gửi các sự kiện alert mà engine đã phát hiện kể từ lần kiểm tra trước"""
     if not TELEGRAM_ALERT_CHAT_ID:
         return
     
     try:
-        import time
-        current_time = time.time()
-        metrics = collect_metrics()
-        alerts = []
-        
-        # Kiểm tra CPU
-        cpu_usage = metrics['cpu']['usage_percent']
-        if cpu_usage >= ALERT_CPU_THRESHOLD:
-            if current_time - last_alert_time['cpu'] >= ALERT_COOLDOWN:
-                alerts.append(f"🔴 *CPU WARNING*\nUsage: {cpu_usage}% (Threshold: {ALERT_CPU_THRESHOLD}%)")
-                last_alert_time['cpu'] = current_time
-        
-        # Kiểm tra RAM
-        ram_usage = metrics['memory']['usage_percent']
-        if ram_usage >= ALERT_RAM_THRESHOLD:
-            if current_time - last_alert_time['ram'] >= ALERT_COOLDOWN:
-                alerts.append(f"🟠 *RAM WARNING*\nUsage: {ram_usage}% (Threshold: {ALERT_RAM_THRESHOLD}%)\n{metrics['memory']['used_gb']}/{metrics['memory']['total_gb']} GB")
-                last_alert_time['ram'] = current_time
+        events = alert_engine.drain()
+        if not events:
+            return
         
-        # Kiểm tra Disk
-        disk_usage = metrics['disk']['usage_percent']
-        if disk_usage >= ALERT_DISK_THRESHOLD:
-            if current_time - last_alert_time['disk'] >= ALERT_COOLDOWN:
-                alerts.append(f"🟡 *DISK WARNING*\nUsage: {disk_usage}% (Threshold: {ALERT_DISK_THRESHOLD}%)\n{metrics['disk']['used_gb']}/{metrics['disk']['total_gb']} GB")
-                last_alert_time['disk'] = current_time
-        
-        # Kiểm tra GPU
-        if metrics['gpu']:
-            gpu_usage = metrics['gpu']['memory']['usage_percent']
-            if gpu_usage >= ALERT_GPU_THRESHOLD:
-                if current_time - last_alert_time['gpu'] >= ALERT_COOLDOWN:
-                    alerts.append(f"🟣 *GPU MEMORY WARNING*\nUsage: {gpu_usage}% (Threshold: {ALERT_GPU_THRESHOLD}%)\n{metrics['gpu']['memory']['used_gb']}/{metrics['gpu']['memory']['total_gb']} GB\nGPU: {metrics['gpu']['name']}")
-                    last_alert_time['gpu'] = current_time
+        metrics = await get_snapshot_async()
+        alerts = [format_alert_event(event) for event in events]
         
         # Gửi tất cả alerts
-        if alerts:
-            alert_text = "⚠️ *SYSTEM ALERT*\n\n" + "\n\n".join(alerts)
-            alert_text += f"\n\n🕐 Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            alert_text += f"\n🖥️ Host: `{metrics['system']['hostname']}`"
-            
-            # Gửi cho tất cả chat IDs
-            for chat_id in TELEGRAM_ALERT_CHAT_ID:
-                try:
-                    await application.bot.send_message(
-                        chat_id=chat_id,
-                        text=alert_text,
-                        parse_mode='Markdown'
-                    )
-                except Exception as e:
-                    print(f"❌ Failed to send alert to {chat_id}: {e}")
-            
-            print(f"⚠️  Alert sent to {len(TELEGRAM_ALERT_CHAT_ID)} chat(s): {len(alerts)} warning(s)")
+        alert_text = "⚠️ *SYSTEM ALERT*\n\n" + "\n\n".join(alerts)
+        alert_text += f"\n\n🕐 Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        alert_text += f"\n🖥️ Host: `{metrics['system']['hostname']}`"
+        
+        # Đưa vào hàng đợi gửi: các alert gần nhau được gộp thành một message cho mỗi chat
+        notification_dispatcher.submit(TELEGRAM_ALERT_CHAT_ID, alert_text, coalesce_key='alert')
+        print(f"⚠️  Alert queued for {len(TELEGRAM_ALERT_CHAT_ID)} chat(s): {len(alerts)} event(s)")
             
     except Exception as e:
         print(f"❌ Failed to check/send alerts: {e}")
 
+async def pressure_wakeup(application, resource, kind):
+    """Kernel báo stall vượt ngưỡng: lấy mẫu pressure ngay rồi gửi alert, không chờ sampler hay ALERT_CHECK_INTERVAL"""
+    print(f"🔔 PSI trigger fired: {resource} {kind}")
+    def refresh():
+        collector_registry.wake('pressure', 'cgroups')
+        sampler.refresh()
+    # Cả wake() lẫn refresh() có thể chờ collector khác -> chạy ngoài event loop
+    await asyncio.get_running_loop().run_in_executor(None, refresh)
+    if application:
+        await check_and_send_alerts(application)
+
+def start_pressure_triggers(loop, application):
+    """Đăng ký các trigger PSI_TRIGGERS; thread poll của trigger đánh thức event loop qua call_soon_threadsafe"""
+    try:
+        specs = parse_triggers(PSI_TRIGGERS)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return None
+    triggers = PressureTriggers()
+    for resource, kind, stall, window in specs:
+        try:
+            triggers.add(resource, kind, stall, window)
+        except OSError as e:
+            print(f"⚠️  PSI trigger {resource} {kind} {stall // 1000}ms/{window // 1000}ms rejected: {e}")
+    if not len(triggers):
+        triggers.close()
+        return None
+    
+    pending = set()
+    def schedule(resource, kind):
+        # Lần đánh thức trước chưa xong thì bỏ qua, mẫu đang lấy đã phản ánh stall này
+        if not pending:
+            task = loop.create_task(pressure_wakeup(application, resource, kind))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    
+    triggers.start(lambda resource, kind: loop.call_soon_threadsafe(schedule, resource, kind))
+    print(f"🔔 PSI triggers armed: {', '.join(triggers.stats()['armed'])}")
+    return triggers
+
 async def send_auto_status(application):
     """Gửi status tự động đến chat đã cấu hình"""
     if not TELEGRAM_AUTO_SEND_CHAT_ID:
         return
     
     try:
-        metrics = collect_metrics()
+        metrics = await get_snapshot_async()
         
         def make_bar(percent, length=10):
             filled = int(percent / 100 * length)
@@ -886,61 +1985,75 @@ async def send_auto_status(application):
 • Recv: {net['recv_gb']} GB
 """
         
-        if metrics['gpu']:
-            gpu = metrics['gpu']
+        for gpu in metrics['gpus']:
             gpu_mem_bar = make_bar(gpu['memory']['usage_percent'])
             status_text += f"""
-🎮 *GPU Memory:* {gpu['memory']['usage_percent']}%
+🎮 *GPU {gpu['index']} Memory:* {gpu['memory']['usage_percent']}%
 {gpu_mem_bar}
 {gpu['memory']['used_gb']}/{gpu['memory']['total_gb']} GB
 """
         
-        # Gửi cho tất cả chat IDs
-        for chat_id in TELEGRAM_AUTO_SEND_CHAT_ID:
-            try:
-                await application.bot.send_message(
-                    chat_id=chat_id,
-                    text=status_text,
-                    parse_mode='Markdown'
-                )
-            except Exception as e:
-                print(f"❌ Failed to send auto-status to {chat_id}: {e}")
-        
-        print(f"✅ Auto-status sent to {len(TELEGRAM_AUTO_SEND_CHAT_ID)} chat(s)")
+        # Gửi song song cho tất cả chat IDs qua hàng đợi có giới hạn tốc độ
+        notification_dispatcher.submit(TELEGRAM_AUTO_SEND_CHAT_ID, status_text)
+        print(f"✅ Auto-status queued for {len(TELEGRAM_AUTO_SEND_CHAT_ID)} chat(s)")
     except Exception as e:
         print(f"❌ Failed to send auto-status: {e}")
 
-async def start_telegram_bot():
-    """Khởi động Telegram Bot"""
+def bot_command(name, func):
+    """CommandHandler có đo thời gian xử lý lệnh"""
+    return CommandHandler(name, self_stats.timed(f"bot.{name}")(func))
+
+async def start_telegram_bot(scheduler):
+    """Khởi động Telegram Bot trong event loop chung, trả về application (None nếu không chạy được)"""
     if not TELEGRAM_BOT_TOKEN:
         print("⚠️  Telegram Bot not configured - TELEGRAM_BOT_TOKEN not found")
-        return
+        return None
     
     # Tạo application với retry và timeout config
     from telegram.request import HTTPXRequest
     request = HTTPXRequest(
-        connection_pool_size=8,
+        connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE,
         read_timeout=30.0,
         write_timeout=30.0,
         connect_timeout=30.0,
         pool_timeout=30.0,
     )
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).request(request).build()
-    
-    # Đăng ký handlers
-    application.add_handler(CommandHandler("help", cmd_help))
-    application.add_handler(CommandHandler("start", cmd_help))
-    application.add_handler(CommandHandler("info", cmd_info))
-    application.add_handler(CommandHandler("status", cmd_status))
-    application.add_handler(CommandHandler("cpu", cmd_cpu))
-    application.add_handler(CommandHandler("ram", cmd_ram))
-    application.add_handler(CommandHandler("disk", cmd_disk))
-    application.add_handler(CommandHandler("gpu", cmd_gpu))
-    application.add_handler(CommandHandler("network", cmd_network))
-    application.add_handler(CommandHandler("top", cmd_top))
-    application.add_handler(CommandHandler("userid", cmd_userid))
-    application.add_handler(CommandHandler("groupid", cmd_groupid))
-    application.add_handler(CommandHandler("author", cmd_author))
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN).request(request)
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    application = builder.build()
+    
+    # Hàng đợi gửi thông báo dùng chung connection pool của bot, chừa 2 connection cho lệnh người dùng
+    global notification_dispatcher
+    notification_dispatcher = NotificationDispatcher(
+        application.bot,
+        global_rate=TELEGRAM_GLOBAL_RATE,
+        chat_rate=TELEGRAM_CHAT_RATE,
+        chat_burst=TELEGRAM_CHAT_BURST,
+        coalesce_seconds=TELEGRAM_COALESCE_SECONDS,
+        max_queue=TELEGRAM_QUEUE_SIZE,
+        max_concurrency=max(1, TELEGRAM_CONNECTION_POOL_SIZE - 2),
+        observer=self_stats.observe
+    )
+    # Burst capture / kmsg watcher gửi từ thread riêng qua submit_threadsafe
+    notification_dispatcher.bind()
+    
+    # Đăng ký handlers (mỗi lệnh được đo thời gian như một stage 'bot.<lệnh>')
+    application.add_handler(bot_command("help", cmd_help))
+    application.add_handler(bot_command("start", cmd_help))
+    application.add_handler(bot_command("info", cmd_info))
+    application.add_handler(bot_command("status", cmd_status))
+    application.add_handler(bot_command("cpu", cmd_cpu))
+    application.add_handler(bot_command("ram", cmd_ram))
+    application.add_handler(bot_command("disk", cmd_disk))
+    application.add_handler(bot_command("gpu", cmd_gpu))
+    application.add_handler(bot_command("network", cmd_network))
+    application.add_handler(bot_command("top", cmd_top))
+    application.add_handler(bot_command("containers", cmd_containers))
+    application.add_handler(bot_command("history", cmd_history))
+    application.add_handler(bot_command("userid", cmd_userid))
+    application.add_handler(bot_command("groupid", cmd_groupid))
+    application.add_handler(bot_command("author", cmd_author))
     
     # Thiết lập Bot Commands Menu (nút bấm nhanh)
     from telegram import BotCommand
@@ -955,14 +2068,16 @@ async def start_telegram_bot():
         BotCommand("gpu", "Thông tin GPU"),
         BotCommand("network", "Thông tin mạng"),
         BotCommand("top", "Top processes"),
+        BotCommand("containers", "Tài nguyên container/service"),
+        BotCommand("history", "Lịch sử một metric"),
         BotCommand("userid", "Xem User ID"),
         BotCommand("groupid", "Xem Group ID"),
     ]
-    await application.bot.set_my_commands(commands)
     
     # Khởi tạo và chạy bot với drop_pending_updates=True
     try:
         await application.initialize()
+        await application.bot.set_my_commands(commands)
         await application.start()
         print(f"🤖 Telegram Bot started successfully")
         
@@ -970,10 +2085,7 @@ async def start_telegram_bot():
         bot_info = await application.bot.get_me()
         print(f"✅ Connected as @{bot_info.username}")
         
-        # Thêm job scheduler cho auto-send status và alerts
-        from apscheduler.schedulers.asyncio import AsyncIOScheduler
-        scheduler = AsyncIOScheduler()
-        
+        # Job auto-send status và alerts chạy trên scheduler chung của runtime
         if TELEGRAM_AUTO_SEND_CHAT_ID:
             scheduler.add_job(
                 send_auto_status,
@@ -988,69 +2100,184 @@ async def start_telegram_bot():
                 check_and_send_alerts,
                 'interval',
                 seconds=ALERT_CHECK_INTERVAL,
-                args=[application]
+                args=[application],
+                id='alert_check'
             )
-            print(f"⚠️  Alert monitoring enabled: checking every {ALERT_CHECK_INTERVAL}s")
+            print(f"⚠️  Alert monitoring enabled: rules evaluated on every sample, delivered every {ALERT_CHECK_INTERVAL}s")
             print(f"   Sending to {len(TELEGRAM_ALERT_CHAT_ID)} chat(s): {', '.join(TELEGRAM_ALERT_CHAT_ID)}")
-            print(f"   Thresholds - CPU: {ALERT_CPU_THRESHOLD}% | RAM: {ALERT_RAM_THRESHOLD}% | GPU: {ALERT_GPU_THRESHOLD}% | Disk: {ALERT_DISK_THRESHOLD}%")
-        
-        if TELEGRAM_AUTO_SEND_CHAT_ID or TELEGRAM_ALERT_CHAT_ID:
-            scheduler.start()
+            print(f"   Rules ({ALERT_RULES_FILE or 'defaults'}): {', '.join(rule.name for rule in alert_engine.rules)}")
         
-        # Bắt đầu polling với stop_signals=None để tránh lỗi signal trong thread
         await application.updater.start_polling(
             drop_pending_updates=True,
             allowed_updates=["message"],
             timeout=30,
             bootstrap_retries=5
         )
-        
-        # Giữ bot chạy
-        while True:
-            await asyncio.sleep(1)
-            
-    except asyncio.CancelledError:
-        print("🛑 Bot cancelled")
+        return application
     except Exception as e:
         print(f"❌ Telegram Bot error: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        try:
+        await stop_telegram_bot(application)
+        return None
+
+async def stop_telegram_bot(application):
+    """Gửi nốt thông báo đang chờ rồi dừng polling và bot"""
+    try:
+        await notification_dispatcher.stop(timeout=10)
+        if application.updater.running:
             await application.updater.stop()
+        if application.running:
             await application.stop()
-            await application.shutdown()
-        except:
-            pass
-
-def run_bot_in_thread():
-    """Chạy Telegram bot trong thread riêng"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(start_telegram_bot())
+        await application.shutdown()
     except Exception as e:
-        print(f"❌ Telegram Bot error: {e}")
+        print(f"⚠️  Telegram Bot shutdown error: {e}")
+
+# ============= RUNTIME =============
+
+@web.middleware
+async def timing_middleware(request, handler):
+    """Thời gian xử lý mỗi route; stream SSE/WebSocket kéo dài không được tính"""
+    resource = request.match_info.route.resource
+    stage = f"http.{resource.canonical if resource else 'unmatched'}"
+    started = time.perf_counter()
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        self_stats.observe(stage, time.perf_counter() - started, ok=e.status < 500)
+        raise
+    except Exception:
+        self_stats.observe(stage, time.perf_counter() - started, ok=False)
+        raise
+    if isinstance(response, web.Response):
+        self_stats.observe(stage, time.perf_counter() - started, ok=response.status < 500)
+    return response
+
+def create_app():
+    """aiohttp application phục vụ HTTP API"""
+    http_app = web.Application(middlewares=[timing_middleware])
+    http_app.add_routes(routes)
+    return http_app
+
+async def shutdown(runner, scheduler, application):
+    """Dừng theo thứ tự: HTTP -> job định kỳ -> bot (gửi nốt thông báo) -> sampler -> flush InfluxDB và kho lịch sử -> tài nguyên"""
+    loop = asyncio.get_running_loop()
+    # Đóng các stream trước để handler SSE/WebSocket kết thúc ngay
+    stream_hub.close()
+    await runner.cleanup()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    if application:
+        await stop_telegram_bot(application)
+    await sampler.stop()
+    await self_stats.stop_loop_monitor()
+    if fleet_poller:
+        await fleet_poller.stop()
+    if influx_writer:
+        # Flush mọi point đang chờ (hoặc spill ra đĩa nếu InfluxDB down)
+        await loop.run_in_executor(None, influx_writer.stop)
+        influxdb_client.close()
+    if metrics_store:
+        # Sampler đã dừng: không còn lần ghi nào, msync rồi unmap mọi segment
+        await loop.run_in_executor(None, metrics_store.close)
+    gpu_collector.close()
+    collector_registry.shutdown()
+    disk_usage_collector.shutdown()
+    if kernel_log_watcher:
+        kernel_log_watcher.close()
+    if burst_capture:
+        # Dừng capture đang chạy trước khi đóng các fd /proc mà nó đọc
+        burst_capture.close()
+    if proc_reader:
+        proc_reader.close()
+    if cgroup_monitor:
+        cgroup_monitor.close()
+    if pressure_triggers:
+        pressure_triggers.close()
+    if pressure_monitor:
+        pressure_monitor.close()
+
+async def main():
+    """Một event loop duy nhất sở hữu sampler, writer, alert, bot và HTTP API"""
+    loop = asyncio.get_running_loop()
+    # Mọi lời gọi chặn (psutil, InfluxDB health/flush) đi qua executor có giới hạn này
+    blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    loop.set_default_executor(blocking_executor)
+    
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: dùng KeyboardInterrupt
+    
+    await loop.run_in_executor(None, restore_history_from_spill)
+    
+    # Khởi động sampler nền trước để các consumer luôn có snapshot sẵn
+    stream_hub.bind(loop)
+    if burst_capture:
+        # Đăng ký trước khi sampler chạy: alert firing ngay ở mẫu đầu tiên cũng có tóm tắt
+        burst_capture.on_complete(on_capture_done)
+    sampler.start()
+    print(f"🔄 Sampler started - tick every {sampler.interval}s (max snapshot age {snapshot_cache.max_age}s)")
+    for collector in collector_registry:
+        if collector.enabled:
+            print(f"   • {collector.name}: every {collector.interval}s (timeout {collector.timeout}s, budget {collector.budget}s)")
+    if fleet_poller:
+        fleet_poller.start()
+        print(f"🌐 Aggregator mode: polling {len(FLEET_TARGETS)} agents every {FLEET_POLL_INTERVAL:g}s "
+              f"(timeout {FLEET_TIMEOUT:g}s, {FLEET_CONCURRENCY} concurrent)")
+    
+    # Một scheduler duy nhất cho mọi job định kỳ (InfluxDB, auto-status, alerts)
+    scheduler = AsyncIOScheduler(event_loop=loop)
+    self_stats.watch_scheduler(scheduler)
+    self_stats.start_loop_monitor()
+    if influx_writer:
+        influx_writer.start()
+        scheduler.add_job(scheduled_collect, 'interval', seconds=COLLECTION_INTERVAL, id='influx_export')
+        print(f"📊 InfluxDB export scheduled every {COLLECTION_INTERVAL} seconds")
+    if metrics_store:
+        scheduler.add_job(flush_metrics_store, 'interval', seconds=METRICS_STORE_FLUSH_INTERVAL, id='store_flush')
+    
+    application = await start_telegram_bot(scheduler) if TELEGRAM_BOT_TOKEN else None
+    scheduler.start()
+    
+    if adaptive_interval:
+        # Listener chạy trên thread của sampler; reschedule_job của APScheduler an toàn giữa các thread
+        adaptive_interval.on_change(lambda interval: retune_jobs(scheduler, interval))
+        retune_jobs(scheduler, adaptive_interval.interval)
+        print(f"🔄 Adaptive sampling: {adaptive_interval.ladder[0]:g}-{adaptive_interval.ladder[-1]:g}s, "
+              f"watching {len(adaptive_interval.watches)} alert metric(s)")
+    
+    global pressure_triggers
+    if PSI_TRIGGERS and pressure_monitor:
+        pressure_triggers = start_pressure_triggers(loop, application)
+    
+    global kernel_log_watcher
+    if burst_capture and CAPTURE_KMSG:
+        try:
+            kernel_log_watcher = KernelLogWatcher(on_kernel_event)
+            kernel_log_watcher.start()
+            print(f"📸 Burst capture armed: alerts + {kernel_log_watcher.path} "
+                  f"({CAPTURE_INTERVAL_MS}ms for {CAPTURE_DURATION:g}s, cooldown {CAPTURE_COOLDOWN:g}s)")
+        except OSError as e:
+            print(f"⚠️  Kernel log watcher disabled ({e}) - burst capture on alerts only")
+    
+    runner = web.AppRunner(create_app(), access_log=None, keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, HTTP_HOST, HTTP_PORT, backlog=HTTP_BACKLOG, reuse_address=True).start()
+        print(f"🌐 HTTP API listening on http://{HTTP_HOST}:{HTTP_PORT} ({HTTP_WORKERS} encode workers, {responses.json_encoder}, keep-alive {HTTP_KEEPALIVE_TIMEOUT:g}s)")
+        await stop_event.wait()
     finally:
-        loop.close()
+        print("\n🛑 Shutting down...")
+        await shutdown(runner, scheduler, application)
+        blocking_executor.shutdown(wait=False)
+        responses.executor.shutdown(wait=False)
+        print("👋 Server stopped")
 
 if __name__ == '__main__':
-    # Khởi động scheduler để gửi metrics định kỳ
-    if write_api:
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(func=scheduled_collect, trigger="interval", seconds=COLLECTION_INTERVAL)
-        scheduler.start()
-        print(f"📊 Scheduler started - collecting metrics every {COLLECTION_INTERVAL} seconds")
-    
-    # Khởi động Telegram Bot trong thread riêng
-    if TELEGRAM_BOT_TOKEN:
-        bot_thread = threading.Thread(target=run_bot_in_thread, daemon=True)
-        bot_thread.start()
-    
     try:
-        app.run(host='0.0.0.0', port=1232, debug=False)
-    except (KeyboardInterrupt, SystemExit):
-        if write_api:
-            scheduler.shutdown()
-            influxdb_client.close()
-        print("\n👋 Server stopped")
\ No newline at end of file
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
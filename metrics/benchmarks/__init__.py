@@ -0,0 +1,80 @@
+"""Bộ benchmark của agent: collector, HTTP, đường ghi InfluxDB và bot handler trên host giả lập
+
+Chạy từ thư mục metrics/:  python -m benchmarks --output results.json [--compare baseline.json]
+"""
+import time
+import tracemalloc
+
+from fleet import percentile
+
+
+class Results:
+    """Kết quả dạng {key: {value, unit, better}} để so sánh được giữa các lần chạy"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, key, value, unit, better='lower'):
+        self.metrics[key] = {"value": round(value, 4) if isinstance(value, float) else value, "unit": unit, "better": better}
+
+    def add_latency(self, prefix, seconds):
+        """p50/p99/mean (ms) của một danh sách thời gian tính bằng giây"""
+        values = sorted(s * 1000 for s in seconds)
+        if not values:
+            return
+        self.add(f"{prefix}.p50_ms", percentile(values, 50), 'ms')
+        self.add(f"{prefix}.p99_ms", percentile(values, 99), 'ms')
+        self.add(f"{prefix}.mean_ms", sum(values) / len(values), 'ms')
+
+
+def measure(func, samples=50, warmup=3, alloc_samples=10):
+    """Đo wall time, CPU time (cả process, gồm thread phụ của collector) và bộ nhớ cấp phát mỗi lần gọi"""
+    for _ in range(warmup):
+        func()
+    wall, cpu = [], []
+    for _ in range(samples):
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        func()
+        wall.append(time.perf_counter() - started)
+        cpu.append(time.process_time() - cpu_started)
+
+    # tracemalloc làm chậm mọi cấp phát nên đo riêng, không lẫn vào thời gian
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_samples):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "wall": wall,
+        "cpu": cpu,
+        "alloc_peak_bytes": sorted(peaks)[len(peaks) // 2] if peaks else 0,
+        "alloc_retained_bytes": sorted(retained)[len(retained) // 2] if retained else 0
+    }
+
+
+def add_measurement(results, prefix, measured):
+    results.add_latency(f"{prefix}.wall", measured["wall"])
+    results.add_latency(f"{prefix}.cpu", measured["cpu"])
+    results.add(f"{prefix}.alloc_peak_kib", measured["alloc_peak_bytes"] / 1024, 'KiB')
+    results.add(f"{prefix}.alloc_retained_kib", measured["alloc_retained_bytes"] / 1024, 'KiB')
+
+
+def compare(current, baseline, threshold=10.0):
+    """[(key, giá trị cũ, giá trị mới, % thay đổi, có phải regression)] cho các key có ở cả hai lần chạy"""
+    rows = []
+    for key, entry in current.items():
+        old = baseline.get(key)
+        if old is None or entry["better"] not in ('lower', 'higher') or not old["value"]:
+            continue
+        change = (entry["value"] - old["value"]) / abs(old["value"]) * 100
+        worse = change > threshold if entry["better"] == 'lower' else change < -threshold
+        rows.append((key, old["value"], entry["value"], change, worse))
+    return rows
@@ -0,0 +1,147 @@
+"""python -m benchmarks [--only collectors,procfs,http,influx,bot,store] [--output results.json] [--compare baseline.json]"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from . import Results, compare
+from .fixtures import FakeHost, wait_for_smi
+
+SUITES = ('collectors', 'procfs', 'http', 'influx', 'bot', 'store')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def configure_environment(gpu_backend):
+    """Cấu hình agent cho benchmark trước khi import app: không InfluxDB/bot thật, host name cố định"""
+    for key in ('INFLUXDB_URL', 'INFLUXDB_TOKEN', 'TELEGRAM_BOT_TOKEN', 'TELEGRAM_ALLOWED_USERS', 'FLEET_TARGETS'):
+        os.environ[key] = ''
+    os.environ['AGENT_MODE'] = 'agent'
+    os.environ['AGENT_HOSTNAME'] = 'bench-host'
+    os.environ['GPU_BACKEND'] = gpu_backend
+    os.environ['GPU_SMI_INTERVAL_MS'] = '100'
+    # Các suite khác đo đường psutil trên host giả; suite procfs tự so hai nguồn trên cùng cây /proc
+    os.environ['PROCFS_FAST_PATH'] = 'off'
+    # Mount giả nằm trong thư mục tạm -> không lọc /tmp/ như mặc định
+    os.environ['DISK_IGNORE_MOUNT_PREFIXES'] = '/etc/,/usr/,/dev/'
+    # Không tạo kho lịch sử trong cây mã nguồn; suite store dùng thư mục tạm riêng
+    os.environ['METRICS_STORE_ENABLED'] = 'false'
+
+
+def print_results(metrics):
+    width = max(len(key) for key in metrics)
+    for key, entry in metrics.items():
+        print(f"  {key:<{width}}  {entry['value']:>12,.3f} {entry['unit']}")
+
+
+def print_comparison(rows, threshold):
+    width = max((len(row[0]) for row in rows), default=10)
+    for key, old, new, change, worse in rows:
+        flag = '❌' if worse else ('✅' if abs(change) > threshold else '  ')
+        print(f"{flag} {key:<{width}}  {old:>12,.3f} -> {new:>12,.3f}  {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the metrics agent on a simulated host')
+    parser.add_argument('--only', default=','.join(SUITES), help=f"comma-separated suites ({', '.join(SUITES)})")
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from a previous run')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--samples', type=int, default=50, help='samples per collector measurement')
+    parser.add_argument('--requests', type=int, default=2000, help='HTTP requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent HTTP connections')
+    parser.add_argument('--bot-iterations', type=int, default=30, help='calls per bot command')
+    parser.add_argument('--cores', type=int, default=32)
+    parser.add_argument('--processes', type=int, default=600)
+    parser.add_argument('--mounts', type=int, default=8)
+    parser.add_argument('--gpus', type=int, default=2)
+    parser.add_argument('--gpu-backend', default='smi', choices=('smi', 'fake', 'none'),
+                        help="smi = fake nvidia-smi --loop process, fake = fake_nvml shim")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.only.split(',') if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    host = FakeHost(cores=args.cores, processes=args.processes, mounts=args.mounts, gpus=args.gpus)
+    configure_environment(args.gpu_backend)
+    results = Results()
+    started = time.time()
+    with host:
+        import app  # Sau khi cài host giả: CpuAccountant/MountTable đọc psutil và mountinfo ngay lúc import
+        from . import bench_bot, bench_collectors, bench_http, bench_influx, bench_procfs, bench_store
+
+        try:
+            if args.gpu_backend == 'smi' and not wait_for_smi(app.gpu_collector):
+                print("⚠️  Fake nvidia-smi produced no data - GPU collector will report []")
+            if 'collectors' in suites:
+                print("⏱️  Collectors...")
+                bench_collectors.run(app, results, samples=args.samples)
+            if 'procfs' in suites:
+                print("⏱️  procfs fast path vs psutil...")
+                bench_procfs.run(app, host, results, samples=args.samples)
+            if 'http' in suites:
+                print(f"⏱️  HTTP ({args.requests} requests x {args.concurrency} connections per endpoint)...")
+                bench_http.run(app, results, requests=args.requests, concurrency=args.concurrency)
+            if 'influx' in suites:
+                print("⏱️  InfluxDB write path...")
+                bench_influx.run(app, results, samples=args.samples)
+            if 'bot' in suites:
+                print("⏱️  Bot handlers...")
+                bench_bot.run(app, results, iterations=args.bot_iterations)
+            if 'store' in suites:
+                print("⏱️  Metrics store (a month of history on disk)...")
+                bench_store.run(app, results, samples=args.samples)
+        finally:
+            app.gpu_collector.close()
+            app.collector_registry.shutdown()
+            app.disk_usage_collector.shutdown()
+            app.responses.executor.shutdown(wait=False)
+
+    report = {
+        "meta": {
+            "timestamp": started,
+            "duration_seconds": round(time.time() - started, 1),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "suites": suites,
+            "host": host.describe(),
+            "gpu_backend": args.gpu_backend,
+            "json_encoder": app.JSON_ENCODER
+        },
+        "metrics": results.metrics
+    }
+    print_results(results.metrics)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(results.metrics, baseline.get("metrics", {}), args.threshold)
+        print(f"\n📊 Compared with {args.compare} (git {baseline.get('meta', {}).get('git_revision')}), threshold {args.threshold:g}%")
+        print_comparison(rows, args.threshold)
+        regressions = [row for row in rows if row[4]]
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:g}%")
+            return 1
+        print("✅ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Độ trễ các lệnh bot từ lúc nhận update tới khi Bot API (fake_botapi.py) trả lời sendMessage"""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from telegram import Bot, Update
+
+from fake_botapi import FakeBotApi, make_server
+
+# (tên kết quả, handler trong app.py, args)
+COMMANDS = (
+    ("status", "cmd_status", []),
+    ("info", "cmd_info", []),
+    ("cpu", "cmd_cpu", []),
+    ("ram", "cmd_ram", []),
+    ("disk", "cmd_disk", []),
+    ("gpu", "cmd_gpu", []),
+    ("network", "cmd_network", []),
+    ("top", "cmd_top", []),
+    ("top_io", "cmd_top", ["io"]),
+)
+
+
+def make_update(bot, text, update_id=1):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000, "type": "private"},
+            "from": {"id": 1000, "is_bot": False, "first_name": "Bench"},
+            "text": text
+        }
+    }, bot)
+
+
+async def _run(app, results, iterations, base_url):
+    bot = Bot('123456:bench', base_url=base_url)
+    await bot.initialize()
+    try:
+        # Snapshot và bảng process sẵn trong cache như khi sampler nền đang chạy
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, app.sampler.refresh)
+        await loop.run_in_executor(None, app.get_process_table)
+        for name, handler_name, args in COMMANDS:
+            handler = getattr(app, handler_name)
+            context = SimpleNamespace(args=args)
+            latencies = []
+            for i in range(iterations):
+                update = make_update(bot, f"/{name}", i + 1)
+                started = time.perf_counter()
+                await handler(update, context)
+                latencies.append(time.perf_counter() - started)
+            results.add_latency(f"bot.{name}", latencies)
+    finally:
+        await bot.shutdown()
+
+
+def run(app, results, iterations=30, latency=0.0):
+    api = FakeBotApi(chat_rate=0, latency=latency)
+    server = make_server(api, port=0)
+    thread = threading.Thread(target=server.serve_forever, name="fake-botapi", daemon=True)
+    thread.start()
+    try:
+        asyncio.run(_run(app, results, iterations, f"http://127.0.0.1:{server.server_address[1]}/bot"))
+    finally:
+        server.shutdown()
+        server.server_close()
+    expected = iterations * len(COMMANDS)
+    if len(api.messages) < expected:
+        raise RuntimeError(f"fake Bot API received {len(api.messages)} messages, expected {expected}")
@@ -0,0 +1,29 @@
+"""Chi phí mỗi lần lấy mẫu: từng collector, cả snapshot và các bước encode/build point phía sau"""
+import codec
+from openmetrics import encode_openmetrics
+
+from . import add_measurement, measure
+
+
+def run(app, results, samples=50):
+    for collector in app.collector_registry:
+        if not collector.enabled:
+            continue
+        add_measurement(results, f"collectors.{collector.name}", measure(collector.func, samples))
+
+    # Cả snapshot qua registry (các collector chạy song song trên thread pool)
+    add_measurement(results, "collect_metrics", measure(app.collect_metrics, samples))
+
+    snapshots = [app.collect_metrics() for _ in range(max(samples, 10))]
+    snapshot = snapshots[-1]
+    add_measurement(results, "influx.build_points",
+                    measure(lambda: [point.to_line_protocol() for point in app.build_influx_points(snapshot)], samples))
+    add_measurement(results, "encode.json", measure(lambda: app.responses.encode_json(snapshot), samples))
+    add_measurement(results, "encode.openmetrics", measure(lambda: encode_openmetrics(snapshot), samples))
+    results.add("snapshot.json_bytes", len(app.responses.encode_json(snapshot)), 'bytes')
+    results.add("snapshot.influx_points", len(app.build_influx_points(snapshot)), 'points')
+
+    compact = codec.benchmark(snapshots, app.COMPACT_KEYFRAME_INTERVAL)
+    results.add("encode.compact.bytes_per_snapshot", compact["compact_bytes_per_snapshot"], 'bytes')
+    results.add("encode.compact.encode_us", compact["compact_encode_us"], 'us')
+    results.add("encode.compact.decode_us", compact["compact_decode_us"], 'us')
@@ -0,0 +1,66 @@
+"""Độ trễ p50/p99 và throughput của HTTP API dưới tải đồng thời (server chạy in-process trên port ngẫu nhiên)"""
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+# (tên kết quả, đường dẫn, header): các kiểu request mà Grafana/scraper/aggregator hay gửi
+ENDPOINTS = (
+    ("metrics", "/metrics", {}),
+    ("metrics_gzip", "/metrics", {"Accept-Encoding": "gzip"}),
+    ("metrics_not_modified", "/metrics", None),
+    ("openmetrics", "/metrics/openmetrics", {}),
+    ("processes", "/processes?sort=cpu&limit=50", {}),
+    ("health", "/health", {}),
+)
+
+
+async def _load(session, url, headers, requests, concurrency):
+    latencies = []
+    statuses = {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            async with session.get(url, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started, statuses
+
+
+async def _run(app, results, requests, concurrency):
+    runner = web.AppRunner(app.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    base = f"http://{host}:{port}"
+    try:
+        # Snapshot sẵn trong cache như khi sampler nền đang chạy
+        await asyncio.get_running_loop().run_in_executor(None, app.sampler.refresh)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, auto_decompress=False) as session:
+            for name, path, headers in ENDPOINTS:
+                if headers is None:
+                    async with session.get(f"{base}/metrics") as response:
+                        headers = {"If-None-Match": response.headers.get("ETag", "")}
+                latencies, elapsed, statuses = await _load(session, f"{base}{path}", headers, requests, concurrency)
+                errors = sum(count for status, count in statuses.items() if status >= 400)
+                results.add_latency(f"http.{name}", latencies)
+                results.add(f"http.{name}.rps", len(latencies) / elapsed, 'req/s', better='higher')
+                results.add(f"http.{name}.errors", errors, 'requests')
+    finally:
+        await runner.cleanup()
+
+
+def run(app, results, requests=2000, concurrency=32):
+    results.add("http.concurrency", concurrency, 'connections', better='info')
+    asyncio.run(_run(app, results, requests, concurrency))
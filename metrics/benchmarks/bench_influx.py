@@ -0,0 +1,129 @@
+"""Đường ghi InfluxDB: build point + enqueue, flush qua client thật tới một stub /api/v2/write local, và spill"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from influxdb_client import InfluxDBClient, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+from influx_writer import BatchWriter, SpillQueue
+
+from . import add_measurement, measure
+
+
+class InfluxStub:
+    """Nhận /api/v2/write, đếm số dòng; 'latency' giả lập RTT tới InfluxDB thật"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lines = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub._lock:
+                    stub.requests += 1
+                    stub.lines += body.count(b'\n') + (1 if body and not body.endswith(b'\n') else 0)
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                # /ping và /health
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="influx-stub", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _render(app):
+    return lambda metrics: [point.to_line_protocol() for point in app.build_influx_points(metrics)]
+
+
+def run(app, results, samples=50, batch_snapshots=30, rounds=10, latency=0.002):
+    snapshots = [app.collect_metrics() for _ in range(batch_snapshots)]
+    render = _render(app)
+
+    with InfluxStub(latency=latency) as stub:
+        client = InfluxDBClient(url=stub.url, token='bench', org='bench')
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+        writer = BatchWriter(
+            lambda lines: write_api.write(bucket='bench', org='bench', record=lines, write_precision=WritePrecision.NS),
+            batch_size=10**9,
+            flush_interval=3600,
+            max_retries=1
+        )
+        writer.start()
+        try:
+            # Phần chạy trên scheduler mỗi COLLECTION_INTERVAL: build point rồi đưa vào hàng đợi
+            snapshot = snapshots[-1]
+            add_measurement(results, "influx.enqueue", measure(lambda: writer.enqueue(render(snapshot), snapshot=snapshot), samples))
+            writer.flush(timeout=60)
+
+            flush_times = []
+            points = 0
+            for _ in range(rounds):
+                for s in snapshots:
+                    lines = render(s)
+                    points += len(lines)
+                    writer.enqueue(lines, snapshot=s)
+                started = time.perf_counter()
+                if not writer.flush(timeout=60):
+                    raise RuntimeError("flush to the InfluxDB stub failed")
+                flush_times.append(time.perf_counter() - started)
+        finally:
+            writer.stop()
+            client.close()
+
+    results.add_latency("influx.flush", flush_times)
+    results.add("influx.flush.points_per_sec", points / sum(flush_times), 'points/s', better='higher')
+    results.add("influx.flush.points_per_batch", points // rounds, 'points', better='info')
+    if stub.lines < writer.written_points:
+        raise RuntimeError(f"InfluxDB stub received {stub.lines} lines, writer reported {writer.written_points}")
+
+    # Spill khi InfluxDB down: line protocol so với snapshot dạng gọn
+    directory = tempfile.mkdtemp(prefix='metrics-bench-spill-')
+    try:
+        spill = SpillQueue(directory, 1024**3, render=render)
+        lines = [line for s in snapshots for line in render(s)]
+        for name, push in (("lp", lambda: spill.push(lines)), ("compact", lambda: spill.push_snapshots(snapshots))):
+            before = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+            started = time.perf_counter()
+            push()
+            elapsed = time.perf_counter() - started
+            after = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+            results.add(f"influx.spill.{name}.bytes_per_snapshot", (after - before) / len(snapshots), 'bytes')
+            results.add(f"influx.spill.{name}.write_ms", elapsed * 1000, 'ms')
+        started = time.perf_counter()
+        while True:
+            name, replayed = spill.peek()
+            if name is None:
+                break
+            spill.remove(name)
+        results.add("influx.spill.replay_ms", (time.perf_counter() - started) * 1000, 'ms')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
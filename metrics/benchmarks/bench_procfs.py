@@ -0,0 +1,90 @@
+"""Fast path procfs so với psutil trên cùng một cây /proc: độ khớp và thời gian mỗi lần lấy mẫu"""
+import glob
+import os
+
+import psutil
+
+import procfs
+from cpu_stats import CpuAccountant, psutil_cpu_times
+from rates import DiskRates, NetworkRates, psutil_disk_counters, psutil_net_counters
+
+from . import add_measurement, measure
+
+# Bản ghi /proc của máy thật (python procfs.py --record benchmarks/proc_fixtures/<tên>)
+RECORDED_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'proc_fixtures')
+
+# Các collector mà fast path thay nguồn dữ liệu
+HOT_COLLECTORS = ('collect_cpu', 'collect_memory', 'collect_network', 'collect_disk_io')
+
+
+def sources(reader):
+    """{tên: (đọc qua psutil, đọc qua fast path)} cho từng file /proc"""
+    return {
+        "stat": (psutil_cpu_times, reader.cpu_times),
+        "meminfo": (psutil.virtual_memory, reader.virtual_memory),
+        "net_dev": (psutil_net_counters, reader.net_io_counters),
+        "diskstats": (psutil_disk_counters, reader.disk_io_counters)
+    }
+
+
+def add_speedup(results, key, slow, fast):
+    """Tỉ lệ thời gian p50 (wall) và CPU trung bình psutil / fast path"""
+    wall = sorted(slow["wall"])[len(slow["wall"]) // 2] / max(sorted(fast["wall"])[len(fast["wall"]) // 2], 1e-9)
+    cpu = sum(slow["cpu"]) / max(sum(fast["cpu"]), 1e-9)
+    results.add(f"{key}.speedup_wall", wall, 'x', better='higher')
+    results.add(f"{key}.speedup_cpu", cpu, 'x', better='higher')
+
+
+def check_accuracy(results, roots):
+    """Fast path phải khớp psutil tuyệt đối trên file /proc tĩnh (cây giả lập và các bản ghi)"""
+    mismatches = 0
+    for root in roots:
+        for metric, fast, reference in procfs.compare_with_psutil(root, rel_tol=1e-9, abs_tol=1e-9):
+            mismatches += 1
+            print(f"❌ {os.path.basename(os.path.dirname(root)) or root}: {metric}: fast path {fast} != psutil {reference}")
+    results.add("procfs.fixtures", len(roots), 'fixtures', better='info')
+    results.add("procfs.mismatches", mismatches, 'values')
+    return mismatches
+
+
+def use_sources(app, reader):
+    """Đặt lại nguồn của các collector nóng (psutil khi reader là None); trả về bộ cũ để khôi phục"""
+    saved = (app.proc_reader, app.cpu_accountant, app.network_rates, app.disk_rates)
+    app.proc_reader = reader
+    app.cpu_accountant = CpuAccountant(reader.cpu_times if reader else None)
+    app.network_rates = NetworkRates(reader.net_io_counters if reader else None)
+    app.disk_rates = DiskRates(reader.disk_io_counters if reader else None)
+    return saved
+
+
+def run(app, host, results, samples=50):
+    root = host.write_proc()
+    recorded = sorted(os.path.dirname(path) for path in glob.glob(os.path.join(RECORDED_FIXTURES, '*', 'stat')))
+    reader = procfs.ProcReader(root)
+    saved = None
+    try:
+        with host.real_psutil(root):
+            check_accuracy(results, [root] + recorded)
+
+            for name, (slow, fast) in sources(reader).items():
+                slow_measured, fast_measured = measure(slow, samples), measure(fast, samples)
+                add_measurement(results, f"procfs.{name}.psutil", slow_measured)
+                add_measurement(results, f"procfs.{name}.fast", fast_measured)
+                add_speedup(results, f"procfs.{name}", slow_measured, fast_measured)
+
+            # Cùng các collector và cùng collect_metrics(), chỉ khác nguồn đọc /proc
+            measured = {}
+            for label, source in (("psutil", None), ("fast", reader)):
+                previous = use_sources(app, source)
+                saved = saved or previous
+                hot = [getattr(app, name) for name in HOT_COLLECTORS]
+                measured[label] = (measure(lambda: [collect() for collect in hot], samples),
+                                   measure(app.collect_metrics, samples))
+                add_measurement(results, f"procfs.hot_collectors.{label}", measured[label][0])
+                add_measurement(results, f"procfs.collect_metrics.{label}", measured[label][1])
+            add_speedup(results, "procfs.hot_collectors", measured["psutil"][0], measured["fast"][0])
+            add_speedup(results, "procfs.collect_metrics", measured["psutil"][1], measured["fast"][1])
+    finally:
+        if saved:
+            app.proc_reader, app.cpu_accountant, app.network_rates, app.disk_rates = saved
+        reader.close()
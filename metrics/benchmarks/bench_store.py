@@ -0,0 +1,66 @@
+"""Kho lịch sử mmap trên đĩa: chi phí ghi mỗi snapshot, truy vấn trên một tháng dữ liệu và thời gian mở lại"""
+import math
+import shutil
+import tempfile
+import time
+
+from history import flatten_snapshot
+from mmstore import MetricsStore, parse_tiers, segment_size
+
+from . import add_measurement, measure
+
+# (tên, khoảng lùi, step) của các truy vấn đo trên tháng dữ liệu giả
+QUERIES = (
+    ("1h_raw", 3600, None),
+    ("1d_5m", 86400, 300),
+    ("7d_1h", 7 * 86400, 3600),
+    ("30d_raw", 29 * 86400, None),
+    ("30d_1h", 29 * 86400, 3600)
+)
+
+
+def fill(store, names, days, interval=10):
+    """Ghi 'days' ngày dữ liệu giả (sóng sin) cho các series, kết thúc ở hiện tại; trả về số lần ghi/giây"""
+    now = time.time()
+    count = int(days * 86400 / interval)
+    started = time.perf_counter()
+    for i in range(count):
+        timestamp = now - (count - i) * interval
+        value = 50 + 40 * math.sin(i / 360)
+        store.record(timestamp, {name: value + n for n, name in enumerate(names)})
+    return count / (time.perf_counter() - started)
+
+
+def run(app, results, samples=50, series=4, days=31):
+    values = flatten_snapshot(app.collect_metrics())
+    tiers = parse_tiers(app.METRICS_STORE_TIERS)
+    history = [f"bench_history:{n}" for n in range(series)]
+    directory = tempfile.mkdtemp(prefix='metrics-bench-store-')
+    try:
+        store = MetricsStore(directory, tiers, segment_size(tiers) * (len(values) + series))
+
+        # Phần chạy trong on_snapshot: một lần ghi cho mọi series của snapshot, ở mọi tầng
+        clock = [time.time()]
+        def record():
+            clock[0] += 1
+            store.record(clock[0], values)
+        add_measurement(results, "store.record", measure(record, samples))
+        results.add("store.record.series", len(values), 'series', better='info')
+
+        results.add("store.fill.writes_per_sec", fill(store, history, days), 'writes/s', better='higher')
+        for name, span, step in QUERIES:
+            now = time.time()
+            rows = len(store.query(history[0], now - span, now, step))
+            add_measurement(results, f"store.query.{name}", measure(lambda: store.query(history[0], now - span, now, step), samples))
+            results.add(f"store.query.{name}.rows", rows, 'rows', better='info')
+
+        store.close()
+        started = time.perf_counter()
+        store = MetricsStore(directory, tiers, segment_size(tiers) * (len(values) + series))
+        results.add("store.open_ms", (time.perf_counter() - started) * 1000, 'ms')
+        if store.series() != sorted([*values, *history]):
+            raise RuntimeError("metrics store lost series across reopen")
+        results.add("store.segment_mib", segment_size(tiers) / 1024**2, 'MiB', better='info')
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,365 @@
+"""Host giả lập tất định cho benchmark: thay psutil, /proc/self/mountinfo, /sys/block và nvidia-smi
+
+Bộ đếm (CPU, mạng, disk, process) tăng đều theo seed nên mọi lần chạy trên mọi máy Linux
+đều thấy cùng một "máy" với cùng số core, NIC, mount và process.
+"""
+import os
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import psutil
+
+import disk
+import rates
+
+scputimes = namedtuple('scputimes', 'user nice system idle iowait irq softirq steal guest guest_nice')
+svmem = namedtuple('svmem', 'total available percent used free active inactive buffers cached shared slab')
+sswap = namedtuple('sswap', 'total used free percent sin sout')
+snetio = namedtuple('snetio', 'bytes_sent bytes_recv packets_sent packets_recv errin errout dropin dropout')
+snicaddr = namedtuple('snicaddr', 'family address netmask broadcast ptp')
+snicstats = namedtuple('snicstats', 'isup duplex speed mtu flags')
+sdiskpart = namedtuple('sdiskpart', 'device mountpoint fstype opts')
+sdiskio = namedtuple('sdiskio', 'read_count write_count read_bytes write_bytes read_time write_time '
+                                'read_merged_count write_merged_count busy_time')
+pcputimes = namedtuple('pcputimes', 'user system children_user children_system iowait')
+pmem = namedtuple('pmem', 'rss vms shared text lib data dirty')
+pio = namedtuple('pio', 'read_count write_count read_bytes write_bytes read_chars write_chars')
+
+# Các hàm psutil được thay thế khi install()
+PATCHED = ('cpu_times', 'cpu_count', 'getloadavg', 'boot_time', 'virtual_memory', 'swap_memory',
+           'net_io_counters', 'net_if_addrs', 'net_if_stats', 'disk_partitions', 'disk_io_counters',
+           'process_iter', 'sensors_temperatures', 'sensors_fans', 'sensors_battery')
+
+PROCESS_NAMES = ('python3', 'postgres', 'nginx', 'java', 'node', 'redis-server', 'sshd', 'containerd', 'kworker/0:1', 'bash')
+USERS = ('root', 'www-data', 'postgres', 'ubuntu')
+
+# Các hàm psutil mà fast path procfs thay thế (real_psutil() tạm trả lại bản thật)
+PROCFS_FUNCTIONS = ('cpu_times', 'virtual_memory', 'net_io_counters', 'disk_io_counters')
+
+# nvidia-smi giả: in các dòng CSV theo SMI_QUERY_FIELDS, lặp theo --loop-ms giống bản thật
+NVIDIA_SMI_SCRIPT = '''#!{python}
+import sys, time
+gpus = {gpus}
+loop_ms = 0
+for arg in sys.argv[1:]:
+    if arg.startswith('--loop-ms='):
+        loop_ms = int(arg.split('=', 1)[1])
+tick = 0
+while True:
+    for i in range(gpus):
+        used = 1024 * (i + 1) + (tick * 37 + i * 101) % 8192
+        print(f"{{i}}, NVIDIA Fake GPU, {{40 + i + tick % 5}}, {{(tick * 7 + i * 13) % 100}}, 24576, {{used}}, {{24576 - used}}, "
+              f"{{75 + tick % 50}}.5, 350.00, 30, GPU-00000000-0000-0000-0000-{{i:012d}}, 1500, 1500, 9500", flush=True)
+    if not loop_ms:
+        break
+    tick += 1
+    time.sleep(loop_ms / 1000)
+'''
+
+
+class FakeProcess:
+    """Đủ giống psutil.Process cho process_iter(attrs): chỉ có pid và info"""
+
+    __slots__ = ('pid', 'info')
+
+    def __init__(self, pid, info):
+        self.pid = pid
+        self.info = info
+
+
+class FakeHost:
+    """Một máy giả với số core/process/NIC/disk/mount cố định, bộ đếm tăng mỗi lần được đọc"""
+
+    def __init__(self, cores=32, processes=600, nics=4, disks=4, mounts=8, gpus=2, seed=1232):
+        self.cores = cores
+        self.process_count = processes
+        self.nic_names = ['lo'] + [f'eth{i}' for i in range(nics)]
+        self.disk_names = [f'nvme{i}n1' for i in range(disks)]
+        self.mount_count = mounts
+        self.gpus = gpus
+        self.seed = seed
+        self.root = None
+        self._rng = random.Random(seed)
+        self._originals = {}
+        self._saved_paths = None
+        self._saved_env = None
+
+        self._cpu = [[0.0] * len(scputimes._fields) for _ in range(cores)]
+        self._net = {nic: [0] * len(snetio._fields) for nic in self.nic_names}
+        self._disk = {dev: [0] * len(sdiskio._fields) for dev in self.disk_names}
+        self.memory_total = 256 * 1024**3
+        self.boot = 1_700_000_000.0
+        self._next_pid = 1000
+        self._procs = [self._spawn() for _ in range(processes)]
+
+    # ---------- bộ đếm ----------
+
+    def _spawn(self):
+        rng = self._rng
+        self._next_pid += 1
+        return {
+            'pid': self._next_pid,
+            'name': rng.choice(PROCESS_NAMES),
+            'username': rng.choice(USERS),
+            'create_time': self.boot + self._next_pid,
+            'cpu': [0.0, 0.0],
+            'io': [0, 0],
+            'rss': rng.randint(4, 4096) * 1024**2,
+            'threads': rng.randint(1, 64),
+            'fds': rng.randint(3, 512),
+            # Mỗi process có mức tải riêng để top N ổn định giữa các lần chạy
+            'load': rng.random() ** 4
+        }
+
+    def _tick_cpu(self):
+        rng = self._rng
+        for core in self._cpu:
+            busy = rng.uniform(0.05, 0.9)
+            core[0] += busy * 0.6
+            core[2] += busy * 0.3
+            core[3] += 1.0 - busy
+            core[4] += rng.uniform(0, 0.02)
+            core[6] += busy * 0.05
+            core[7] += busy * 0.05
+
+    def _tick_counters(self, table, scale):
+        rng = self._rng
+        for values in table.values():
+            for i in range(len(values)):
+                values[i] += int(rng.uniform(0.2, 1.0) * scale[i % len(scale)])
+
+    def _tick_processes(self):
+        rng = self._rng
+        # Khoảng 1% process thoát và được thay bằng process mới mỗi lượt
+        for i in range(max(1, self.process_count // 100)):
+            self._procs[rng.randrange(len(self._procs))] = self._spawn()
+        for proc in self._procs:
+            proc['cpu'][0] += proc['load'] * 0.8
+            proc['cpu'][1] += proc['load'] * 0.2
+            proc['io'][0] += int(proc['load'] * 4096 * 1024)
+            proc['io'][1] += int(proc['load'] * 1024 * 1024)
+
+    # ---------- các hàm thay thế psutil ----------
+
+    def cpu_times(self, percpu=False):
+        if percpu:
+            self._tick_cpu()
+            return [scputimes(*core) for core in self._cpu]
+        return scputimes(*(sum(column) for column in zip(*self._cpu)))
+
+    def cpu_count(self, logical=True):
+        return self.cores if logical else self.cores // 2
+
+    def getloadavg(self):
+        return (self.cores * 0.42, self.cores * 0.38, self.cores * 0.35)
+
+    def boot_time(self):
+        return self.boot
+
+    def virtual_memory(self):
+        used = int(self.memory_total * self._rng.uniform(0.4, 0.6))
+        available = self.memory_total - used
+        return svmem(self.memory_total, available, round(used / self.memory_total * 100, 1), used,
+                     available // 2, used, available // 4, 1024**3, available // 2, 512 * 1024**2, 2 * 1024**3)
+
+    def swap_memory(self):
+        return sswap(8 * 1024**3, 1024**3, 7 * 1024**3, 12.5, 0, 0)
+
+    def net_io_counters(self, pernic=False):
+        if pernic:
+            self._tick_counters(self._net, (50_000_000, 80_000_000, 40_000, 60_000, 1, 1, 2, 2))
+            return {nic: snetio(*values) for nic, values in self._net.items()}
+        return snetio(*(sum(column) for column in zip(*self._net.values())))
+
+    def net_if_addrs(self):
+        return {nic: [snicaddr(2, '127.0.0.1' if nic == 'lo' else f'10.0.{i}.10', '255.255.255.0', None, None)]
+                for i, nic in enumerate(self.nic_names)}
+
+    def net_if_stats(self):
+        return {nic: snicstats(True, 2, 0 if nic == 'lo' else 25000, 1500, 'up,running') for nic in self.nic_names}
+
+    def disk_partitions(self, all=False):
+        return [sdiskpart(f'/dev/{self.disk_names[i % len(self.disk_names)]}p{i + 1}',
+                          os.path.join(self.root, 'mnt', f'data{i}'), 'ext4', 'rw,relatime')
+                for i in range(self.mount_count)]
+
+    def disk_io_counters(self, perdisk=False):
+        if perdisk:
+            self._tick_counters(self._disk, (4000, 6000, 400_000_000, 600_000_000, 2000, 3000, 10, 10, 900))
+            return {dev: sdiskio(*values) for dev, values in self._disk.items()}
+        return sdiskio(*(sum(column) for column in zip(*self._disk.values())))
+
+    def process_iter(self, attrs=None, ad_value=None):
+        self._tick_processes()
+        for proc in self._procs:
+            info = {
+                'pid': proc['pid'],
+                'name': proc['name'],
+                'username': proc['username'],
+                'create_time': proc['create_time'],
+                'cpu_times': pcputimes(proc['cpu'][0], proc['cpu'][1], 0.0, 0.0, 0.0),
+                'memory_info': pmem(proc['rss'], proc['rss'] * 3, proc['rss'] // 8, 0, 0, proc['rss'], 0),
+                'memory_percent': proc['rss'] / self.memory_total * 100,
+                'num_threads': proc['threads'],
+                'io_counters': pio(0, 0, proc['io'][0], proc['io'][1], 0, 0),
+                'num_fds': proc['fds']
+            }
+            if attrs is not None:
+                info = {key: info.get(key, ad_value) for key in attrs}
+            yield FakeProcess(proc['pid'], info)
+
+    def sensors_temperatures(self):
+        return {}
+
+    def sensors_fans(self):
+        return {}
+
+    def sensors_battery(self):
+        return None
+
+    # ---------- cây /proc, /sys và PATH ----------
+
+    def _build_tree(self):
+        self.root = tempfile.mkdtemp(prefix='metrics-bench-')
+        os.makedirs(os.path.join(self.root, 'proc', 'self'))
+        lines = []
+        for i, partition in enumerate(self.disk_partitions()):
+            os.makedirs(partition.mountpoint)
+            lines.append(f"{100 + i} 1 259:{i} / {partition.mountpoint} rw,relatime shared:{i} - "
+                         f"{partition.fstype} {partition.device} rw")
+        with open(os.path.join(self.root, 'proc', 'self', 'mountinfo'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        for dev in self.disk_names:
+            os.makedirs(os.path.join(self.root, 'sys', 'block', dev))
+        smi = os.path.join(self.root, 'bin', 'nvidia-smi')
+        os.makedirs(os.path.dirname(smi))
+        with open(smi, 'w') as f:
+            f.write(NVIDIA_SMI_SCRIPT.format(python=sys.executable, gpus=self.gpus))
+        os.chmod(smi, os.stat(smi).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def write_proc(self):
+        """Ghi trạng thái hiện tại của host ra root/proc/{stat,meminfo,net/dev,diskstats} theo định dạng kernel 5.5+"""
+        proc = os.path.join(self.root, 'proc')
+        ticks = os.sysconf('SC_CLK_TCK')
+        os.makedirs(os.path.join(proc, 'net'), exist_ok=True)
+
+        def cpu_line(name, times):
+            return name + ' ' + ' '.join(str(int(round(t * ticks))) for t in times)
+
+        total = [sum(column) for column in zip(*self._cpu)]
+        lines = [cpu_line('cpu ', total)] + [cpu_line(f'cpu{i}', core) for i, core in enumerate(self._cpu)]
+        lines += ['intr ' + ' '.join(str(i * 7919 % 100003) for i in range(512)), 'ctxt 987654321', f'btime {int(self.boot)}',
+                  f'processes {self._next_pid}', 'procs_running 3', 'procs_blocked 0', 'softirq 1 2 3 4 5 6 7 8 9 10 11']
+        with open(os.path.join(proc, 'stat'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        memory = self.virtual_memory()
+        kb = {'MemTotal': memory.total, 'MemFree': memory.free, 'MemAvailable': memory.available, 'Buffers': memory.buffers,
+              'Cached': memory.cached, 'SwapCached': 0, 'Active': memory.active, 'Inactive': memory.inactive,
+              'SwapTotal': 8 * 1024**3, 'SwapFree': 7 * 1024**3, 'Dirty': 4096, 'Shmem': memory.shared,
+              'Slab': memory.slab, 'SReclaimable': memory.slab // 2, 'SUnreclaim': memory.slab // 2, 'PageTables': 64 * 1024**2}
+        lines = [f"{key + ':':<16}{value // 1024:>8} kB" for key, value in kb.items()]
+        lines += ['HugePages_Total:       0', 'HugePages_Free:        0', 'Hugepagesize:       2048 kB']
+        with open(os.path.join(proc, 'meminfo'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        lines = ['Inter-|   Receive                                                |  Transmit',
+                 ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed']
+        for nic, (sent, recv, psent, precv, errin, errout, dropin, dropout) in self._net.items():
+            lines.append(f"{nic:>6}: {recv:>8} {precv:>7} {errin:>4} {dropin:>4}    0     0          0         0 "
+                         f"{sent:>8} {psent:>7} {errout:>4} {dropout:>4}    0     0       0          0")
+        with open(os.path.join(proc, 'net', 'dev'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        lines = [f"   7       {i} loop{i} 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0" for i in range(4)]
+        for i, (dev, values) in enumerate(self._disk.items()):
+            reads, writes, rbytes, wbytes, rtime, wtime, rmerged, wmerged, busy = values
+            lines.append(f" 259 {i * 16:>7} {dev} {reads} {rmerged} {rbytes // 512} {rtime} {writes} {wmerged} {wbytes // 512} {wtime} "
+                         f"0 {busy} {rtime + wtime} 0 0 0 0 0 0")
+            lines.append(f" 259 {i * 16 + 1:>7} {dev}p1 {reads // 2} 0 {rbytes // 1024} {rtime // 2} {writes // 2} 0 {wbytes // 1024} "
+                         f"{wtime // 2} 0 {busy // 2} {(rtime + wtime) // 2} 0 0 0 0 0 0")
+        with open(os.path.join(proc, 'diskstats'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return proc
+
+    @contextmanager
+    def real_psutil(self, procfs_path):
+        """Tạm dùng lại các hàm psutil thật, đọc procfs_path qua psutil.PROCFS_PATH (để so với fast path)"""
+        patched = {name: getattr(psutil, name) for name in PROCFS_FUNCTIONS}
+        saved_path = psutil.PROCFS_PATH
+        for name in PROCFS_FUNCTIONS:
+            setattr(psutil, name, self._originals.get(name) or patched[name])
+        psutil.PROCFS_PATH = procfs_path
+        try:
+            yield
+        finally:
+            psutil.PROCFS_PATH = saved_path
+            for name, func in patched.items():
+                setattr(psutil, name, func)
+
+    def install(self):
+        """Thay psutil và các đường dẫn /proc, /sys; phải gọi trước khi import app"""
+        self._build_tree()
+        for name in PATCHED:
+            self._originals[name] = getattr(psutil, name, None)
+            setattr(psutil, name, getattr(self, name))
+        self._saved_paths = (disk.MOUNTINFO_PATH, rates.SYS_BLOCK_PATH)
+        disk.MOUNTINFO_PATH = os.path.join(self.root, 'proc', 'self', 'mountinfo')
+        rates.SYS_BLOCK_PATH = os.path.join(self.root, 'sys', 'block')
+        self._saved_env = {key: os.environ.get(key) for key in ('PATH', 'FAKE_NVML_GPUS')}
+        os.environ['PATH'] = os.path.join(self.root, 'bin') + os.pathsep + os.environ.get('PATH', '')
+        os.environ['FAKE_NVML_GPUS'] = str(self.gpus)
+        return self
+
+    def uninstall(self):
+        for name, func in self._originals.items():
+            if func is None:
+                delattr(psutil, name)
+            else:
+                setattr(psutil, name, func)
+        self._originals = {}
+        if self._saved_paths is not None:
+            disk.MOUNTINFO_PATH, rates.SYS_BLOCK_PATH = self._saved_paths
+            self._saved_paths = None
+        for key, value in (self._saved_env or {}).items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self._saved_env = None
+        if self.root is not None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root = None
+
+    def describe(self):
+        return {
+            "cores": self.cores,
+            "processes": self.process_count,
+            "nics": len(self.nic_names),
+            "disks": len(self.disk_names),
+            "mounts": self.mount_count,
+            "gpus": self.gpus,
+            "seed": self.seed
+        }
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+
+def wait_for_smi(gpu_collector, timeout=5.0):
+    """Backend nvidia-smi đọc dòng đầu tiên trên thread nền -> chờ có dữ liệu rồi mới đo"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if gpu_collector.collect():
+            return True
+        time.sleep(0.05)
+    return False
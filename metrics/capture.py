@@ -0,0 +1,400 @@
+"""Burst capture: lấy mẫu CPU/RAM/IO/mạng/top process ở độ phân giải cao (vd 100 ms) trong một cửa sổ ngắn
+
+Kích hoạt bởi alert firing hoặc dòng OOM kill / hung task trong /dev/kmsg, để có dữ liệu gốc ngay lúc sự cố thay
+vì một con số thô. Mẫu được ghi vào buffer cấp phát sẵn (mỗi cột một array('d')), chỉ giữ N capture gần nhất;
+bản tóm tắt được gửi kèm Telegram, bản đầy đủ tải qua HTTP.
+"""
+import errno
+import heapq
+import itertools
+import math
+import os
+import re
+import select
+import threading
+import time
+from array import array
+
+import psutil
+
+from cpu_stats import CpuAccountant
+from proctable import ProcessTable
+from rates import DiskRates, NetworkRates
+
+# Các cột số của mỗi mẫu (theo thứ tự trong buffer)
+FIELDS = (
+    'cpu_percent',
+    'iowait_percent',
+    'memory_percent',
+    'memory_available_bytes',
+    'swap_percent',
+    'disk_read_bytes_per_sec',
+    'disk_write_bytes_per_sec',
+    'net_recv_bytes_per_sec',
+    'net_sent_bytes_per_sec',
+    'memory_stall_percent',
+    'io_stall_percent'
+)
+
+KMSG_PATH = '/dev/kmsg'
+
+# Dòng kernel đáng chụp: OOM killer, task bị treo, soft/hard lockup
+KMSG_EVENTS = (
+    ('oom', re.compile(rb'Out of memory|oom-kill|invoked oom-killer|Memory cgroup out of memory', re.IGNORECASE)),
+    ('hung_task', re.compile(rb'blocked for more than \d+ seconds')),
+    ('lockup', re.compile(rb'soft lockup|hard LOCKUP', re.IGNORECASE))
+)
+
+
+class SystemProbe:
+    """Một hàng mẫu cho burst capture; nguồn đọc giống collector thường (fast path /proc nếu có)
+
+    Mỗi capture dùng bộ đếm delta riêng (reset()), không đụng tới mốc của collector định kỳ.
+    """
+
+    def __init__(self, cpu_times=None, virtual_memory=None, net_counters=None, disk_counters=None, pressure=None):
+        self._cpu_times = cpu_times
+        self._virtual_memory = virtual_memory or psutil.virtual_memory
+        self._net_counters = net_counters
+        self._disk_counters = disk_counters
+        # PressureMonitor riêng (fd giữ mở) hoặc None khi máy không có PSI
+        self._pressure = pressure
+        self._cpu = None
+        self._network = None
+        self._disk = None
+        self._processes = None
+
+    def reset(self):
+        """Đặt mốc mới cho mọi bộ đếm delta ngay trước khi bắt đầu một capture"""
+        self._cpu = CpuAccountant(self._cpu_times)
+        self._network = NetworkRates(self._net_counters)
+        self._disk = DiskRates(self._disk_counters)
+        self._network.sample()
+        self._disk.sample()
+        if self._pressure is not None:
+            self._pressure.sample()
+        self._processes = ProcessTable(with_io=True, with_files=False)
+        self._processes.sample()
+
+    def sample(self):
+        """Giá trị các cột FIELDS (None khi chưa có delta)"""
+        cpu = self._cpu.sample()
+        memory = self._virtual_memory()
+        try:
+            swap = psutil.swap_memory().percent
+        except (OSError, RuntimeError):
+            swap = None
+        nics = self._network.sample()
+        disks = self._disk.sample()
+        pressure = self._pressure.sample() if self._pressure is not None else {}
+        return (
+            cpu['usage_percent'],
+            cpu['modes'].get('iowait'),
+            memory.percent,
+            memory.available,
+            swap,
+            _total(disks.values(), 'read_bytes_per_sec'),
+            _total(disks.values(), 'write_bytes_per_sec'),
+            _total((stats for nic, stats in nics.items() if not nic.startswith('lo')), 'recv_bytes_per_sec'),
+            _total((stats for nic, stats in nics.items() if not nic.startswith('lo')), 'sent_bytes_per_sec'),
+            (pressure.get('memory') or {}).get('some_stall_percent'),
+            (pressure.get('io') or {}).get('some_stall_percent')
+        )
+
+    def top_processes(self, n):
+        """Top n process theo CPU kể từ lần gọi trước: [(pid, name, cpu%, rss bytes, io bytes/s)]"""
+        processes = self._processes.sample()
+        return [(p['pid'], p['name'], p['cpu_percent'], p['rss_bytes'], p['io_bytes_per_sec'])
+                for p in self._processes.top(n, 'cpu', processes)]
+
+
+def _total(stats, field):
+    values = [s[field] for s in stats if s.get(field) is not None]
+    return round(sum(values), 2) if values else None
+
+
+class Capture:
+    """Một slot capture với buffer cấp phát sẵn; được tái sử dụng khi vòng qua N capture"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.offsets = array('d', bytes(8 * capacity))
+        # NaN = chưa có giá trị ở mẫu đó
+        self.columns = {field: array('d', [math.nan]) * capacity for field in FIELDS}
+        self.processes = [None] * capacity
+        self.id = None
+        self.trigger = None
+        self.detail = None
+        self.started_at = None
+        self.interval = None
+        self.count = 0
+        self.done = False
+
+    def reset(self, capture_id, trigger, detail, interval):
+        self.id = capture_id
+        self.trigger = trigger
+        self.detail = detail
+        self.interval = interval
+        self.started_at = time.time()
+        self.count = 0
+        self.done = False
+
+    def record(self, offset, values, processes=None):
+        i = self.count
+        if i >= self.capacity:
+            return False
+        self.offsets[i] = offset
+        for field, value in zip(FIELDS, values):
+            self.columns[field][i] = math.nan if value is None else value
+        self.processes[i] = processes
+        self.count = i + 1
+        return True
+
+    def _values(self, field):
+        column = self.columns[field]
+        return [(self.offsets[i], column[i]) for i in range(self.count) if not math.isnan(column[i])]
+
+    def summary(self, top=5):
+        """min/avg/max và thời điểm đỉnh của từng cột, cùng các process dùng CPU nhiều nhất trong cửa sổ"""
+        fields = {}
+        for field in FIELDS:
+            values = self._values(field)
+            if not values:
+                continue
+            peak_at, peak = max(values, key=lambda item: item[1])
+            fields[field] = {
+                "min": round(min(v for _, v in values), 2),
+                "avg": round(sum(v for _, v in values) / len(values), 2),
+                "max": round(peak, 2),
+                "peak_at": round(peak_at, 3)
+            }
+        # Mỗi process lấy đỉnh CPU và RSS qua mọi lần chụp bảng process
+        peaks = {}
+        for sample in self.processes[:self.count]:
+            for pid, name, cpu, rss, io in sample or ():
+                best = peaks.get(pid)
+                if best is None:
+                    peaks[pid] = [pid, name, cpu, rss, io or 0]
+                else:
+                    best[2], best[3], best[4] = max(best[2], cpu), max(best[3], rss), max(best[4], io or 0)
+        processes = [
+            {"pid": pid, "name": name, "max_cpu_percent": cpu, "max_rss_bytes": rss, "max_io_bytes_per_sec": io}
+            for pid, name, cpu, rss, io in heapq.nlargest(top, peaks.values(), key=lambda p: (p[2], p[3]))
+        ]
+        return {**self.info(), "fields": fields, "top_processes": processes}
+
+    def info(self):
+        return {
+            "id": self.id,
+            "trigger": self.trigger,
+            "detail": self.detail,
+            "started_at": self.started_at,
+            "interval_ms": round(self.interval * 1000),
+            "samples": self.count,
+            "duration_seconds": round(self.offsets[self.count - 1], 3) if self.count else 0.0,
+            "done": self.done
+        }
+
+    def to_dict(self):
+        """Toàn bộ capture theo cột (giá trị thiếu là None), để tải qua HTTP"""
+        n = self.count
+        return {
+            **self.info(),
+            "fields": list(FIELDS),
+            "offsets": [round(v, 4) for v in self.offsets[:n]],
+            "columns": {field: [None if math.isnan(v) else v for v in column[:n]] for field, column in self.columns.items()},
+            "processes": [
+                {"offset": round(self.offsets[i], 4),
+                 "top": [dict(zip(('pid', 'name', 'cpu_percent', 'rss_bytes', 'io_bytes_per_sec'), p)) for p in self.processes[i]]}
+                for i in range(n) if self.processes[i] is not None
+            ]
+        }
+
+
+class BurstCapture:
+    """Chạy tối đa một capture tại một thời điểm trên thread riêng (nhịp đều theo monotonic clock)"""
+
+    def __init__(self, probe, interval=0.1, duration=10.0, keep=10, cooldown=60.0, top=5, process_every=5):
+        self.probe = probe
+        self.interval = interval
+        self.duration = duration
+        self.cooldown = cooldown
+        self.top = top
+        # Bảng process tốn hơn nhiều so với các cột số -> chỉ chụp mỗi process_every mẫu
+        self.process_every = max(1, process_every)
+        capacity = max(1, int(math.ceil(duration / interval)))
+        # Toàn bộ buffer được cấp phát một lần lúc khởi động
+        self._slots = [Capture(capacity) for _ in range(max(1, keep))]
+        self._ids = itertools.count(1)
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Cooldown tính riêng theo loại trigger: alert lặp lại không chặn capture cho OOM/hung task ngay sau đó
+        self._last_started = {}
+        self._listeners = []
+        self.started = 0
+        self.suppressed = 0
+        self.overruns = 0
+
+    def on_complete(self, func):
+        """func(capture) được gọi trên thread capture khi một capture kết thúc"""
+        self._listeners.append(func)
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self, trigger, detail=None):
+        """Bắt đầu một capture; trả về id, hoặc None nếu đang chạy / loại trigger này còn trong cooldown"""
+        with self._lock:
+            now = time.monotonic()
+            last = self._last_started.get(trigger)
+            if self.active or (last is not None and now - last < self.cooldown):
+                self.suppressed += 1
+                return None
+            slot = self._slots[self._next_slot]
+            self._next_slot = (self._next_slot + 1) % len(self._slots)
+            slot.reset(next(self._ids), trigger, detail, self.interval)
+            self._last_started[trigger] = now
+            self.started += 1
+            self._thread = threading.Thread(target=self._run, args=(slot,), name=f"burst-capture-{slot.id}", daemon=True)
+            self._thread.start()
+            return slot.id
+
+    def _run(self, capture):
+        print(f"📸 Burst capture #{capture.id} started ({capture.trigger}: {capture.detail}) - "
+              f"{self.interval * 1000:.0f}ms for {self.duration:g}s")
+        try:
+            self.probe.reset()
+            started = time.monotonic()
+            for i in range(capture.capacity):
+                # Mẫu đầu tiên sau một chu kỳ đầy đủ: delta quá ngắn ngay sau reset() chỉ là nhiễu
+                due = started + (i + 1) * self.interval
+                delay = due - time.monotonic()
+                if delay > 0:
+                    if self._stop.wait(delay):
+                        break
+                elif delay < -self.interval:
+                    # Lần đọc trước quá chậm -> bỏ nhịp này thay vì dồn mẫu
+                    self.overruns += 1
+                    continue
+                values = self.probe.sample()
+                processes = self.probe.top_processes(self.top) if (i + 1) % self.process_every == 0 else None
+                capture.record(time.monotonic() - started, values, processes)
+        except Exception as e:
+            print(f"❌ Burst capture #{capture.id} failed: {e}")
+        finally:
+            capture.done = True
+        print(f"📸 Burst capture #{capture.id} finished: {capture.count} samples")
+        for listener in self._listeners:
+            try:
+                listener(capture)
+            except Exception as e:
+                print(f"❌ Burst capture listener failed: {e}")
+
+    def list(self):
+        """Các capture còn giữ, mới nhất trước"""
+        with self._lock:
+            captures = [slot for slot in self._slots if slot.id is not None]
+        return sorted(captures, key=lambda slot: slot.id, reverse=True)
+
+    def get(self, capture_id):
+        with self._lock:
+            for slot in self._slots:
+                if slot.id == capture_id:
+                    return slot
+        return None
+
+    def stats(self):
+        return {
+            "interval_ms": round(self.interval * 1000),
+            "duration_seconds": self.duration,
+            "active": self.active,
+            "started": self.started,
+            "suppressed": self.suppressed,
+            "overruns": self.overruns,
+            "kept": sum(1 for slot in self._slots if slot.id is not None)
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+
+def classify_kmsg(message):
+    """Loại sự kiện kernel ('oom', 'hung_task', 'lockup') của một dòng kmsg, None nếu không đáng chụp"""
+    for kind, pattern in KMSG_EVENTS:
+        if pattern.search(message):
+            return kind
+    return None
+
+
+class KernelLogWatcher:
+    """Đọc /dev/kmsg từ cuối (bỏ log cũ) trên thread riêng, gọi callback(kind, message) với dòng OOM/hung task"""
+
+    def __init__(self, callback, path=None):
+        self.path = path or KMSG_PATH
+        self.callback = callback
+        self._fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        try:
+            # Chỉ quan tâm sự kiện từ lúc agent chạy
+            os.lseek(self._fd, 0, os.SEEK_END)
+        except OSError:
+            pass
+        self._stop = threading.Event()
+        self._thread = None
+        self.events = 0
+        self.lost = 0
+
+    def _records(self):
+        while True:
+            try:
+                record = os.read(self._fd, 8192)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.EPIPE:
+                    # Ring buffer của kernel đã ghi đè các bản ghi chưa đọc
+                    self.lost += 1
+                    continue
+                raise
+            if not record:
+                return
+            yield record
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while not self._stop.is_set():
+            if not poller.poll(500):
+                continue
+            for record in self._records():
+                # '<prio>,<seq>,<ts>,<flags>;<message>\n' (+ các dòng tiếp nối bắt đầu bằng dấu cách)
+                message = record.partition(b';')[2].split(b'\n', 1)[0]
+                kind = classify_kmsg(message)
+                if kind is None:
+                    continue
+                self.events += 1
+                try:
+                    self.callback(kind, message.decode('utf-8', 'replace'))
+                except Exception as e:
+                    print(f"❌ Kernel log callback failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kmsg-watcher", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        return {"path": self.path, "events": self.events, "lost": self.lost}
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
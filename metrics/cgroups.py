@@ -0,0 +1,370 @@
+"""Tài nguyên theo cgroup v2 (container Docker/containerd/podman, unit systemd): CPU, RAM, IO, pids và tốc độ
+
+Cây cgroup chỉ được duyệt lại khi thay đổi: inotify (tạo/xoá thư mục con) trên mọi thư mục cgroup, hoặc khi
+không dùng được inotify thì theo nr_descendants trong cgroup.stat của root cộng một lượt duyệt lại định kỳ.
+mtime thư mục không dùng được vì cgroupfs (kernfs) không cập nhật nó khi tạo/xoá cgroup con.
+"""
+import ctypes
+import json
+import os
+import re
+import select
+import threading
+import time
+
+from psi import parse_pressure, stall_percent
+from rates import CounterRates, _per_sec
+
+# Mount của cgroup v2; trên hệ hybrid (v1 + v2) cây v2 nằm ở <CGROUP_PATH>/unified
+CGROUP_PATH = '/sys/fs/cgroup'
+
+# Thư mục dữ liệu Docker, dùng để đổi container id thành tên (config.v2.json)
+DOCKER_ROOT = '/var/lib/docker'
+
+PROC_PATH = '/proc'
+
+# inotify: thư mục con được tạo/xoá/đổi tên
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+
+# docker-<id>.scope, cri-containerd-<id>.scope, crio-<id>.scope, libpod-<id>.scope hoặc <id> (driver cgroupfs)
+CONTAINER_PATTERN = re.compile(r'^(?:(docker|cri-containerd|crio|libpod)-)?([0-9a-f]{64})(?:\.scope)?$')
+
+# Thứ tự hiển thị: container và service trước, slice/scope sau
+KINDS = ('container', 'service', 'scope', 'slice', 'cgroup')
+
+# File PSI của từng cgroup (<resource>.pressure), cùng định dạng với /proc/pressure
+PRESSURE_RESOURCES = ('cpu', 'memory', 'io')
+
+
+def find_root(path=None):
+    """Thư mục gốc của cây cgroup v2 (có cgroup.controllers), None nếu máy chỉ có cgroup v1"""
+    path = path or CGROUP_PATH
+    for candidate in (path, os.path.join(path, 'unified')):
+        if os.path.exists(os.path.join(candidate, 'cgroup.controllers')):
+            return candidate
+    return None
+
+
+def _read(path):
+    """Đọc cả file cgroup bằng os.open/os.read (nhanh hơn open() cho hàng nghìn file nhỏ)"""
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+
+
+def _read_optional(path):
+    """None khi controller không được bật cho cgroup này (file không tồn tại)"""
+    try:
+        return _read(path)
+    except OSError:
+        return None
+
+
+def _keyed(data):
+    """'key value' mỗi dòng (cpu.stat, memory.stat, cgroup.stat) -> {key: int}"""
+    if data is None:
+        return {}
+    tokens = data.split()
+    return dict(zip(tokens[::2], map(int, tokens[1::2])))
+
+
+def _io_totals(data):
+    """io.stat: '8:0 rbytes=.. wbytes=.. rios=.. wios=..' mỗi device -> tổng của mọi device"""
+    totals = {b'rbytes': 0, b'wbytes': 0, b'rios': 0, b'wios': 0}
+    for token in (data or b'').split():
+        key, sep, value = token.partition(b'=')
+        if sep and key in totals:
+            totals[key] += int(value)
+    return totals
+
+
+def _pressure_totals(path):
+    """{'cpu_some': total_us, 'memory_full': ...} từ các file *.pressure, bỏ qua file không có (PSI tắt)"""
+    totals = {}
+    for resource in PRESSURE_RESOURCES:
+        data = _read_optional(os.path.join(path, f'{resource}.pressure'))
+        if data:
+            for kind, values in parse_pressure(data).items():
+                totals[f'{resource}_{kind}'] = values[3]
+    return totals
+
+
+def _limit(data):
+    """memory.max / pids.max: 'max' = không giới hạn"""
+    if data is None:
+        return None
+    value = data.strip()
+    return None if value == b'max' else int(value)
+
+
+def _cpu_limit(data):
+    """cpu.max: '<quota> <period>' -> số core tối đa, None nếu 'max'"""
+    if data is None:
+        return None
+    quota, _, period = data.strip().partition(b' ')
+    if quota == b'max' or not period:
+        return None
+    return round(int(quota) / int(period), 2)
+
+
+def container_name(runtime, container_id, docker_root=None):
+    """Tên container Docker từ config.v2.json; runtime khác dùng id rút gọn"""
+    if runtime in (None, 'docker'):
+        try:
+            with open(os.path.join(docker_root or DOCKER_ROOT, 'containers', container_id, 'config.v2.json'), 'rb') as f:
+                name = json.load(f).get('Name', '').lstrip('/')
+            if name:
+                return name
+        except (OSError, ValueError):
+            pass
+    return f"{runtime or 'docker'}:{container_id[:12]}"
+
+
+def describe(path, docker_root=None):
+    """(kind, tên hiển thị) của một cgroup theo đường dẫn tương đối, vd. system.slice/nginx.service"""
+    base = path.rsplit('/', 1)[-1]
+    match = CONTAINER_PATTERN.match(base)
+    if match:
+        return 'container', container_name(match.group(1), match.group(2), docker_root)
+    for suffix, kind in (('.service', 'service'), ('.scope', 'scope'), ('.slice', 'slice')):
+        if base.endswith(suffix):
+            return kind, base
+    return 'cgroup', path
+
+
+class DirectoryWatch:
+    """inotify trên các thư mục cgroup; changed() báo có thư mục con được tạo/xoá kể từ lần gọi trước"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1: {os.strerror(errno)}")
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLIN)
+
+    def add(self, path):
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch: {os.strerror(errno)}", path)
+
+    def changed(self):
+        if not self._poller.poll(0):
+            return False
+        # Chỉ cần biết là có thay đổi -> xả hết sự kiện đang chờ
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class CgroupMonitor:
+    """Giữ danh sách cgroup (duyệt lại khi cây đổi) và bộ đếm CPU/IO của từng cgroup giữa các lần lấy mẫu"""
+
+    def __init__(self, root=None, max_groups=200, rescan_interval=60, docker_root=None, use_inotify=True, pressure=True):
+        self.root = find_root(root)
+        if self.root is None:
+            raise OSError(f"cgroup v2 is not mounted at {root or CGROUP_PATH}")
+        self.max_groups = max_groups
+        self.rescan_interval = rescan_interval
+        self.docker_root = docker_root
+        # Đọc thêm cpu/memory/io.pressure của mỗi cgroup (3 file/cgroup/chu kỳ)
+        self.pressure = pressure
+        self.rescans = 0
+        self.scan_duration = None
+        self._lock = threading.Lock()
+        self._rates = CounterRates()
+        # [(đường dẫn tương đối, đường dẫn tuyệt đối, kind, tên, giới hạn)]
+        self._groups = None
+        self._names = {}
+        self._descendants = None
+        self._scanned_at = 0.0
+        self._stale = False
+        self._watch = None
+        if use_inotify:
+            try:
+                self._watch = DirectoryWatch()
+            except (OSError, AttributeError):
+                self._watch = None
+
+    @property
+    def watch_mode(self):
+        return 'inotify' if self._watch is not None else 'poll'
+
+    def _root_descendants(self):
+        return _keyed(_read_optional(os.path.join(self.root, 'cgroup.stat'))).get(b'nr_descendants')
+
+    def _needs_rescan(self):
+        if self._groups is None or self._stale:
+            return True
+        if self._watch is not None:
+            return self._watch.changed()
+        if self._root_descendants() != self._descendants:
+            return True
+        # Thay một cgroup bằng cgroup khác không đổi nr_descendants -> vẫn duyệt lại định kỳ
+        return time.monotonic() - self._scanned_at >= self.rescan_interval
+
+    def _scan(self):
+        started = time.monotonic()
+        if self._watch is not None:
+            # Xả sự kiện cũ trước khi duyệt: thư mục tạo trong lúc duyệt sẽ sinh sự kiện mới
+            self._watch.changed()
+        groups = []
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            if self._watch is not None:
+                try:
+                    self._watch.add(path)
+                except OSError as e:
+                    # Hết quota inotify (ENOSPC) -> chuyển sang poll theo cgroup.stat
+                    print(f"⚠️  cgroup inotify disabled ({e}) - polling cgroup.stat instead")
+                    self._watch.close()
+                    self._watch = None
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+            if path == self.root:
+                continue
+            rel = os.path.relpath(path, self.root)
+            kind, name = self._names.get(rel) or describe(rel, self.docker_root)
+            limits = (_limit(_read_optional(os.path.join(path, 'memory.max'))),
+                      _cpu_limit(_read_optional(os.path.join(path, 'cpu.max'))),
+                      _limit(_read_optional(os.path.join(path, 'pids.max'))))
+            groups.append((rel, path, kind, name, limits))
+        self._groups = groups
+        self._names = {rel: (kind, name) for rel, _, kind, name, _ in groups}
+        self._descendants = self._root_descendants()
+        self._scanned_at = time.monotonic()
+        self._stale = False
+        self.rescans += 1
+        self.scan_duration = time.monotonic() - started
+
+    def name_of(self, path):
+        """Tên hiển thị của cgroup theo đường dẫn tương đối (từ lần duyệt gần nhất)"""
+        known = self._names.get(path)
+        return known[1] if known else describe(path, self.docker_root)[1]
+
+    def sample(self):
+        """Đọc cpu.stat, memory.current/stat, io.stat, pids.current (và *.pressure) của mọi cgroup, tính tốc độ theo chu kỳ"""
+        with self._lock:
+            if self._needs_rescan():
+                self._scan()
+            raw = {}
+            current = {}
+            for rel, path, kind, name, limits in self._groups:
+                try:
+                    cpu = _keyed(_read(os.path.join(path, 'cpu.stat')))
+                except OSError:
+                    # cpu.stat luôn có với cgroup v2 -> cgroup đã bị xoá, duyệt lại ở lần sau
+                    self._stale = True
+                    continue
+                io = _io_totals(_read_optional(os.path.join(path, 'io.stat')))
+                memory = _read_optional(os.path.join(path, 'memory.current'))
+                pids = _read_optional(os.path.join(path, 'pids.current'))
+                memory_stat = _keyed(_read_optional(os.path.join(path, 'memory.stat')))
+                raw[rel] = {
+                    'usage_usec': cpu.get(b'usage_usec', 0),
+                    'nr_periods': cpu.get(b'nr_periods', 0),
+                    'nr_throttled': cpu.get(b'nr_throttled', 0),
+                    'rbytes': io[b'rbytes'],
+                    'wbytes': io[b'wbytes'],
+                    'rios': io[b'rios'],
+                    'wios': io[b'wios'],
+                    **(_pressure_totals(path) if self.pressure else {})
+                }
+                current[rel] = (kind, name, limits, int(memory) if memory else None, int(pids) if pids else None, memory_stat)
+
+            groups = {}
+            for rel, (elapsed, d) in self._rates.update(raw).items():
+                kind, name, (memory_limit, cpu_limit, pids_limit), memory, pids, memory_stat = current[rel]
+                c = raw[rel]
+                periods, throttled = d.get('nr_periods'), d.get('nr_throttled')
+                groups[rel] = {
+                    "name": name,
+                    "kind": kind,
+                    "cpu_percent": _percent(d.get('usage_usec'), elapsed),
+                    "cpu_usage_seconds": round(c['usage_usec'] / 1e6, 3),
+                    "cpu_limit_cores": cpu_limit,
+                    "cpu_throttled_percent": round(throttled / periods * 100, 2) if periods and throttled is not None else (0.0 if periods == 0 else None),
+                    "memory_bytes": memory,
+                    "memory_limit_bytes": memory_limit,
+                    "memory_percent": round(memory / memory_limit * 100, 2) if memory is not None and memory_limit else None,
+                    "memory_anon_bytes": memory_stat.get(b'anon'),
+                    "memory_file_bytes": memory_stat.get(b'file'),
+                    "pids": pids,
+                    "pids_limit": pids_limit,
+                    "io_read_bytes": c['rbytes'],
+                    "io_write_bytes": c['wbytes'],
+                    "io_read_bytes_per_sec": _per_sec(d.get('rbytes'), elapsed),
+                    "io_write_bytes_per_sec": _per_sec(d.get('wbytes'), elapsed),
+                    "io_read_iops": _per_sec(d.get('rios'), elapsed),
+                    "io_write_iops": _per_sec(d.get('wios'), elapsed)
+                }
+                if self.pressure:
+                    # % thời gian task của cgroup bị stall trong chu kỳ (some: ít nhất một task, full: tất cả)
+                    for resource in PRESSURE_RESOURCES:
+                        for kind in ('some', 'full'):
+                            groups[rel][f"{resource}_pressure_{kind}_percent"] = stall_percent(d.get(f'{resource}_{kind}'), elapsed)
+
+            # Hàng nghìn cgroup -> snapshot chỉ giữ các cgroup nặng nhất theo CPU rồi RAM
+            heaviest = sorted(groups.items(), key=lambda item: (item[1]['cpu_percent'] or 0, item[1]['memory_bytes'] or 0),
+                              reverse=True)[:self.max_groups]
+            return {
+                "root": self.root,
+                "count": len(groups),
+                "watch": self.watch_mode,
+                "rescans": self.rescans,
+                "scan_duration_ms": round(self.scan_duration * 1000, 2) if self.scan_duration is not None else None,
+                "groups": dict(heaviest)
+            }
+
+    def close(self):
+        # Chờ lần sample đang chạy (thread collector) xong rồi mới đóng fd inotify
+        with self._lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+
+
+def _percent(usec_delta, elapsed):
+    """Micro giây CPU trong chu kỳ -> % (100 = một core)"""
+    if usec_delta is None or not elapsed or elapsed <= 0:
+        return None
+    return round(usec_delta / 1e6 / elapsed * 100, 2)
+
+
+def cgroup_of(pid, proc_path=None):
+    """Đường dẫn cgroup v2 (tương đối với root) của một process, None nếu không đọc được"""
+    try:
+        data = _read(os.path.join(proc_path or PROC_PATH, str(pid), 'cgroup'))
+    except OSError:
+        return None
+    for line in data.split(b'\n'):
+        # Dòng '0::<path>' là cây v2 (cả trên hệ hybrid)
+        if line.startswith(b'0::'):
+            return line[3:].decode('utf-8', 'replace').strip('/') or None
+    return None
@@ -0,0 +1,384 @@
+"""Định dạng snapshot nhị phân gọn: schema gửi một lần, giá trị số cố định độ rộng, delta/XOR so với snapshot trước
+
+Mỗi message có dạng <loại 1 byte><schema id u16><payload>:
+  S - schema: JSON nén zlib gồm skeleton (snapshot với giá trị số thay bằng 0) và danh sách (đường dẫn, kiểu)
+  K - keyframe: timestamp (µs) và mọi giá trị ở dạng cố định 8 byte
+  D - delta: timestamp delta, bitmap field thay đổi, rồi từng giá trị thay đổi so với frame trước
+
+Kiểu giá trị: 'i' số nguyên và 'c' số thực 2 chữ số thập phân (lưu int x100) dùng delta zigzag varint;
+'f' số thực bất kỳ dùng XOR bit float64 kiểu Gorilla (bỏ các byte 0 đầu/cuối).
+Stream và block dùng chung khung: MAGIC rồi các message có tiền tố độ dài u32.
+
+Chạy benchmark so với JSON: python codec.py --url http://localhost:1232/metrics --count 30
+"""
+import argparse
+import json
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+MAGIC = b'MSC1'
+CONTENT_TYPE = 'application/x-metrics-compact'
+
+SCHEMA, KEYFRAME, DELTA = ord('S'), ord('K'), ord('D')
+
+_HEADER = struct.Struct('<BH')
+_LENGTH = struct.Struct('<I')
+_TIMESTAMP = struct.Struct('<q')
+_DOUBLE = struct.Struct('<d')
+_BITS = struct.Struct('<Q')
+
+
+# Mốc 1970-01-01 không tz: timestamp mã hoá bằng phép trừ trên lịch, không đổi qua giờ local
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _timestamp_us(value):
+    """ISO timestamp -> µs kể từ mốc epoch, chính xác tuyệt đối
+
+    Giờ không tz (datetime.now().isoformat()) được tính như giờ UTC giống InfluxDB client, nên giờ lặp lại
+    hay bị bỏ qua khi đổi DST vẫn giải mã ra đúng chuỗi ban đầu. Giờ có tz được quy về UTC trước.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def _timestamp_iso(us):
+    return (_EPOCH + us * _MICROSECOND).isoformat()
+
+
+def _kind(value):
+    if isinstance(value, int):
+        return 'i'
+    scaled = round(value * 100) if abs(value) < 1e13 else None
+    return 'c' if scaled is not None and scaled / 100 == value else 'f'
+
+
+def _raw(kind, value):
+    """Giá trị ở dạng số nguyên dùng để so sánh và tính delta/XOR; None nếu không hợp kiểu của schema"""
+    if kind == 'i':
+        return value if type(value) is int else None
+    if type(value) is not float:
+        return None
+    if kind == 'c':
+        scaled = round(value * 100) if abs(value) < 1e13 else None
+        return scaled if scaled is not None and scaled / 100 == value else None
+    return _BITS.unpack(_DOUBLE.pack(value))[0]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def flatten(snapshot):
+    """(skeleton, values): tách giá trị số khỏi cấu trúc; bool/str/None nằm lại trong skeleton"""
+    values = []
+    append = values.append
+
+    def walk(node):
+        cls = type(node)
+        if cls is dict:
+            return {str(k): walk(v) for k, v in node.items()}
+        if cls is list or cls is tuple:
+            return [walk(v) for v in node]
+        if cls is float or cls is int:
+            append(node)
+            return 0
+        return node
+
+    body = {k: v for k, v in snapshot.items() if k != 'timestamp'}
+    return walk(body), values
+
+
+def leaf_paths(skeleton):
+    """Đường dẫn tới các giá trị số của skeleton, cùng thứ tự với flatten()"""
+    paths = []
+
+    def walk(node, path):
+        if isinstance(node, dict):
+            for k, v in node.items():
+                walk(v, path + (k,))
+        elif isinstance(node, list):
+            for i, v in enumerate(node):
+                walk(v, path + (i,))
+        elif _is_number(node):
+            paths.append(path)
+
+    walk(skeleton, ())
+    return paths
+
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class SnapshotEncoder:
+    """Trạng thái encode của một kết nối/block: schema hiện tại và giá trị của frame trước"""
+
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.schema_id = 0
+        self.schemas = 0
+        self.frames = 0
+        self._skeleton = None
+        self._paths = None
+        self._kinds = None
+        self._previous = None
+        self._previous_ts = 0
+        self._since_keyframe = 0
+
+    def _schema_message(self, skeleton, values):
+        paths = leaf_paths(skeleton)
+        kinds = []
+        old = dict(zip(self._paths, self._kinds)) if self._paths else {}
+        for path, value in zip(paths, values):
+            kind = _kind(value)
+            # Field đã từng cần float đầy đủ thì giữ 'f' để schema không đổi qua đổi lại
+            if kind == 'c' and old.get(path) == 'f':
+                kind = 'f'
+            kinds.append(kind)
+        self.schema_id = (self.schema_id + 1) & 0xFFFF
+        self._skeleton, self._paths, self._kinds = skeleton, paths, kinds
+        self.schemas += 1
+        body = json.dumps({"skeleton": skeleton, "fields": [[list(p), k] for p, k in zip(paths, kinds)]},
+                          separators=(',', ':')).encode('utf-8')
+        return _HEADER.pack(SCHEMA, self.schema_id) + zlib.compress(body)
+
+    def encode(self, snapshot):
+        """Danh sách message cho một snapshot: [schema?, keyframe | delta]"""
+        skeleton, values = flatten(snapshot)
+        timestamp = _timestamp_us(snapshot['timestamp']) if 'timestamp' in snapshot else 0
+        messages = []
+        current = None
+        if skeleton == self._skeleton and len(values) == len(self._kinds):
+            current = [_raw(k, v) for k, v in zip(self._kinds, values)]
+            if None in current:
+                current = None
+        if current is None:
+            # Cấu trúc đổi (mount/NIC/GPU mới) hoặc giá trị không còn hợp kiểu -> schema mới + keyframe
+            messages.append(self._schema_message(skeleton, values))
+            self._previous = None
+            current = [_raw(k, v) for k, v in zip(self._kinds, values)]
+        if self._previous is None or self._since_keyframe >= self.keyframe_interval:
+            messages.append(self._keyframe(timestamp, current))
+            self._since_keyframe = 0
+        else:
+            messages.append(self._delta(timestamp, current))
+            self._since_keyframe += 1
+        self._previous = current
+        self._previous_ts = timestamp
+        self.frames += 1
+        return messages
+
+    def encode_framed(self, snapshot):
+        """Các message của snapshot, mỗi message có tiền tố độ dài (ghi thẳng vào stream)"""
+        return b''.join(_LENGTH.pack(len(m)) + m for m in self.encode(snapshot))
+
+    def _keyframe(self, timestamp, current):
+        layout = '<' + ''.join('Q' if k == 'f' else 'q' for k in self._kinds)
+        return _HEADER.pack(KEYFRAME, self.schema_id) + _TIMESTAMP.pack(timestamp) + struct.pack(layout, *current)
+
+    def _delta(self, timestamp, current):
+        out = bytearray(_HEADER.pack(DELTA, self.schema_id))
+        _put_varint(out, _zigzag(timestamp - self._previous_ts))
+        bitmap = bytearray((len(current) + 7) // 8)
+        payload = bytearray()
+        for i, (kind, value, previous) in enumerate(zip(self._kinds, current, self._previous)):
+            if value == previous:
+                continue
+            bitmap[i >> 3] |= 1 << (i & 7)
+            if kind == 'f':
+                xor = value ^ previous
+                lead = (64 - xor.bit_length()) // 8
+                trail = ((xor & -xor).bit_length() - 1) // 8
+                size = 8 - lead - trail
+                payload.append(lead << 4 | size)
+                payload += (xor >> (8 * trail)).to_bytes(size, 'big')
+            else:
+                _put_varint(payload, _zigzag(value - previous))
+        out += bitmap
+        out += payload
+        return bytes(out)
+
+
+class SnapshotDecoder:
+    """Dựng lại snapshot (dict giống hệt JSON gốc) từ các message của một SnapshotEncoder"""
+
+    def __init__(self):
+        self.schema_id = None
+        self._skeleton_json = None
+        self._slots = None
+        self._kinds = None
+        self._previous = None
+        self._previous_ts = 0
+
+    def decode(self, message):
+        """Snapshot cho message K/D, None cho message S"""
+        kind, schema_id = _HEADER.unpack_from(message)
+        body = memoryview(message)[_HEADER.size:]
+        if kind == SCHEMA:
+            schema = json.loads(zlib.decompress(body))
+            self.schema_id = schema_id
+            self._skeleton_json = json.dumps(schema["skeleton"])
+            self._slots = [(tuple(path[:-1]), path[-1]) for path, _ in schema["fields"]]
+            self._kinds = [k for _, k in schema["fields"]]
+            self._previous = None
+            return None
+        if schema_id != self.schema_id:
+            raise ValueError(f"frame for schema {schema_id} but current schema is {self.schema_id}")
+        if kind == KEYFRAME:
+            timestamp = _TIMESTAMP.unpack_from(body)[0]
+            layout = '<' + ''.join('Q' if k == 'f' else 'q' for k in self._kinds)
+            current = list(struct.unpack_from(layout, body, _TIMESTAMP.size))
+        elif kind == DELTA:
+            if self._previous is None:
+                raise ValueError("delta frame without a keyframe")
+            timestamp, current = self._apply_delta(body)
+        else:
+            raise ValueError(f"unknown message type {kind!r}")
+        self._previous = current
+        self._previous_ts = timestamp
+        return self._build(timestamp, current)
+
+    def _apply_delta(self, body):
+        delta_ts, pos = _get_varint(body, 0)
+        timestamp = self._previous_ts + _unzigzag(delta_ts)
+        count = len(self._kinds)
+        bitmap = body[pos:pos + (count + 7) // 8]
+        pos += len(bitmap)
+        current = list(self._previous)
+        for i in range(count):
+            if not bitmap[i >> 3] & (1 << (i & 7)):
+                continue
+            if self._kinds[i] == 'f':
+                header = body[pos]
+                lead, size = header >> 4, header & 0x0F
+                trail = 8 - lead - size
+                xor = int.from_bytes(body[pos + 1:pos + 1 + size], 'big') << (8 * trail)
+                current[i] ^= xor
+                pos += 1 + size
+            else:
+                value, pos = _get_varint(body, pos)
+                current[i] += _unzigzag(value)
+        return timestamp, current
+
+    def _build(self, timestamp, current):
+        snapshot = {"timestamp": _timestamp_iso(timestamp)}
+        snapshot.update(json.loads(self._skeleton_json))
+        for (parent, key), kind, raw in zip(self._slots, self._kinds, current):
+            node = snapshot
+            for step in parent:
+                node = node[step]
+            if kind == 'i':
+                node[key] = raw
+            elif kind == 'c':
+                node[key] = raw / 100
+            else:
+                node[key] = _DOUBLE.unpack(_BITS.pack(raw))[0]
+        return snapshot
+
+
+def iter_messages(data):
+    """Duyệt các message trong một block/stream đã có MAGIC ở đầu"""
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a compact snapshot block")
+    pos = len(MAGIC)
+    while pos + _LENGTH.size <= len(data):
+        (size,) = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+        if size:
+            yield bytes(data[pos:pos + size])
+        pos += size
+
+
+def encode_block(snapshots, keyframe_interval=60):
+    """Block tự chứa (schema + keyframe + delta) cho một dãy snapshot, dùng cho spill và backfill history"""
+    encoder = SnapshotEncoder(keyframe_interval)
+    return MAGIC + b''.join(encoder.encode_framed(s) for s in snapshots)
+
+
+def decode_block(data):
+    decoder = SnapshotDecoder()
+    snapshots = []
+    for message in iter_messages(data):
+        snapshot = decoder.decode(message)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def benchmark(snapshots, keyframe_interval=60, repeat=5):
+    """So sánh kích thước và thời gian encode/decode với JSON trên cùng một dãy snapshot"""
+    count = len(snapshots)
+    json_bodies = [json.dumps(s, separators=(',', ':')).encode('utf-8') for s in snapshots]
+
+    def timed(func):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return round(best / count * 1e6, 1)
+
+    block = encode_block(snapshots, keyframe_interval)
+    assert decode_block(block) == [json.loads(b) for b in json_bodies], "compact round-trip mismatch"
+    return {
+        "snapshots": count,
+        "json_bytes_per_snapshot": round(sum(map(len, json_bodies)) / count),
+        "json_zlib_bytes_per_snapshot": round(sum(len(zlib.compress(b)) for b in json_bodies) / count),
+        "compact_bytes_per_snapshot": round(len(block) / count),
+        "json_encode_us": timed(lambda: [json.dumps(s, separators=(',', ':')) for s in snapshots]),
+        "json_decode_us": timed(lambda: [json.loads(b) for b in json_bodies]),
+        "compact_encode_us": timed(lambda: encode_block(snapshots, keyframe_interval)),
+        "compact_decode_us": timed(lambda: decode_block(block))
+    }
+
+
+if __name__ == '__main__':
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description='Benchmark the compact snapshot format against JSON')
+    parser.add_argument('--url', default='http://localhost:1232/metrics', help='agent /metrics endpoint to sample')
+    parser.add_argument('--file', help='JSON-lines file of snapshots instead of --url')
+    parser.add_argument('--count', type=int, default=30)
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--keyframe-interval', type=int, default=60)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            samples = [json.loads(line) for line in f if line.strip()]
+    else:
+        samples = []
+        for i in range(args.count):
+            with urllib.request.urlopen(args.url) as response:
+                samples.append(json.loads(response.read()))
+            if i + 1 < args.count:
+                time.sleep(args.interval)
+    print(json.dumps(benchmark(samples, args.keyframe_interval), indent=2))
@@ -0,0 +1,195 @@
+"""Registry các collector plugin, mỗi collector có chu kỳ, timeout và ngân sách thời gian riêng"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Hệ số backoff tối đa khi collector liên tục vượt ngân sách
+MAX_BACKOFF = 8
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class Collector:
+    """Một nguồn metrics có tên, trả về một section của snapshot"""
+
+    def __init__(self, name, func, interval, timeout=None, enabled=True, budget=None, default=None, adaptive=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout if timeout is not None else max(interval, 1)
+        self.enabled = enabled
+        # Ngân sách runtime cho mỗi lần chạy, mặc định một nửa timeout
+        self.budget = budget if budget is not None else self.timeout / 2
+        self.default = default
+        # Collector thích ứng: chu kỳ nhân thêm hệ số scale do adaptive sampling đặt
+        self.adaptive = adaptive
+        self.scale = 1.0
+
+        self.result = default
+        self.backoff = 1
+        self.next_due = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skips = 0
+        self.last_runtime = None
+        self.max_runtime = 0.0
+        self.total_runtime = 0.0
+        self.last_success = None
+        # Tăng mỗi lần chạy thành công: consumer so sánh để biết section có giá trị mới hay chỉ là kết quả cũ
+        self.updates = 0
+        self._future = None
+
+    def configure_from_env(self, prefix='COLLECTOR_'):
+        """Đọc COLLECTOR_<NAME>_INTERVAL / _TIMEOUT / _BUDGET / _ENABLED từ .env"""
+        key = prefix + self.name.upper()
+        self.interval = float(os.getenv(f'{key}_INTERVAL', self.interval))
+        self.timeout = float(os.getenv(f'{key}_TIMEOUT', self.timeout))
+        self.budget = float(os.getenv(f'{key}_BUDGET', self.budget))
+        self.enabled = env_bool(f'{key}_ENABLED', self.enabled)
+
+    @property
+    def effective_interval(self):
+        return self.interval * self.backoff * self.scale
+
+    def record(self, runtime, ok):
+        self.runs += 1
+        self.last_runtime = runtime
+        self.total_runtime += runtime
+        self.max_runtime = max(self.max_runtime, runtime)
+        if not ok:
+            self.failures += 1
+        # Vượt ngân sách -> giãn chu kỳ gấp đôi; trong ngân sách -> thu hẹp dần về chu kỳ gốc
+        if runtime > self.budget:
+            if self.backoff < MAX_BACKOFF:
+                self.backoff = min(MAX_BACKOFF, self.backoff * 2)
+                print(f"🐢 Collector '{self.name}' took {runtime:.3f}s (budget {self.budget}s) - interval now {self.effective_interval:.0f}s")
+        elif self.backoff > 1:
+            self.backoff = max(1, self.backoff // 2)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "effective_interval": self.effective_interval,
+            "adaptive": self.adaptive,
+            "timeout": self.timeout,
+            "budget": self.budget,
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skips": self.skips,
+            "last_runtime_ms": round(self.last_runtime * 1000, 2) if self.last_runtime is not None else None,
+            "avg_runtime_ms": round(self.total_runtime / self.runs * 1000, 2) if self.runs else None,
+            "max_runtime_ms": round(self.max_runtime * 1000, 2)
+        }
+
+
+class CollectorRegistry:
+    """Chạy các collector đến hạn trên một thread pool dùng chung và giữ kết quả mới nhất"""
+
+    def __init__(self, max_workers=4, observer=None):
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="collector")
+        # observer(stage, giây, ok) nhận thời gian chạy của từng collector (selfstats)
+        self.observer = observer
+        # Collector.updates đã thấy ở lần take_updated trước
+        self._seen = {}
+
+    def register(self, collector):
+        collector.configure_from_env()
+        self._collectors[collector.name] = collector
+        return collector
+
+    def get(self, name):
+        return self._collectors.get(name)
+
+    def __iter__(self):
+        return iter(list(self._collectors.values()))
+
+    def wake(self, *names):
+        """Đánh dấu các collector là đến hạn ngay (lần run_due kế tiếp sẽ chạy chúng)"""
+        with self._lock:
+            for name in names:
+                collector = self._collectors.get(name)
+                if collector is not None:
+                    collector.next_due = 0.0
+
+    def set_scale(self, scale):
+        """Đặt hệ số chu kỳ cho mọi collector thích ứng; chu kỳ ngắn lại thì lần chạy kế tiếp được kéo gần lại"""
+        with self._lock:
+            now = time.monotonic()
+            for collector in self._collectors.values():
+                if collector.adaptive:
+                    collector.scale = scale
+                    collector.next_due = min(collector.next_due, now + collector.effective_interval)
+
+    def _timed(self, collector):
+        started = time.monotonic()
+        try:
+            return collector.func(), time.monotonic() - started, None
+        except Exception as e:
+            return None, time.monotonic() - started, e
+
+    def _record(self, collector, runtime, ok):
+        collector.record(runtime, ok)
+        if self.observer is not None:
+            self.observer(f"collector.{collector.name}", runtime, ok)
+
+    def run_due(self, force=False):
+        """Chạy các collector đến hạn (hoặc tất cả nếu force), trả về {name: result}"""
+        # Lock chỉ giữ lúc chọn và submit; chờ kết quả ngoài lock để wake()/set_scale() (gọi từ event loop) không bị chặn
+        with self._lock:
+            now = time.monotonic()
+            running = []
+            for collector in self._collectors.values():
+                if not collector.enabled or (not force and now < collector.next_due):
+                    continue
+                if collector._future is not None and not collector._future.done():
+                    # Lần chạy trước vẫn treo (đã quá timeout) -> bỏ qua, không chồng thêm thread
+                    collector.skips += 1
+                    continue
+                collector._future = self._executor.submit(self._timed, collector)
+                collector.next_due = now + collector.effective_interval
+                running.append((collector, collector._future, now + collector.timeout))
+
+        for collector, future, deadline in running:
+            try:
+                result, runtime, error = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                collector.timeouts += 1
+                self._record(collector, collector.timeout, ok=False)
+                print(f"⏱️  Collector '{collector.name}' timed out after {collector.timeout}s")
+                continue
+            if error is not None:
+                self._record(collector, runtime, ok=False)
+                print(f"❌ Collector '{collector.name}' failed: {error}")
+                continue
+            self._record(collector, runtime, ok=True)
+            collector.result = result
+            collector.last_success = time.time()
+            collector.updates += 1
+
+        return {collector.name: collector.result for collector in list(self._collectors.values()) if collector.enabled}
+
+    def take_updated(self):
+        """Tên các collector đang bật đã có kết quả mới kể từ lần gọi trước (dành cho một consumer duy nhất)"""
+        with self._lock:
+            updated = {collector.name for collector in self._collectors.values()
+                       if collector.enabled and collector.updates != self._seen.get(collector.name)}
+            for name in updated:
+                self._seen[name] = self._collectors[name].updates
+            return updated
+
+    def stats(self):
+        return {collector.name: collector.stats() for collector in self._collectors.values()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
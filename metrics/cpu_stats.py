@@ -0,0 +1,90 @@
+"""Tính % sử dụng CPU từ chênh lệch cpu_times giữa hai lần lấy mẫu (không sleep)"""
+import threading
+
+import psutil
+
+# Các mode được báo cáo riêng (chỉ những mode mà nền tảng hiện tại hỗ trợ)
+REPORTED_MODES = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+
+# Delta tối thiểu (giây CPU mỗi core) để kết quả có ý nghĩa, tránh 0%/100% do vài tick lẻ
+MIN_CORE_DELTA = 0.05
+
+
+def _total_time(times):
+    """Tổng thời gian CPU, giống cách psutil tính (guest đã nằm trong user trên Linux)"""
+    total = sum(times)
+    total -= getattr(times, 'guest', 0) + getattr(times, 'guest_nice', 0)
+    return total
+
+
+def _busy_time(times):
+    return _total_time(times) - times.idle - getattr(times, 'iowait', 0)
+
+
+def psutil_cpu_times():
+    """(tổng, [từng core]) qua psutil - nguồn mặc định khi không có fast path procfs"""
+    return psutil.cpu_times(), psutil.cpu_times(percpu=True)
+
+
+def _usage(prev, cur, min_delta=0.0):
+    """% sử dụng tổng và theo từng mode giữa hai mẫu cpu_times"""
+    total_delta = _total_time(cur) - _total_time(prev)
+    if total_delta <= min_delta:
+        return None, None
+    busy_delta = _busy_time(cur) - _busy_time(prev)
+    usage = min(100.0, max(0.0, busy_delta / total_delta * 100))
+    modes = {}
+    for mode in REPORTED_MODES:
+        if hasattr(cur, mode):
+            delta = getattr(cur, mode) - getattr(prev, mode)
+            modes[mode] = round(min(100.0, max(0.0, delta / total_delta * 100)), 2)
+    return round(usage, 2), modes
+
+
+class CpuAccountant:
+    """Giữ cpu_times của lần lấy mẫu trước và tính % sử dụng từ delta"""
+
+    def __init__(self, source=None):
+        """source: hàm trả về (tổng, [từng core]) dạng cpu_times, vd. ProcReader.cpu_times; mặc định psutil"""
+        self._lock = threading.Lock()
+        self._source = source or psutil_cpu_times
+        self._prev_total, self._prev_cores = self._source()
+        self.last = None
+
+    def sample(self):
+        """Tính % CPU tổng, từng core và từng mode kể từ lần gọi trước"""
+        with self._lock:
+            cur_total, cur_cores = self._source()
+
+            min_total_delta = MIN_CORE_DELTA * max(1, len(cur_cores))
+            usage, modes = _usage(self._prev_total, cur_total, min_total_delta)
+            if usage is None:
+                # Delta quá nhỏ để tin cậy -> dùng kết quả trước, hoặc trung bình từ lúc boot
+                if self.last is not None:
+                    return self.last
+                usage, modes = _usage(cur_total._make([0] * len(cur_total)), cur_total)
+
+            # Số core thay đổi (CPU hot-plug) -> đặt lại mốc cho từng core
+            if len(cur_cores) != len(self._prev_cores):
+                self._prev_cores = [core._make([0] * len(core)) for core in cur_cores]
+
+            per_core = []
+            for i, (prev, cur) in enumerate(zip(self._prev_cores, cur_cores)):
+                core_usage, _ = _usage(prev, cur, MIN_CORE_DELTA)
+                if core_usage is None:
+                    if self.last and i < len(self.last['per_core']):
+                        core_usage = self.last['per_core'][i]
+                    else:
+                        core_usage, _ = _usage(cur._make([0] * len(cur)), cur)
+                per_core.append(core_usage)
+
+            self._prev_total = cur_total
+            self._prev_cores = cur_cores
+            self.last = {
+                "usage_percent": usage,
+                "per_core": per_core,
+                "modes": modes or {},
+                # Bộ đếm giây CPU tích luỹ theo mode (counter thật cho Prometheus)
+                "seconds_total": {mode: round(getattr(cur_total, mode), 2) for mode in REPORTED_MODES if hasattr(cur_total, mode)}
+            }
+            return self.last
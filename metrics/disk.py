@@ -0,0 +1,194 @@
+"""Thu thập dung lượng disk theo từng mountpoint với bảng partition được cache và statvfs có timeout"""
+import hashlib
+import os
+import select
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import psutil
+
+MOUNTINFO_PATH = '/proc/self/mountinfo'
+
+
+class MountTable:
+    """Cache bảng partition đã lọc, chỉ đọc lại khi /proc/self/mountinfo thay đổi"""
+
+    def __init__(self, ignore_prefixes=(), ignore_fstypes=(), mountinfo=None):
+        self.ignore_prefixes = tuple(ignore_prefixes)
+        self.ignore_fstypes = set(ignore_fstypes)
+        self.mountinfo = mountinfo or MOUNTINFO_PATH
+        self.refreshes = 0
+        self._partitions = None
+        self._digest = None
+        self._file = None
+        self._poller = None
+        self._open_watch()
+
+    def _open_watch(self):
+        """Kernel báo POLLPRI/POLLERR trên mountinfo mỗi khi mount table đổi"""
+        try:
+            self._file = open(self.mountinfo, 'rb')
+            self._file.read()
+            self._poller = select.poll()
+            self._poller.register(self._file.fileno(), select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            # Không có /proc hoặc poll (macOS/Windows) -> so sánh nội dung mỗi lần
+            self._file = None
+            self._poller = None
+
+    def _changed(self):
+        if self._poller is not None:
+            if not self._poller.poll(0):
+                return False
+            # Đọc lại từ đầu để xoá trạng thái sự kiện
+            self._file.seek(0)
+            self._file.read()
+            return True
+        try:
+            with open(self.mountinfo, 'rb') as f:
+                digest = hashlib.sha1(f.read()).digest()
+        except OSError:
+            return self._partitions is None
+        changed = digest != self._digest
+        self._digest = digest
+        return changed
+
+    def _keep(self, partition):
+        if partition.mountpoint.startswith(self.ignore_prefixes):
+            return False
+        return partition.fstype not in self.ignore_fstypes
+
+    def partitions(self):
+        """Danh sách partition đã lọc (mỗi device/fstype một lần)"""
+        if self._partitions is not None and not self._changed():
+            return self._partitions
+        seen_devices = set()
+        partitions = []
+        for partition in psutil.disk_partitions(all=False):
+            if not self._keep(partition):
+                continue
+            # Chỉ lấy 1 lần cho mỗi device
+            device_key = f"{partition.device}_{partition.fstype}"
+            if device_key in seen_devices:
+                continue
+            seen_devices.add(device_key)
+            partitions.append(partition)
+        self._partitions = partitions
+        self.refreshes += 1
+        return partitions
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _statvfs_usage(mountpoint):
+    st = os.statvfs(mountpoint)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    inodes_used = st.f_files - st.f_ffree
+    return {
+        "total_bytes": total,
+        "used_bytes": used,
+        "free_bytes": free,
+        # Giống psutil: % tính trên phần user thường dùng được (không tính reserved blocks)
+        "usage_percent": round(used / (used + free) * 100, 2) if used + free > 0 else 0,
+        "inodes_total": st.f_files,
+        "inodes_used": inodes_used,
+        "inodes_free": st.f_ffree,
+        "inodes_usage_percent": round(inodes_used / st.f_files * 100, 2) if st.f_files > 0 else 0
+    }
+
+
+def _probe(mountpoint):
+    """statvfs trên một daemon thread riêng, trả về Future
+
+    Không dùng pool cố định: vài mount NFS treo sẽ giữ hết worker và chặn cả các mount khoẻ.
+    Thread treo chỉ tồn tại tới khi statvfs trả về và không giữ process lại lúc thoát (daemon).
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_statvfs_usage(mountpoint))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"statvfs {mountpoint}", daemon=True).start()
+    return future
+
+
+class DiskUsageCollector:
+    """statvfs từng mount trên thread có timeout; mount bị treo (NFS chết) sẽ bị cách ly tạm thời"""
+
+    def __init__(self, mount_table, statvfs_timeout=2.0, quarantine_seconds=300):
+        self.mount_table = mount_table
+        self.statvfs_timeout = statvfs_timeout
+        self.quarantine_seconds = quarantine_seconds
+        self._lock = threading.Lock()
+        # mountpoint -> (quarantine tới thời điểm, future còn treo)
+        self._quarantine = {}
+
+    def _is_quarantined(self, mountpoint, now):
+        entry = self._quarantine.get(mountpoint)
+        if entry is None:
+            return False
+        until, future = entry
+        # Còn trong thời gian cách ly, hoặc lời gọi statvfs cũ vẫn chưa trả về
+        if now < until or not future.done():
+            return True
+        del self._quarantine[mountpoint]
+        print(f"✅ Mount {mountpoint} released from quarantine")
+        return False
+
+    def collect(self):
+        with self._lock:
+            now = time.monotonic()
+            pending = []
+            quarantined = []
+            for partition in self.mount_table.partitions():
+                if self._is_quarantined(partition.mountpoint, now):
+                    quarantined.append(partition.mountpoint)
+                    continue
+                pending.append((partition, _probe(partition.mountpoint)))
+
+            deadline = time.monotonic() + self.statvfs_timeout
+            mounts = {}
+            for partition, future in pending:
+                try:
+                    usage = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeout:
+                    self._quarantine[partition.mountpoint] = (time.monotonic() + self.quarantine_seconds, future)
+                    quarantined.append(partition.mountpoint)
+                    print(f"⚠️  statvfs({partition.mountpoint}) timed out - quarantined for {self.quarantine_seconds}s")
+                    continue
+                except (PermissionError, OSError):
+                    continue
+                usage["device"] = partition.device
+                usage["fstype"] = partition.fstype
+                mounts[partition.mountpoint] = usage
+
+        disk_total = sum(m['total_bytes'] for m in mounts.values())
+        disk_used = sum(m['used_bytes'] for m in mounts.values())
+        disk_free = sum(m['free_bytes'] for m in mounts.values())
+        inodes_total = sum(m['inodes_total'] for m in mounts.values())
+        inodes_used = sum(m['inodes_used'] for m in mounts.values())
+        return {
+            "total_gb": round(disk_total / (1024**3), 2),
+            "used_gb": round(disk_used / (1024**3), 2),
+            "free_gb": round(disk_free / (1024**3), 2),
+            "usage_percent": round((disk_used / disk_total * 100), 2) if disk_total > 0 else 0,
+            "total_bytes": disk_total,
+            "used_bytes": disk_used,
+            "free_bytes": disk_free,
+            "inodes_total": inodes_total,
+            "inodes_used": inodes_used,
+            "inodes_usage_percent": round(inodes_used / inodes_total * 100, 2) if inodes_total > 0 else 0,
+            "mounts": mounts,
+            "quarantined": sorted(quarantined)
+        }
+
+    def shutdown(self):
+        self.mount_table.close()
@@ -0,0 +1,125 @@
+"""Bot API giả lập chạy local để kiểm thử bot và dispatcher (TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot)
+
+Chạy: python fake_botapi.py --port 8081 --chat-rate 1
+Xem các message đã nhận: GET http://127.0.0.1:8081/messages
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeBotApi:
+    """Trạng thái của Bot API giả: message đã nhận và giới hạn tốc độ theo chat giống Telegram"""
+
+    def __init__(self, chat_rate=1.0, latency=0.0, fail_chats=()):
+        self.chat_rate = chat_rate
+        self.latency = latency
+        self.fail_chats = set(str(c) for c in fail_chats)
+        self.messages = []
+        self.flood_responses = 0
+        self._last_sent = {}
+        self._lock = threading.Lock()
+
+    def handle(self, method, params):
+        """Trả về (HTTP status, body) cho một lời gọi Bot API"""
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getMe':
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_agent_bot"}}
+        if method in ('setMyCommands', 'deleteWebhook', 'close', 'logOut'):
+            return 200, {"ok": True, "result": True}
+        if method == 'getUpdates':
+            # Long polling: chờ một chút rồi trả về rỗng
+            time.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+            return 200, {"ok": True, "result": []}
+        if method == 'sendMessage':
+            return self._send_message(params)
+        return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+
+    def _send_message(self, params):
+        chat_id = str(params.get('chat_id'))
+        if chat_id in self.fail_chats:
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_sent.get(chat_id)
+            if self.chat_rate and last is not None and now - last < 1.0 / self.chat_rate:
+                self.flood_responses += 1
+                retry_after = max(1, round(1.0 / self.chat_rate - (now - last)))
+                return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                             "parameters": {"retry_after": retry_after}}
+            self._last_sent[chat_id] = now
+            message_id = len(self.messages) + 1
+            self.messages.append({"chat_id": chat_id, "text": params.get('text'), "parse_mode": params.get('parse_mode'),
+                                  "received_at": time.time()})
+        return 200, {"ok": True, "result": {"message_id": message_id, "date": int(time.time()),
+                                            "chat": {"id": int(chat_id) if chat_id.lstrip('-').isdigit() else 0, "type": "private"},
+                                            "text": params.get('text')}}
+
+
+def _decode_params(body, content_type):
+    if not body:
+        return {}
+    if 'application/json' in content_type:
+        return json.loads(body)
+    params = {}
+    for key, values in parse_qs(body.decode('utf-8'), keep_blank_values=True).items():
+        # python-telegram-bot gửi chuỗi nguyên bản, các kiểu khác đã JSON-encode
+        try:
+            params[key] = json.loads(values[0])
+        except ValueError:
+            params[key] = values[0]
+    return params
+
+
+def make_server(api, host='127.0.0.1', port=8081):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/messages':
+                with api._lock:
+                    self._reply(200, {"messages": api.messages, "flood_responses": api.flood_responses})
+                return
+            self._dispatch(b'', '')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self._dispatch(self.rfile.read(length), self.headers.get('Content-Type', ''))
+
+        def _dispatch(self, body, content_type):
+            # Đường dẫn dạng /bot<token>/<method>
+            method = self.path.rstrip('/').rsplit('/', 1)[-1].split('?', 1)[0]
+            status, payload = api.handle(method, _decode_params(body, content_type))
+            self._reply(status, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--chat-rate', type=float, default=1.0, help='messages per second allowed per chat before 429')
+    parser.add_argument('--latency', type=float, default=0.0, help='artificial latency per request in seconds')
+    parser.add_argument('--fail-chat', action='append', default=[], help='chat ID that always answers 403')
+    args = parser.parse_args()
+
+    server = make_server(FakeBotApi(args.chat_rate, args.latency, args.fail_chat), args.host, args.port)
+    print(f"🤖 Fake Bot API listening on http://{args.host}:{args.port}/bot<token>/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
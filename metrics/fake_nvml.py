@@ -0,0 +1,127 @@
+"""Shim giả lập API pynvml để chạy/kiểm thử GPU collector trên máy không có GPU (GPU_BACKEND=fake)"""
+import os
+from collections import namedtuple
+
+NVML_TEMPERATURE_GPU = 0
+NVML_CLOCK_GRAPHICS = 0
+NVML_CLOCK_SM = 1
+NVML_CLOCK_MEM = 2
+NVML_MEMORY_ERROR_TYPE_CORRECTED = 0
+NVML_MEMORY_ERROR_TYPE_UNCORRECTED = 1
+NVML_VOLATILE_ECC = 0
+NVML_AGGREGATE_ECC = 1
+
+Memory = namedtuple('Memory', 'total used free')
+Utilization = namedtuple('Utilization', 'gpu memory')
+ProcessInfo = namedtuple('ProcessInfo', 'pid usedGpuMemory')
+
+
+class NVMLError(Exception):
+    pass
+
+
+class FakeDevice:
+    """Một GPU giả với thông số cố định, có thể chỉnh trực tiếp khi kiểm thử"""
+
+    def __init__(self, index):
+        self.index = index
+        self.name = 'NVIDIA Fake GPU'
+        self.uuid = f'GPU-00000000-0000-0000-0000-{index:012d}'
+        self.temperature = 40 + index
+        self.utilization = 10 * (index + 1) % 100
+        self.memory_total = 24 * 1024**3
+        self.memory_used = (index + 1) * 1024**3
+        self.power_mw = 75000 + index * 1000
+        self.power_limit_mw = 350000
+        self.fan_speed = 30
+        self.clocks = {NVML_CLOCK_GRAPHICS: 1500, NVML_CLOCK_SM: 1500, NVML_CLOCK_MEM: 9500}
+        self.ecc = {NVML_MEMORY_ERROR_TYPE_CORRECTED: 0, NVML_MEMORY_ERROR_TYPE_UNCORRECTED: 0}
+        self.throttle_reasons = 0x1
+        self.processes = [ProcessInfo(pid=1000 + index, usedGpuMemory=self.memory_used)]
+
+
+devices = []
+_initialized = False
+
+
+def nvmlInit():
+    global _initialized, devices
+    if not devices:
+        devices = [FakeDevice(i) for i in range(int(os.getenv('FAKE_NVML_GPUS', 2)))]
+    _initialized = True
+
+
+def nvmlShutdown():
+    global _initialized
+    _initialized = False
+
+
+def _device(handle):
+    if not _initialized:
+        raise NVMLError('NVML not initialized')
+    return handle
+
+
+def nvmlDeviceGetCount():
+    _device(None)
+    return len(devices)
+
+
+def nvmlDeviceGetHandleByIndex(index):
+    _device(None)
+    return devices[index]
+
+
+def nvmlDeviceGetName(handle):
+    return _device(handle).name
+
+
+def nvmlDeviceGetUUID(handle):
+    return _device(handle).uuid
+
+
+def nvmlDeviceGetTemperature(handle, sensor):
+    return _device(handle).temperature
+
+
+def nvmlDeviceGetUtilizationRates(handle):
+    device = _device(handle)
+    return Utilization(gpu=device.utilization, memory=round(device.memory_used / device.memory_total * 100))
+
+
+def nvmlDeviceGetMemoryInfo(handle):
+    device = _device(handle)
+    return Memory(total=device.memory_total, used=device.memory_used, free=device.memory_total - device.memory_used)
+
+
+def nvmlDeviceGetPowerUsage(handle):
+    return _device(handle).power_mw
+
+
+def nvmlDeviceGetEnforcedPowerLimit(handle):
+    return _device(handle).power_limit_mw
+
+
+def nvmlDeviceGetFanSpeed(handle):
+    return _device(handle).fan_speed
+
+
+def nvmlDeviceGetClockInfo(handle, clock_type):
+    return _device(handle).clocks[clock_type]
+
+
+def nvmlDeviceGetTotalEccErrors(handle, error_type, counter_type):
+    return _device(handle).ecc[error_type]
+
+
+def nvmlDeviceGetCurrentClocksThrottleReasons(handle):
+    return _device(handle).throttle_reasons
+
+
+def nvmlDeviceGetComputeRunningProcesses(handle):
+    return list(_device(handle).processes)
+
+
+def nvmlDeviceGetGraphicsRunningProcesses(handle):
+    _device(handle)
+    return []
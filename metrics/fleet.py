@@ -0,0 +1,232 @@
+"""Chế độ aggregator: poll song song /metrics của nhiều agent qua một connection pool, gộp thành fleet view"""
+import asyncio
+import heapq
+import json
+import math
+import time
+
+import aiohttp
+
+from proctable import SORT_KEYS
+
+# Các giá trị tóm tắt của mỗi host dùng cho fleet view và percentile
+SUMMARY_FIELDS = ('cpu_percent', 'memory_percent', 'disk_percent', 'max_mount_percent', 'load_1min', 'gpu_memory_percent')
+PERCENTILES = (50, 90, 99)
+
+
+def parse_targets(value):
+    """'web1=http://10.0.0.1:1232,http://10.0.0.2:1232' -> [(tên hoặc None, base URL)]"""
+    targets = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition('=')
+        if not sep or '://' in name:
+            name, url = None, item
+        url = url.strip().rstrip('/')
+        if '://' not in url:
+            url = f"http://{url}"
+        targets.append((name.strip() if name else None, url))
+    return targets
+
+
+def percentile(values, q):
+    """Percentile theo nearest-rank trên danh sách đã sắp xếp"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summarize(metrics):
+    """Các chỉ số chính của một snapshot agent"""
+    mounts = (metrics.get('disk') or {}).get('mounts') or {}
+    gpus = metrics.get('gpus') or []
+    return {
+        "cpu_percent": metrics['cpu']['usage_percent'],
+        "memory_percent": metrics['memory']['usage_percent'],
+        "disk_percent": metrics['disk']['usage_percent'],
+        "max_mount_percent": max((m['usage_percent'] for m in mounts.values()), default=None),
+        "load_1min": metrics['cpu'].get('load_1min'),
+        "gpu_memory_percent": max((g['memory']['usage_percent'] for g in gpus), default=None),
+        "uptime_hours": metrics['system'].get('uptime_hours')
+    }
+
+
+class HostState:
+    """Kết quả poll gần nhất của một agent"""
+
+    __slots__ = ('name', 'url', 'hostname', 'metrics', 'summary', 'etag', 'fetched_at', 'latency_ms',
+                 'error', 'failures', 'not_modified')
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.hostname = None
+        self.metrics = None
+        self.summary = None
+        self.etag = None
+        self.fetched_at = None
+        self.latency_ms = None
+        self.error = None
+        self.failures = 0
+        self.not_modified = 0
+
+    @property
+    def label(self):
+        return self.name or self.hostname or self.url
+
+    def status(self, stale_after):
+        if self.metrics is None or self.failures:
+            return 'down'
+        if time.time() - self.fetched_at > stale_after:
+            return 'stale'
+        return 'up'
+
+
+class FleetPoller:
+    """Poll mọi target mỗi 'interval' giây; timeout riêng mỗi target, số kết nối đồng thời giới hạn bởi pool"""
+
+    def __init__(self, targets, interval=10, timeout=3, concurrency=50):
+        self.hosts = [HostState(name, url) for name, url in targets]
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.polls = 0
+        self.last_poll_ms = None
+        self._session = None
+        self._slots = asyncio.Semaphore(concurrency)
+        self._task = None
+
+    def _client(self):
+        if self._session is None:
+            # Một pool dùng chung giữ keep-alive tới từng agent; timeout chỉ tính cho chính request
+            # (chờ lượt trong semaphore không bị tính) nên 200 target với pool 50 không timeout oan
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=2, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  headers={'Accept-Encoding': 'gzip'})
+        return self._session
+
+    async def _fetch(self, host):
+        headers = {'If-None-Match': host.etag} if host.etag and host.metrics is not None else {}
+        try:
+            async with self._slots:
+                started = time.perf_counter()
+                async with self._client().get(f"{host.url}/metrics", headers=headers) as response:
+                    if response.status == 304:
+                        # Agent chưa có snapshot mới -> giữ bản cũ, không tốn băng thông
+                        host.not_modified += 1
+                    elif response.status == 200:
+                        host.metrics = json.loads(await response.read())
+                        host.summary = summarize(host.metrics)
+                        host.hostname = host.metrics['system'].get('hostname')
+                        host.etag = response.headers.get('ETag')
+                    else:
+                        raise aiohttp.ClientResponseError(response.request_info, (), status=response.status,
+                                                          message=response.reason)
+                host.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            host.fetched_at = time.time()
+            host.error = None
+            host.failures = 0
+        except asyncio.TimeoutError:
+            host.failures += 1
+            host.error = f"timeout after {self.timeout:g}s"
+        except (aiohttp.ClientError, ValueError, KeyError, TypeError) as e:
+            host.failures += 1
+            host.error = str(e) or type(e).__name__
+
+    async def poll(self):
+        """Poll tất cả target song song một lần"""
+        started = time.perf_counter()
+        await asyncio.gather(*(self._fetch(host) for host in self.hosts))
+        self.polls += 1
+        self.last_poll_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"❌ Fleet poll failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        self._task = asyncio.create_task(self.run(), name="fleet-poller")
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def top_processes(self, sort='cpu', limit=10):
+        """Top process của toàn fleet: hỏi /processes của các host đang up song song rồi gộp"""
+        hosts = [h for h in self.hosts if h.status(self.stale_after) != 'down']
+
+        async def fetch(host):
+            try:
+                async with self._slots:
+                    async with self._client().get(f"{host.url}/processes",
+                                                  params={'sort': sort, 'limit': str(limit)}) as response:
+                        if response.status != 200:
+                            return []
+                        data = json.loads(await response.read())
+                return [{**p, "host": host.label} for p in data.get('processes', [])]
+            except (asyncio.TimeoutError, aiohttp.ClientError, ValueError):
+                return []
+
+        results = await asyncio.gather(*(fetch(h) for h in hosts))
+        return heapq.nlargest(limit, (p for rows in results for p in rows), key=SORT_KEYS.get(sort, SORT_KEYS['cpu']))
+
+    @property
+    def stale_after(self):
+        return self.interval * 3
+
+    def view(self):
+        """Fleet view: một dòng mỗi host và percentile của từng chỉ số trên các host đang up"""
+        rows = []
+        for host in self.hosts:
+            status = host.status(self.stale_after)
+            rows.append({
+                "host": host.label,
+                "url": host.url,
+                "status": status,
+                "age_seconds": round(time.time() - host.fetched_at, 1) if host.fetched_at else None,
+                "latency_ms": host.latency_ms,
+                "error": host.error,
+                **(host.summary or dict.fromkeys(SUMMARY_FIELDS))
+            })
+        up = [row for row in rows if row["status"] == 'up']
+        summary = {}
+        for field in SUMMARY_FIELDS:
+            values = sorted(row[field] for row in up if row[field] is not None)
+            if values:
+                summary[field] = {
+                    **{f"p{q}": percentile(values, q) for q in PERCENTILES},
+                    "max": values[-1],
+                    "avg": round(sum(values) / len(values), 2)
+                }
+        return {
+            "hosts": rows,
+            "summary": summary,
+            "up": len(up),
+            "stale": sum(1 for row in rows if row["status"] == 'stale'),
+            "down": sum(1 for row in rows if row["status"] == 'down')
+        }
+
+    def stats(self):
+        counts = {'up': 0, 'stale': 0, 'down': 0}
+        for host in self.hosts:
+            counts[host.status(self.stale_after)] += 1
+        return {
+            "targets": len(self.hosts),
+            **counts,
+            "polls": self.polls,
+            "last_poll_ms": self.last_poll_ms,
+            "not_modified": sum(h.not_modified for h in self.hosts)
+        }
@@ -0,0 +1,283 @@
+"""Thu thập metrics của tất cả GPU NVIDIA qua NVML (phiên dài hạn) hoặc luồng nvidia-smi --loop"""
+import shutil
+import subprocess
+import threading
+import time
+
+SMI_QUERY_FIELDS = 'index,name,temperature.gpu,utilization.gpu,memory.total,memory.used,memory.free,power.draw,power.limit,fan.speed,uuid,clocks.gr,clocks.sm,clocks.mem'
+
+# Bitmask lý do giảm xung (nvmlClocksThrottleReason*)
+THROTTLE_REASONS = {
+    0x1: 'gpu_idle',
+    0x2: 'applications_clocks_setting',
+    0x4: 'sw_power_cap',
+    0x8: 'hw_slowdown',
+    0x10: 'sync_boost',
+    0x20: 'sw_thermal_slowdown',
+    0x40: 'hw_thermal_slowdown',
+    0x80: 'hw_power_brake_slowdown',
+    0x100: 'display_clock_setting',
+}
+
+
+def _round(value, digits=1):
+    return round(float(value), digits) if value is not None else None
+
+
+def build_gpu_info(index, name, temperature_c, usage_percent, mem_total_mb, mem_used_mb, mem_free_mb,
+                   power_draw_w, power_limit_w, fan_speed_percent, **extra):
+    """Dict thông tin GPU dùng chung cho mọi backend (giữ nguyên format cũ của get_gpu_info)"""
+    mem_total = mem_total_mb or 0
+    mem_used = mem_used_mb or 0
+    mem_free = mem_free_mb or 0
+    info = {
+        "index": int(index),
+        "name": name,
+        "temperature_c": _round(temperature_c),
+        "usage_percent": _round(usage_percent),
+        "memory": {
+            "total_gb": round(mem_total / 1024, 2),
+            "used_gb": round(mem_used / 1024, 2),
+            "free_gb": round(mem_free / 1024, 2),
+            "free_gb_custom": round((mem_total - mem_used) / 1024, 2),  # total - used
+            "usage_percent": round((mem_used / mem_total * 100), 2) if mem_total > 0 else 0
+        },
+        "power_draw_w": _round(power_draw_w),
+        "power_limit_w": _round(power_limit_w),
+        "fan_speed_percent": _round(fan_speed_percent)
+    }
+    info.update(extra)
+    return info
+
+
+class NvmlBackend:
+    """Giữ một phiên NVML mở suốt vòng đời agent, không fork process mỗi lần lấy mẫu"""
+
+    name = 'nvml'
+
+    def __init__(self, nvml=None):
+        self._nvml = nvml
+        self._handles = None
+
+    def _load(self):
+        if self._handles is not None:
+            return
+        if self._nvml is None:
+            import pynvml  # Chỉ import khi thực sự dùng NVML
+            self._nvml = pynvml
+        self._nvml.nvmlInit()
+        count = self._nvml.nvmlDeviceGetCount()
+        self._handles = [self._nvml.nvmlDeviceGetHandleByIndex(i) for i in range(count)]
+
+    def available(self):
+        try:
+            self._load()
+            return True
+        except Exception:
+            return False
+
+    def _call(self, func, *args):
+        """Gọi hàm NVML, trả về None nếu GPU/driver không hỗ trợ"""
+        try:
+            value = func(*args)
+        except Exception:
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _processes(self, handle):
+        nvml = self._nvml
+        processes = {}
+        for getter in ('nvmlDeviceGetComputeRunningProcesses', 'nvmlDeviceGetGraphicsRunningProcesses'):
+            for proc in self._call(getattr(nvml, getter), handle) or []:
+                used = getattr(proc, 'usedGpuMemory', None)
+                entry = processes.setdefault(proc.pid, {"pid": proc.pid, "used_memory_mb": 0})
+                if used:
+                    entry["used_memory_mb"] += round(used / 1024**2, 1)
+        return sorted(processes.values(), key=lambda p: p["used_memory_mb"], reverse=True)
+
+    def collect(self):
+        self._load()
+        nvml = self._nvml
+        gpus = []
+        for index, handle in enumerate(self._handles):
+            mem = self._call(nvml.nvmlDeviceGetMemoryInfo, handle)
+            util = self._call(nvml.nvmlDeviceGetUtilizationRates, handle)
+            power = self._call(nvml.nvmlDeviceGetPowerUsage, handle)
+            limit = self._call(nvml.nvmlDeviceGetEnforcedPowerLimit, handle)
+            throttle = self._call(nvml.nvmlDeviceGetCurrentClocksThrottleReasons, handle)
+            gpus.append(build_gpu_info(
+                index=index,
+                name=self._call(nvml.nvmlDeviceGetName, handle),
+                temperature_c=self._call(nvml.nvmlDeviceGetTemperature, handle, nvml.NVML_TEMPERATURE_GPU),
+                usage_percent=util.gpu if util else None,
+                mem_total_mb=mem.total / 1024**2 if mem else None,
+                mem_used_mb=mem.used / 1024**2 if mem else None,
+                mem_free_mb=mem.free / 1024**2 if mem else None,
+                power_draw_w=power / 1000 if power is not None else None,
+                power_limit_w=limit / 1000 if limit is not None else None,
+                fan_speed_percent=self._call(nvml.nvmlDeviceGetFanSpeed, handle),
+                uuid=self._call(nvml.nvmlDeviceGetUUID, handle),
+                clocks={
+                    "graphics_mhz": self._call(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_GRAPHICS),
+                    "sm_mhz": self._call(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_SM),
+                    "memory_mhz": self._call(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_MEM)
+                },
+                ecc_errors={
+                    "corrected": self._call(nvml.nvmlDeviceGetTotalEccErrors, handle,
+                                            nvml.NVML_MEMORY_ERROR_TYPE_CORRECTED, nvml.NVML_VOLATILE_ECC),
+                    "uncorrected": self._call(nvml.nvmlDeviceGetTotalEccErrors, handle,
+                                              nvml.NVML_MEMORY_ERROR_TYPE_UNCORRECTED, nvml.NVML_VOLATILE_ECC)
+                },
+                throttle_reasons=[name for bit, name in THROTTLE_REASONS.items() if throttle and throttle & bit],
+                processes=self._processes(handle)
+            ))
+        return gpus
+
+    def close(self):
+        if self._handles is not None:
+            try:
+                self._nvml.nvmlShutdown()
+            except Exception:
+                pass
+            self._handles = None
+
+
+def _smi_number(value):
+    value = value.strip()
+    if not value or value.startswith('[') or value == 'N/A':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_smi_line(line):
+    """Parse một dòng CSV của nvidia-smi --query-gpu (theo SMI_QUERY_FIELDS)"""
+    parts = [p.strip() for p in line.split(',')]
+    if len(parts) < 10 or not parts[0].isdigit():
+        return None
+    return build_gpu_info(
+        index=int(parts[0]),
+        name=parts[1],
+        temperature_c=_smi_number(parts[2]),
+        usage_percent=_smi_number(parts[3]),
+        mem_total_mb=_smi_number(parts[4]),
+        mem_used_mb=_smi_number(parts[5]),
+        mem_free_mb=_smi_number(parts[6]),
+        power_draw_w=_smi_number(parts[7]),
+        power_limit_w=_smi_number(parts[8]),
+        fan_speed_percent=_smi_number(parts[9]),
+        uuid=parts[10] if len(parts) > 10 else None,
+        clocks={
+            "graphics_mhz": _smi_number(parts[11]) if len(parts) > 11 else None,
+            "sm_mhz": _smi_number(parts[12]) if len(parts) > 12 else None,
+            "memory_mhz": _smi_number(parts[13]) if len(parts) > 13 else None
+        }
+    )
+
+
+class SmiStreamBackend:
+    """Một process nvidia-smi --loop chạy lâu dài, thread nền parse từng dòng và giữ giá trị mới nhất"""
+
+    name = 'nvidia-smi'
+
+    def __init__(self, interval_ms=1000, restart_backoff=30):
+        self.interval_ms = interval_ms
+        self.restart_backoff = restart_backoff
+        # Giá trị cũ hơn 2 chu kỳ stream coi như mất (GPU rớt khỏi bus, nvidia-smi kẹt)
+        self.max_age = 2 * interval_ms / 1000
+        # index -> (thời điểm nhận, info)
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._proc = None
+        self._reader = None
+        self._last_start = 0.0
+
+    def available(self):
+        return shutil.which('nvidia-smi') is not None
+
+    def _start(self):
+        self._last_start = time.monotonic()
+        self._proc = subprocess.Popen(
+            ['nvidia-smi', f'--query-gpu={SMI_QUERY_FIELDS}', '--format=csv,noheader,nounits',
+             f'--loop-ms={self.interval_ms}'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+        self._reader = threading.Thread(target=self._read, args=(self._proc,), name="nvidia-smi-reader", daemon=True)
+        self._reader.start()
+
+    def _read(self, proc):
+        for line in proc.stdout:
+            info = parse_smi_line(line)
+            if info is not None:
+                with self._lock:
+                    self._latest[info['index']] = (time.monotonic(), info)
+        # Process đã thoát -> không giữ giá trị cuối cùng như thể vẫn đang đo
+        with self._lock:
+            if self._proc is proc or self._proc is None:
+                self._latest.clear()
+
+    def collect(self):
+        running = self._proc is not None and self._proc.poll() is None
+        if not running and time.monotonic() - self._last_start >= self.restart_backoff:
+            self._start()
+        now = time.monotonic()
+        with self._lock:
+            for index in [i for i, (received, _) in self._latest.items() if now - received > self.max_age]:
+                del self._latest[index]
+            return [self._latest[i][1] for i in sorted(self._latest)]
+
+    def close(self):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        self._proc = None
+
+
+class GpuCollector:
+    """Chọn backend GPU (nvml -> nvidia-smi stream) lúc lấy mẫu đầu tiên"""
+
+    def __init__(self, backend='auto', smi_interval_ms=1000):
+        self.requested = backend
+        self.smi_interval_ms = smi_interval_ms
+        self.backend = None
+        self._resolved = False
+
+    def _resolve(self):
+        self._resolved = True
+        candidates = []
+        if self.requested in ('auto', 'nvml'):
+            candidates.append(NvmlBackend())
+        if self.requested == 'fake':
+            import fake_nvml
+            candidates.append(NvmlBackend(nvml=fake_nvml))
+        if self.requested in ('auto', 'smi', 'nvidia-smi'):
+            candidates.append(SmiStreamBackend(interval_ms=self.smi_interval_ms))
+        for backend in candidates:
+            if backend.available():
+                self.backend = backend
+                print(f"🎮 GPU backend: {backend.name}")
+                return
+
+    def collect(self):
+        """Danh sách thông tin tất cả GPU, [] nếu không có GPU hoặc backend lỗi"""
+        if not self._resolved:
+            self._resolve()
+        if self.backend is None:
+            return []
+        try:
+            return self.backend.collect()
+        except Exception as e:
+            print(f"❌ GPU collection failed ({self.backend.name}): {e}")
+            return []
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
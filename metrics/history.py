@@ -0,0 +1,314 @@
+"""Lưu lịch sử metrics trong RAM: mỗi series là một ring buffer array('d') với số byte cố định cho mỗi mẫu"""
+import math
+import re
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from codec import decode_block
+
+# Mỗi mẫu = timestamp (float64) + giá trị (float64)
+BYTES_PER_SAMPLE = 16
+
+AGGREGATES = ('min', 'max', 'avg', 'last')
+
+# Chu kỳ (giây, theo timestamp mẫu) quét bỏ series đã ngừng cập nhật
+SWEEP_INTERVAL = 60
+
+_DURATION_RE = re.compile(r'^(\d+(?:\.\d+)?)([smhdy]?)$')
+_DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'y': 365 * 86400}
+
+
+def parse_duration(value):
+    """'90', '15m', '2h', '1d', '1y' -> số giây"""
+    match = _DURATION_RE.match(value.strip().lower())
+    if not match:
+        raise ValueError(f"invalid duration '{value}'")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def parse_since(value, now):
+    """Unix timestamp tuyệt đối hoặc khoảng thời gian tương đối ('15m' = 15 phút trước)"""
+    seconds = parse_duration(value)
+    # Số lớn là epoch, số nhỏ/có đơn vị là khoảng lùi về trước
+    if seconds >= 1e9:
+        return seconds
+    return now - seconds
+
+
+def flatten_snapshot(metrics, sources=None):
+    """Rút các giá trị số của snapshot thành {series: value}; series có nhãn dạng 'name:label'
+
+    sources: tên các collector vừa cho kết quả mới (None = tất cả). Section của collector chưa chạy lại
+    chỉ là giá trị cũ lặp lại nên bị bỏ qua, không thành mẫu trùng trong history/alert.
+    """
+    values = {}
+
+    def put(key, value):
+        if value is not None:
+            values[key] = float(value)
+
+    def fresh(name):
+        return sources is None or name in sources
+
+    cpu = metrics['cpu']
+    if fresh('cpu'):
+        put('cpu_usage_percent', cpu['usage_percent'])
+        for core, percent in enumerate(cpu.get('per_core_percent') or []):
+            put(f'cpu_core_percent:{core}', percent)
+        for mode, percent in (cpu.get('modes_percent') or {}).items():
+            put(f'cpu_mode_percent:{mode}', percent)
+    if fresh('load'):
+        put('load_1min', cpu.get('load_1min'))
+        put('load_5min', cpu.get('load_5min'))
+        put('load_15min', cpu.get('load_15min'))
+
+    if fresh('memory'):
+        mem = metrics['memory']
+        put('memory_usage_percent', mem['usage_percent'])
+        put('memory_used_bytes', mem.get('used_bytes'))
+        put('memory_available_bytes', mem.get('available_bytes'))
+
+    disk = metrics['disk']
+    if fresh('disk'):
+        put('disk_usage_percent', disk['usage_percent'])
+        for mountpoint, usage in (disk.get('mounts') or {}).items():
+            put(f'mount_usage_percent:{mountpoint}', usage['usage_percent'])
+            put(f'mount_inodes_usage_percent:{mountpoint}', usage['inodes_usage_percent'])
+    if fresh('disk_io'):
+        put('disk_read_mb_per_sec', disk.get('read_mb_per_sec'))
+        put('disk_write_mb_per_sec', disk.get('write_mb_per_sec'))
+        put('disk_read_iops', disk.get('read_iops'))
+        put('disk_write_iops', disk.get('write_iops'))
+        for device, io in (disk.get('io') or {}).items():
+            put(f'disk_util_percent:{device}', io.get('util_percent'))
+            put(f'disk_await_ms:{device}', io.get('await_ms'))
+
+    if fresh('network'):
+        net = metrics['network']
+        put('network_sent_mb_per_sec', net['sent_mb_per_sec'])
+        put('network_recv_mb_per_sec', net['recv_mb_per_sec'])
+        for nic, stats in (net.get('interfaces') or {}).items():
+            put(f'nic_sent_bytes_per_sec:{nic}', stats.get('sent_bytes_per_sec'))
+            put(f'nic_recv_bytes_per_sec:{nic}', stats.get('recv_bytes_per_sec'))
+
+    if fresh('gpu'):
+        for gpu in metrics.get('gpus') or []:
+            index = gpu['index']
+            put(f'gpu_usage_percent:{index}', gpu['usage_percent'])
+            put(f'gpu_memory_usage_percent:{index}', gpu['memory']['usage_percent'])
+            put(f'gpu_temperature_c:{index}', gpu['temperature_c'])
+            put(f'gpu_power_draw_w:{index}', gpu['power_draw_w'])
+
+    agent = metrics.get('agent')
+    if agent and fresh('agent'):
+        put('agent_cpu_percent', agent['cpu_percent'])
+        put('agent_rss_bytes', agent['rss_bytes'])
+        put('agent_event_loop_lag_ms', agent['event_loop_lag_ms'])
+
+    if fresh('pressure'):
+        for resource, stats in (metrics.get('pressure') or {}).items():
+            put(f'pressure_some_percent:{resource}', stats.get('some_stall_percent'))
+            put(f'pressure_full_percent:{resource}', stats.get('full_stall_percent'))
+
+    if fresh('cgroups'):
+        # Nhãn là đường dẫn cgroup (duy nhất), không phải tên hiển thị: hai unit/container có thể trùng tên
+        for path, group in ((metrics.get('cgroups') or {}).get('groups') or {}).items():
+            put(f"cgroup_cpu_percent:{path}", group['cpu_percent'])
+            put(f"cgroup_memory_bytes:{path}", group['memory_bytes'])
+            put(f"cgroup_memory_pressure_full_percent:{path}", group.get('memory_pressure_full_percent'))
+
+    return values
+
+
+class SeriesRing:
+    """Ring buffer cố định cho một series: hai array('d') cấp phát sẵn, ghi đè mẫu cũ nhất khi đầy"""
+
+    __slots__ = ('capacity', 'times', 'values', 'head', 'count')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0  # Vị trí sẽ ghi mẫu tiếp theo
+        self.count = 0
+
+    def append(self, timestamp, value):
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _slot(self, i):
+        """Vị trí vật lý của mẫu thứ i (0 = cũ nhất)"""
+        return (self.head - self.count + i) % self.capacity
+
+    def first_index(self, since):
+        """Chỉ số logic của mẫu đầu tiên có timestamp >= since (binary search)"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._slot(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def samples(self, since, until):
+        """Duyệt (timestamp, value) trong [since, until] theo thứ tự thời gian"""
+        times, values, capacity = self.times, self.values, self.capacity
+        first = self.first_index(since)
+        slot = self._slot(first)
+        for _ in range(self.count - first):
+            t = times[slot]
+            if t > until:
+                return
+            yield t, values[slot]
+            slot += 1
+            if slot == capacity:
+                slot = 0
+
+    def last(self):
+        if not self.count:
+            return None
+        slot = (self.head - 1) % self.capacity
+        return self.times[slot], self.values[slot]
+
+
+def downsample(samples, step):
+    """Gom mẫu vào các bucket 'step' giây (căn theo bội số của step): [t, min, max, avg, last]"""
+    rows = []
+    bucket = None
+    for t, v in samples:
+        start = math.floor(t / step) * step
+        if start != bucket:
+            if bucket is not None:
+                rows.append([bucket, lo, hi, round(total / n, 4), last])
+            bucket, lo, hi, total, n = start, v, v, 0.0, 0
+        if v < lo:
+            lo = v
+        elif v > hi:
+            hi = v
+        total += v
+        n += 1
+        last = v
+    if bucket is not None:
+        rows.append([bucket, lo, hi, round(total / n, 4), last])
+    return rows
+
+
+class HistoryStore:
+    """Tập ring buffer theo series, giữ tối đa 'retention' giây ở chu kỳ lấy mẫu 'interval'"""
+
+    def __init__(self, retention, interval, max_series=1000):
+        self.retention = retention
+        self.interval = interval
+        self.capacity = int(math.ceil(retention / interval)) + 1
+        self.max_series = max_series
+        self.rejected_series = 0
+        # Mẫu cũ nhất từng ghi (sau restart, RAM chỉ có dữ liệu từ lúc này hoặc từ spill)
+        self.oldest = None
+        # Timestamp mới nhất đã bị ghi đè khỏi một ring đầy: adaptive sampling lấy mẫu nhanh hơn
+        # 'interval' làm ring quay vòng sớm, nên RAM có thể giữ ít hơn 'retention'
+        self.evicted = None
+        # Series không có mẫu mới trong retention (container đã xoá, mount đã gỡ) bị bỏ để nhường chỗ
+        self.expired_series = 0
+        self._last_sweep = None
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def covers(self, since, now=None):
+        """True nếu RAM còn giữ trọn khoảng từ since tới nay (theo mẫu cũ nhất thực sự còn trong ring)"""
+        now = now if now is not None else time.time()
+        if self.oldest is None or since < max(self.oldest, now - self.retention):
+            return False
+        return self.evicted is None or since > self.evicted
+
+    def record(self, timestamp, values):
+        """Thêm một mẫu cho mỗi series; series mới được cấp phát ring buffer lần đầu gặp"""
+        with self._lock:
+            if self.oldest is None or timestamp < self.oldest:
+                self.oldest = timestamp
+            if self._last_sweep is None or timestamp - self._last_sweep >= SWEEP_INTERVAL:
+                self._expire(timestamp)
+            for key, value in values.items():
+                ring = self._series.get(key)
+                if ring is None:
+                    if len(self._series) >= self.max_series:
+                        self.rejected_series += 1
+                        continue
+                    ring = self._series[key] = SeriesRing(self.capacity)
+                elif ring.count and timestamp <= ring.times[(ring.head - 1) % ring.capacity]:
+                    # Bỏ mẫu không tăng dần thời gian để binary search luôn đúng
+                    continue
+                elif ring.count == ring.capacity:
+                    evicted = ring.times[ring.head]
+                    if self.evicted is None or evicted > self.evicted:
+                        self.evicted = evicted
+                ring.append(timestamp, value)
+
+    def _expire(self, now):
+        """Xoá series có mẫu cuối cũ hơn retention; gọi khi đang giữ lock"""
+        self._last_sweep = now
+        cutoff = now - self.retention
+        stale = [key for key, ring in self._series.items() if ring.count and ring.last()[0] < cutoff]
+        for key in stale:
+            del self._series[key]
+        self.expired_series += len(stale)
+
+    def record_snapshot(self, metrics):
+        timestamp = datetime.fromisoformat(metrics['timestamp']).timestamp()
+        self.record(timestamp, flatten_snapshot(metrics))
+
+    def record_block(self, data):
+        """Nạp các snapshot từ một block định dạng gọn (segment spill...), bỏ mẫu đã quá retention"""
+        horizon = time.time() - self.retention
+        count = 0
+        for metrics in decode_block(data):
+            if datetime.fromisoformat(metrics['timestamp']).timestamp() >= horizon:
+                self.record_snapshot(metrics)
+                count += 1
+        return count
+
+    def series(self, prefix=''):
+        with self._lock:
+            return sorted(key for key in self._series if key.startswith(prefix))
+
+    def match(self, metric):
+        """Series đúng tên, hoặc mọi series có nhãn của metric ('cpu_core_percent' -> cpu_core_percent:*)"""
+        with self._lock:
+            if metric in self._series:
+                return [metric]
+            return sorted(key for key in self._series if key.startswith(metric + ':'))
+
+    def query(self, key, since, until=None, step=None):
+        """Mẫu thô [[t, v], ...] hoặc đã gom bucket [[t, min, max, avg, last], ...] nếu có step"""
+        until = until if until is not None else time.time()
+        with self._lock:
+            ring = self._series.get(key)
+            if ring is None:
+                return []
+            if step:
+                return downsample(ring.samples(since, until), step)
+            return [[t, v] for t, v in ring.samples(since, until)]
+
+    def latest(self, key):
+        with self._lock:
+            ring = self._series.get(key)
+            return ring.last() if ring is not None else None
+
+    def stats(self):
+        with self._lock:
+            series = len(self._series)
+            samples = sum(ring.count for ring in self._series.values())
+        return {
+            "series": series,
+            "samples": samples,
+            "capacity_per_series": self.capacity,
+            "retention_seconds": self.retention,
+            "allocated_bytes": series * self.capacity * BYTES_PER_SAMPLE,
+            "rejected_series": self.rejected_series,
+            "expired_series": self.expired_series
+        }
@@ -0,0 +1,338 @@
+"""Ghi InfluxDB theo batch ở thread nền, retry với backoff và lưu tạm ra đĩa khi mất kết nối"""
+import os
+import threading
+import time
+
+from codec import decode_block, encode_block
+
+
+class SpillQueue:
+    """Hàng đợi FIFO trên đĩa có giới hạn dung lượng, mỗi batch là một file segment
+
+    Segment .lp chứa line protocol; segment .snap chứa snapshot ở định dạng gọn (codec.py), nhỏ hơn
+    nhiều lần và được chuyển lại thành line protocol bằng 'render' khi replay.
+    """
+
+    def __init__(self, directory, max_bytes, render=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.render = render
+        self.dropped_lines = 0
+        self.corrupt_segments = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_partial()
+        segments = self._segments()
+        self._next_seq = int(segments[-1].split('.')[0]) + 1 if segments else 0
+
+    def _remove_partial(self):
+        """Xoá file .tmp của lần ghi bị crash trước khi rename (không bao giờ được replay, chỉ tốn chỗ)"""
+        for name in os.listdir(self.directory):
+            if name.endswith(('.lp.tmp', '.snap.tmp')):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                print(f"♻️  Removed partial spill segment {name}")
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(('.lp', '.snap')))
+
+    def _size(self, segments):
+        total = 0
+        for name in segments:
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return total
+
+    def push(self, lines):
+        """Ghi một batch thành segment mới, xoá segment cũ nhất nếu vượt max_bytes"""
+        self._write(('\n'.join(lines) + '\n').encode('utf-8'), 'lp')
+
+    def push_snapshots(self, snapshots):
+        """Ghi các snapshot thành một segment gọn thay vì line protocol"""
+        self._write(encode_block(snapshots), 'snap')
+
+    def _decode(self, name, data):
+        """Nội dung segment -> danh sách dòng line protocol (lỗi nếu segment hỏng)"""
+        if name.endswith('.snap'):
+            return [line for snapshot in decode_block(data) for line in self.render(snapshot)]
+        return [line for line in data.decode('utf-8').split('\n') if line]
+
+    def _count_lines(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if path.endswith('.snap') and not self.render:
+            return 0
+        try:
+            return len(self._decode(path, data))
+        except Exception:
+            # Segment hỏng: không dựng lại được, đếm theo số dòng thô (0 với .snap)
+            return 0 if path.endswith('.snap') else data.count(b'\n')
+
+    def _discard_corrupt(self, name, data, error):
+        """Xoá segment không đọc được để replay không kẹt mãi ở đó; gọi khi đang giữ lock"""
+        self.corrupt_segments += 1
+        if name.endswith('.lp'):
+            self.dropped_lines += data.count(b'\n')
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+        print(f"⚠️  Dropped corrupt spill segment {name} ({len(data)} bytes): {error}")
+
+    def _write(self, data, extension):
+        with self._lock:
+            name = f"{self._next_seq:012d}.{extension}"
+            self._next_seq += 1
+            tmp_path = os.path.join(self.directory, name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # rename là atomic -> crash giữa chừng không để lại segment dở dang
+            os.replace(tmp_path, os.path.join(self.directory, name))
+
+            segments = self._segments()
+            size = self._size(segments)
+            while size > self.max_bytes and len(segments) > 1:
+                oldest = segments.pop(0)
+                path = os.path.join(self.directory, oldest)
+                try:
+                    self.dropped_lines += self._count_lines(path)
+                    size -= os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def peek(self):
+        """Trả về (tên segment, danh sách dòng) của segment cũ nhất, hoặc (None, None)
+
+        Segment hỏng (decode/render lỗi) bị bỏ và tính vào dropped_lines, chuyển sang segment kế tiếp.
+        """
+        while True:
+            with self._lock:
+                segments = self._segments()
+                if not segments:
+                    return None, None
+                name = segments[0]
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    data = f.read()
+            try:
+                return name, self._decode(name, data)
+            except Exception as e:
+                with self._lock:
+                    self._discard_corrupt(name, data, e)
+
+    def snapshot_blocks(self):
+        """Nội dung các segment .snap còn trên đĩa (dùng để nạp lại history sau khi khởi động)"""
+        with self._lock:
+            names = [name for name in self._segments() if name.endswith('.snap')]
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    yield f.read()
+            except FileNotFoundError:
+                continue
+
+    def remove(self, name):
+        with self._lock:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        with self._lock:
+            return len(self._segments())
+
+
+class BatchWriter:
+    """Gom line protocol của nhiều chu kỳ thành một request ghi, flush theo kích thước hoặc thời gian"""
+
+    def __init__(self, write_func, batch_size=5000, flush_interval=10, max_retries=3,
+                 backoff_base=1.0, backoff_max=300.0, spill=None):
+        self.write_func = write_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.spill = spill
+
+        self._cond = threading.Condition()
+        self._pending = []
+        # Snapshot gốc của các dòng đang chờ: spill dạng gọn được khi mọi dòng đều đến từ snapshot
+        self._pending_snapshots = []
+        self._snapshots_complete = True
+        self._flush_requested = 0
+        self._flush_done = 0
+        self._last_flush_ok = True
+        self._stop = False
+        self._thread = None
+
+        self._failures = 0
+        self._next_attempt = 0.0
+        self.written_points = 0
+        self.write_requests = 0
+        self.dropped_points = 0
+
+    def enqueue(self, lines, snapshot=None):
+        """Đưa các dòng line protocol vào hàng đợi (không chặn); kèm snapshot nguồn nếu có"""
+        with self._cond:
+            self._pending.extend(lines)
+            if snapshot is None:
+                self._snapshots_complete = False
+            else:
+                self._pending_snapshots.append(snapshot)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Yêu cầu flush ngay và chờ kết quả, True nếu dữ liệu đã tới InfluxDB"""
+        with self._cond:
+            self._flush_requested += 1
+            ticket = self._flush_requested
+            self._cond.notify_all()
+            if not self._thread or not self._thread.is_alive():
+                return False
+            if not self._cond.wait_for(lambda: self._flush_done >= ticket, timeout=timeout):
+                return False
+            return self._last_flush_ok
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _write_with_retry(self, lines):
+        """Ghi một batch, retry với backoff tăng dần; True nếu thành công"""
+        delay = self.backoff_base
+        for attempt in range(self.max_retries):
+            try:
+                self.write_func(lines)
+                self.write_requests += 1
+                return True
+            except Exception as e:
+                print(f"❌ InfluxDB write failed (attempt {attempt + 1}/{self.max_retries}): {e}")
+                if attempt + 1 < self.max_retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.backoff_max)
+        return False
+
+    def _write_chunks(self, lines):
+        """Ghi theo từng request tối đa batch_size dòng; trả về số dòng đã ghi (dừng ở chunk lỗi đầu tiên)"""
+        written = 0
+        while written < len(lines):
+            chunk = lines[written:written + self.batch_size]
+            if not self._write_with_retry(chunk):
+                break
+            written += len(chunk)
+        return written
+
+    def _mark_failure(self):
+        self._failures += 1
+        backoff = min(self.backoff_base * (2 ** self._failures), self.backoff_max)
+        self._next_attempt = time.monotonic() + backoff
+        print(f"⏸️  InfluxDB unreachable - next attempt in {backoff:.0f}s")
+
+    def _replay_spill(self):
+        """Ghi lại các segment đã spill theo đúng thứ tự, dừng khi gặp lỗi
+
+        Segment lỗi giữa chừng được giữ nguyên và replay lại từ đầu: InfluxDB ghi đè điểm trùng
+        (cùng series, field và timestamp) nên các chunk đã ghi không bị nhân đôi.
+        """
+        while True:
+            name, lines = self.spill.peek()
+            if name is None:
+                return True
+            if self._write_chunks(lines) < len(lines):
+                return False
+            self.spill.remove(name)
+            self.written_points += len(lines)
+            print(f"♻️  Replayed {len(lines)} spilled points to InfluxDB")
+
+    def _park(self, batch, snapshots=None):
+        """Giữ batch lại khi InfluxDB chưa sẵn sàng: spill ra đĩa hoặc bỏ nếu không có spill"""
+        if not batch:
+            return
+        if self.spill is not None and snapshots and self.spill.render is not None:
+            self.spill.push_snapshots(snapshots)
+            print(f"💾 Spilled {len(batch)} points ({len(snapshots)} compact snapshots) to {self.spill.directory}")
+        elif self.spill is not None:
+            self.spill.push(batch)
+            print(f"💾 Spilled {len(batch)} points to {self.spill.directory}")
+        else:
+            self.dropped_points += len(batch)
+            print(f"❌ Dropped {len(batch)} points (InfluxDB unreachable, spill disabled)")
+
+    def _flush_batch(self, batch, snapshots=None):
+        if time.monotonic() < self._next_attempt:
+            # Đang backoff -> không thử ghi, giữ nguyên thứ tự bằng cách spill
+            self._park(batch, snapshots)
+            return False
+
+        if self.spill is not None and len(self.spill) and not self._replay_spill():
+            self._mark_failure()
+            self._park(batch, snapshots)
+            return False
+
+        if batch:
+            written = self._write_chunks(batch)
+            self.written_points += written
+            if written < len(batch):
+                self._mark_failure()
+                # Snapshot không tách theo chunk được -> chỉ spill dạng gọn khi chưa ghi dòng nào
+                self._park(batch[written:], snapshots if not written else None)
+                return False
+            requests = -(-len(batch) // self.batch_size)
+            print(f"✅ Wrote {len(batch)} points to InfluxDB in {requests} request{'s' if requests > 1 else ''}")
+
+        self._failures = 0
+        self._next_attempt = 0.0
+        return True
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            with self._cond:
+                deadline = last_flush + self.flush_interval
+                self._cond.wait_for(
+                    lambda: self._stop
+                    or len(self._pending) >= self.batch_size
+                    or self._flush_requested > self._flush_done
+                    or time.monotonic() >= deadline,
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+                batch, self._pending = self._pending, []
+                snapshots = self._pending_snapshots if self._snapshots_complete else None
+                self._pending_snapshots, self._snapshots_complete = [], True
+                ticket = self._flush_requested
+                stopping = self._stop
+
+            ok = self._flush_batch(batch, snapshots)
+            last_flush = time.monotonic()
+
+            with self._cond:
+                self._last_flush_ok = ok
+                self._flush_done = ticket
+                self._cond.notify_all()
+            if stopping:
+                return
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        """Dừng worker sau khi flush nốt dữ liệu đang chờ"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
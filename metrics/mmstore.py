@@ -0,0 +1,442 @@
+"""Kho metrics bền trên đĩa: mỗi series một file segment ánh xạ bộ nhớ (mmap) gồm các bản ghi cố định, nhiều tầng rollup
+
+Mỗi tầng (vd 10s giữ 2 ngày, 1m giữ 30 ngày, 1h giữ 1 năm) là một ring theo thời gian: bucket b = floor(t / step)
+luôn nằm ở slot b % slots. Ghi là O(1) và cập nhật min/max/tổng/số mẫu/giá trị cuối của bucket hiện tại ở mọi tầng;
+đọc một khoảng thời gian là tối đa hai đoạn liên tục trong file, giải mã thẳng trên mmap (không copy). Dung lượng
+của một series được cấp phát đủ ngay khi tạo nên tổng dung lượng đĩa không vượt quá giới hạn cấu hình.
+
+Mỗi bản ghi mang thời điểm bucket của nó ở đầu và cuối: slot của vòng trước (đã quá retention) hay bản ghi dở dang
+sau khi mất điện đều bị nhận ra và coi như trống, không cần journal hay bước sửa file khi khởi động lại.
+"""
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from urllib.parse import quote
+
+from history import parse_duration
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MAGIC = b'MMSTORE1'
+VERSION = 2
+
+# magic, version, kích thước bản ghi, số tầng, độ dài tên; tiếp theo là thời điểm ghi cuối (u32) ở offset 16
+HEADER = struct.Struct('<8sHHHH')
+UPDATED = struct.Struct('<I')
+UPDATED_OFFSET = 16
+# (step giây, số slot) của từng tầng, từ offset 24
+TIER = struct.Struct('<II')
+TIERS_OFFSET = 24
+MAX_TIERS = 8
+NAME_OFFSET = TIERS_OFFSET + TIER.size * MAX_TIERS
+# Header chiếm trọn một trang nên mọi bản ghi bắt đầu ở bội số 8 byte (float64 luôn căn thẳng hàng)
+HEADER_SIZE = 4096
+MAX_NAME = HEADER_SIZE - NAME_OFFSET
+
+# bucket start (u32), số mẫu, min, max, giá trị cuối, tổng (float64), bucket start lặp lại làm dấu niêm, đệm tới 48 byte.
+# float64 cho cả min/max/last: giá trị lớn (byte, counter) giữ nguyên độ chính xác và không tràn như float32.
+# 48 byte không chia hết 4096 nên một số bản ghi nằm vắt qua hai trang: ghi dở vào bucket mới bị dấu niêm nhận ra,
+# ghi dở khi cập nhật bucket đang có chỉ làm lệch tối đa mẫu cuối cùng của bucket đó.
+RECORD = struct.Struct('<IIddddI4x')
+
+SUFFIX = '.seg'
+
+DEFAULT_TIERS = '10s:2d,1m:30d,1h:365d'
+
+Tier = namedtuple('Tier', 'step retention slots offset')
+
+
+def parse_tiers(spec):
+    """'10s:2d,1m:30d,1h:365d' (step:retention, từ mịn tới thô) -> [Tier]"""
+    tiers = []
+    offset = HEADER_SIZE
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        try:
+            step, retention = (parse_duration(part) for part in item.split(':'))
+        except ValueError:
+            raise ValueError(f"invalid store tier '{item}' (expected step:retention, e.g. 1m:30d)")
+        if step < 1 or step != int(step) or retention < step:
+            raise ValueError(f"invalid store tier '{item}': step must be whole seconds and retention at least one step")
+        if tiers and step <= tiers[-1].step:
+            raise ValueError(f"invalid store tier '{item}': tiers must go from fine to coarse")
+        slots = int(math.ceil(retention / step))
+        tiers.append(Tier(int(step), retention, slots, offset))
+        offset += slots * RECORD.size
+    if not tiers or len(tiers) > MAX_TIERS:
+        raise ValueError(f"metrics store needs 1-{MAX_TIERS} tiers (got '{spec}')")
+    return tiers
+
+
+def segment_size(tiers):
+    """Số byte của một file segment: header + mọi slot của mọi tầng"""
+    return HEADER_SIZE + sum(tier.slots for tier in tiers) * RECORD.size
+
+
+def rollup(records, step):
+    """Gộp bản ghi (start, count, min, max, last, sum) vào bucket 'step' giây: [t, min, max, avg, last]"""
+    rows = []
+    bucket = None
+    for start, count, lo, hi, last, total in records:
+        begin = start - start % step
+        if begin != bucket:
+            if bucket is not None:
+                rows.append([bucket, round(low, 4), round(high, 4), round(sum_ / n, 4), round(final, 4)])
+            bucket, low, high, sum_, n = begin, lo, hi, 0.0, 0
+        if lo < low:
+            low = lo
+        if hi > high:
+            high = hi
+        sum_ += total
+        n += count
+        final = last
+    if bucket is not None:
+        rows.append([bucket, round(low, 4), round(high, 4), round(sum_ / n, 4), round(final, 4)])
+    return rows
+
+
+class Segment:
+    """Một file segment đã map của một series"""
+
+    __slots__ = ('name', 'path', 'mm', 'updated')
+
+    def __init__(self, name, path, mm, updated):
+        self.name = name
+        self.path = path
+        self.mm = mm
+        self.updated = updated
+
+    @classmethod
+    def create(cls, directory, name, tiers, size):
+        """Tạo file ở tên tạm, cấp phát đủ dung lượng, ghi header rồi rename: crash giữa chừng chỉ để lại file .tmp"""
+        encoded = name.encode('utf-8')
+        if len(encoded) > MAX_NAME:
+            raise ValueError(f"series name too long ({len(encoded)} bytes)")
+        path = os.path.join(directory, segment_filename(name))
+        tmp = path + '.tmp'
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_CLOEXEC', 0), 0o644)
+        try:
+            # Cấp phát block thật (không phải file thưa): hết chỗ thì lỗi ở đây thay vì SIGBUS khi ghi vào mmap
+            os.posix_fallocate(fd, 0, size)
+            os.pwrite(fd, header_bytes(name, tiers), 0)
+            os.fsync(fd)
+            os.rename(tmp, path)
+            mm = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        os.close(fd)
+        _fsync_directory(directory)
+        return cls(name, path, mm, 0)
+
+    @classmethod
+    def open(cls, path, tiers, size):
+        """Map một file có sẵn; ValueError nếu header/kích thước không khớp cấu hình tầng hiện tại"""
+        fd = os.open(path, os.O_RDWR | getattr(os, 'O_CLOEXEC', 0))
+        try:
+            header = os.pread(fd, HEADER_SIZE, 0)
+            if len(header) < HEADER_SIZE:
+                raise ValueError("truncated segment")
+            magic, version, record_size, count, name_length = HEADER.unpack_from(header)
+            if magic != MAGIC:
+                raise ValueError("not a metrics store segment")
+            if version != VERSION or record_size != RECORD.size:
+                raise ValueError(f"segment format v{version} is not the current v{VERSION}")
+            if os.fstat(fd).st_size != size:
+                raise ValueError("size does not match the configured tiers")
+            stored = [TIER.unpack_from(header, TIERS_OFFSET + i * TIER.size) for i in range(count)]
+            if stored != [(tier.step, tier.slots) for tier in tiers]:
+                raise ValueError("tiers differ from the configured tiers")
+            name = header[NAME_OFFSET:NAME_OFFSET + name_length].decode('utf-8')
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        return cls(name, path, mm, UPDATED.unpack_from(mm, UPDATED_OFFSET)[0])
+
+    def reset(self, directory, name, tiers):
+        """Dùng lại file của một series đã ngừng ghi cho series mới: xoá mọi bản ghi, ghi header mới"""
+        path = os.path.join(directory, segment_filename(name))
+        self.mm[HEADER_SIZE:] = bytes(len(self.mm) - HEADER_SIZE)
+        self.mm[:HEADER_SIZE] = header_bytes(name, tiers)
+        self.mm.flush()
+        os.rename(self.path, path)
+        _fsync_directory(directory)
+        self.name, self.path, self.updated = name, path, 0
+
+    def write(self, tiers, timestamp, value):
+        """Cập nhật bucket chứa timestamp ở mọi tầng (bỏ qua nếu slot đã thuộc về bucket mới hơn)"""
+        mm = self.mm
+        size = RECORD.size
+        for tier in tiers:
+            step = tier.step
+            start = int(timestamp // step) * step
+            offset = tier.offset + (start // step) % tier.slots * size
+            current, count, lo, hi, _, total, seal = RECORD.unpack_from(mm, offset)
+            if current == start and seal == start and count:
+                if value < lo:
+                    lo = value
+                if value > hi:
+                    hi = value
+                RECORD.pack_into(mm, offset, start, min(count + 1, 0xFFFFFFFF), lo, hi, value, total + value, start)
+            elif seal == current and current > start:
+                # Mẫu đến muộn cho một bucket đã bị vòng mới ghi đè
+                continue
+            else:
+                RECORD.pack_into(mm, offset, start, 1, value, value, value, value, start)
+        self.updated = int(timestamp)
+        UPDATED.pack_into(mm, UPDATED_OFFSET, self.updated)
+
+    def read(self, tier, since, until, averages=False):
+        """Bản ghi hợp lệ (start, count, min, max, last, sum) của các bucket trong [since, until], theo thời gian,
+        hoặc chỉ [start, avg] nếu averages
+
+        Giải mã trực tiếp trên memoryview của mmap: không đọc file, không copy vùng dữ liệu.
+        """
+        step, slots = tier.step, tier.slots
+        first, last = int(since // step), int(until // step)
+        if last < first:
+            return []
+        if last - first + 1 > slots:
+            first = last - slots + 1
+        low, high = first * step, last * step
+        begin = first % slots
+        n = last - first + 1
+        ranges = [(begin, begin + n)] if begin + n <= slots else [(begin, slots), (0, begin + n - slots)]
+        view = memoryview(self.mm)
+        records = []
+        size = RECORD.size
+        for lo, hi in ranges:
+            chunk = view[tier.offset + lo * size:tier.offset + hi * size]
+            if averages:
+                records += [[start, round(total / count, 4)] for start, count, _, _, _, total, seal in RECORD.iter_unpack(chunk)
+                            if seal == start and count and low <= start <= high]
+            else:
+                records += [(start, count, minimum, maximum, final, total)
+                            for start, count, minimum, maximum, final, total, seal in RECORD.iter_unpack(chunk)
+                            if seal == start and count and low <= start <= high]
+            chunk.release()
+        view.release()
+        return records
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.close()
+
+
+def segment_filename(name):
+    """Tên file đọc được từ tên series; tên quá dài được cắt (tên thật luôn nằm trong header)"""
+    quoted = quote(name, safe='')
+    if len(quoted) > 200:
+        quoted = f"{quoted[:160]}~{zlib.crc32(name.encode('utf-8')):08x}"
+    return quoted + SUFFIX
+
+
+def header_bytes(name, tiers):
+    encoded = name.encode('utf-8')
+    header = bytearray(HEADER_SIZE)
+    HEADER.pack_into(header, 0, MAGIC, VERSION, RECORD.size, len(tiers), len(encoded))
+    for i, tier in enumerate(tiers):
+        TIER.pack_into(header, TIERS_OFFSET + i * TIER.size, tier.step, tier.slots)
+    header[NAME_OFFSET:NAME_OFFSET + len(encoded)] = encoded
+    return bytes(header)
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _raise_file_limit(needed):
+    """Mỗi mmap giữ một fd: nâng soft limit RLIMIT_NOFILE (trong hard limit) khi cần"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            pass
+
+
+class MetricsStore:
+    """Tập segment theo series trong một thư mục; tối đa max_bytes // segment_size(tiers) series"""
+
+    def __init__(self, path, tiers=DEFAULT_TIERS, max_bytes=1024**3):
+        self.path = path
+        self.tiers = parse_tiers(tiers) if isinstance(tiers, str) else list(tiers)
+        self.segment_size = segment_size(self.tiers)
+        self.max_series = int(max_bytes // self.segment_size)
+        if self.max_series < 1:
+            raise ValueError(f"metrics store limit is below one series ({self.segment_size / 1024**2:.1f} MB)")
+        # Series ngừng ghi lâu hơn retention của tầng mịn nhất thì file của nó được dùng lại cho series mới
+        self.stale_after = self.tiers[0].retention
+        self.rejected_series = 0
+        self.evicted_series = 0
+        self.discarded_segments = 0
+        self.writes = 0
+        self.last_flush = None
+        self._segments = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        _raise_file_limit(self.max_series + 256)
+        self._load()
+
+    def _load(self):
+        """Map lại các segment còn hợp lệ; file tạm của lần tạo dở và segment sai cấu hình bị xoá"""
+        names = sorted(os.listdir(self.path))
+        for filename in names:
+            path = os.path.join(self.path, filename)
+            if filename.endswith(SUFFIX + '.tmp'):
+                os.unlink(path)
+                continue
+            if not filename.endswith(SUFFIX):
+                continue
+            if len(self._segments) >= self.max_series:
+                print(f"⚠️  Metrics store over its limit: ignoring {filename}")
+                continue
+            try:
+                segment = Segment.open(path, self.tiers, self.segment_size)
+            except (OSError, ValueError, UnicodeDecodeError) as e:
+                print(f"⚠️  Discarding metrics store segment {filename}: {e}")
+                self.discarded_segments += 1
+                os.unlink(path)
+                continue
+            self._segments[segment.name] = segment
+
+    def _allocate(self, name, now):
+        """Segment cho series mới: file mới nếu còn chỗ, không thì dùng lại series ngừng ghi lâu nhất"""
+        if len(self._segments) < self.max_series:
+            return Segment.create(self.path, name, self.tiers, self.segment_size)
+        stale = min(self._segments.values(), key=lambda segment: segment.updated)
+        if now - stale.updated < self.stale_after:
+            return None
+        del self._segments[stale.name]
+        try:
+            stale.reset(self.path, name, self.tiers)
+        except OSError:
+            stale.close()
+            raise
+        self.evicted_series += 1
+        return stale
+
+    def record(self, timestamp, values):
+        """Ghi một mẫu {series: value} vào mọi tầng của từng series"""
+        with self._lock:
+            for key, value in values.items():
+                segment = self._segments.get(key)
+                if segment is None:
+                    try:
+                        segment = self._allocate(key, timestamp)
+                    except (OSError, ValueError) as e:
+                        if not self.rejected_series:
+                            print(f"⚠️  Metrics store cannot add series {key}: {e}")
+                        segment = None
+                    if segment is None:
+                        self.rejected_series += 1
+                        continue
+                    self._segments[key] = segment
+                segment.write(self.tiers, timestamp, value)
+            self.writes += 1
+
+    def series(self, prefix=''):
+        with self._lock:
+            return sorted(key for key in self._segments if key.startswith(prefix))
+
+    def match(self, metric):
+        """Series đúng tên, hoặc mọi series có nhãn của metric (giống HistoryStore.match)"""
+        with self._lock:
+            if metric in self._segments:
+                return [metric]
+            return sorted(key for key in self._segments if key.startswith(metric + ':'))
+
+    def tier_for(self, since, step=None, now=None):
+        """Tầng dùng cho truy vấn: tầng thô nhất có step <= step yêu cầu trong các tầng còn giữ tới since,
+        không có step thì tầng mịn nhất còn giữ tới since"""
+        now = now if now is not None else time.time()
+        covering = [tier for tier in self.tiers if since >= now - tier.retention] or [self.tiers[-1]]
+        if step:
+            fitting = [tier for tier in covering if tier.step <= step]
+            if fitting:
+                return fitting[-1]
+        return covering[0]
+
+    def query(self, key, since, until=None, step=None):
+        """Giống HistoryStore.query: [[t, avg]] ở độ phân giải của tầng, hoặc [[t, min, max, avg, last]] nếu có step"""
+        now = time.time()
+        until = until if until is not None else now
+        tier = self.tier_for(since, step, now)
+        with self._lock:
+            segment = self._segments.get(key)
+            if segment is None:
+                return []
+            if not step:
+                return segment.read(tier, since, until, averages=True)
+            records = segment.read(tier, since, until)
+        return rollup(records, max(int(step), tier.step))
+
+    def latest(self, key):
+        with self._lock:
+            segment = self._segments.get(key)
+            if segment is None or not segment.updated:
+                return None
+            records = segment.read(self.tiers[0], segment.updated, segment.updated)
+        return (records[-1][0], records[-1][4]) if records else None
+
+    def flush(self):
+        """msync mọi segment: giới hạn dữ liệu mất khi mất điện (process crash không mất gì vì trang thuộc page cache)"""
+        with self._lock:
+            segments = list(self._segments.values())
+        for segment in segments:
+            try:
+                segment.flush()
+            except (OSError, ValueError):
+                continue
+        self.last_flush = time.time()
+
+    def stats(self):
+        with self._lock:
+            series = len(self._segments)
+        return {
+            "path": self.path,
+            "tiers": [f"{tier.step}s x {tier.slots}" for tier in self.tiers],
+            "series": series,
+            "max_series": self.max_series,
+            "segment_bytes": self.segment_size,
+            "disk_bytes": series * self.segment_size,
+            "writes": self.writes,
+            "rejected_series": self.rejected_series,
+            "evicted_series": self.evicted_series,
+            "discarded_segments": self.discarded_segments,
+            "last_flush": self.last_flush
+        }
+
+    def close(self):
+        with self._lock:
+            segments, self._segments = list(self._segments.values()), {}
+        for segment in segments:
+            try:
+                segment.flush()
+            finally:
+                segment.close()
@@ -0,0 +1,270 @@
+"""Hàng đợi gửi thông báo Telegram: fan-out song song theo chat, token bucket, RetryAfter và gộp alert"""
+import asyncio
+import time
+from collections import deque
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter
+
+# Giới hạn độ dài message của Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Token bucket cho asyncio: 'rate' token mỗi giây, tối đa 'burst' token dồn lại"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _take(self):
+        """Lấy một token nếu có, ngược lại trả về số giây cần chờ"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, seconds):
+        """Chặn bucket trong 'seconds' giây (Telegram trả về RetryAfter)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class Notification:
+    __slots__ = ('text', 'parse_mode', 'coalesce_key', 'enqueued_at')
+
+    def __init__(self, text, parse_mode, coalesce_key):
+        self.text = text
+        self.parse_mode = parse_mode
+        self.coalesce_key = coalesce_key
+        self.enqueued_at = time.monotonic()
+
+
+class _ChatChannel:
+    """Hàng đợi và worker riêng của một chat, để chat chậm/lỗi không chặn các chat khác"""
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.bucket = bucket
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+
+def _split(text, limit=MAX_MESSAGE_LENGTH):
+    """Cắt message dài theo ranh giới đoạn để không vượt giới hạn của Telegram"""
+    chunks = []
+    current = ''
+    for part in text.split('\n\n'):
+        candidate = f"{current}\n\n{part}" if current else part
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        while len(part) > limit:
+            chunks.append(part[:limit])
+            part = part[limit:]
+        current = part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class NotificationDispatcher:
+    """Gửi message qua bot.send_message với giới hạn tốc độ toàn cục và theo từng chat"""
+
+    def __init__(self, bot, global_rate=25, chat_rate=1, chat_burst=3, coalesce_seconds=2.0,
+                 max_queue=100, max_retries=3, max_concurrency=6, observer=None):
+        self.bot = bot
+        # observer(stage, giây, ok) nhận thời gian của từng lời gọi sendMessage (selfstats)
+        self.observer = observer
+        self.global_bucket = TokenBucket(global_rate, max(1, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce_seconds = coalesce_seconds
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        # Không chiếm hết connection pool của HTTPXRequest, chừa chỗ cho các lệnh bot
+        self._concurrency = asyncio.Semaphore(max_concurrency)
+        self._channels = {}
+        self._latencies = deque(maxlen=500)
+        self._loop = None
+        self._closing = False
+
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.retry_after = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def _channel(self, chat_id):
+        channel = self._channels.get(chat_id)
+        if channel is None:
+            channel = self._channels[chat_id] = _ChatChannel(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+            channel.task = asyncio.create_task(self._worker(channel), name=f"notify-{chat_id}")
+        return channel
+
+    def submit(self, chat_ids, text, parse_mode='Markdown', coalesce_key=None):
+        """Đưa message vào hàng đợi của từng chat (không chờ gửi); phải gọi trong event loop của bot"""
+        if self._closing:
+            return
+        self._loop = self._loop or asyncio.get_running_loop()
+        for chat_id in chat_ids:
+            channel = self._channel(chat_id)
+            if len(channel.pending) >= self.max_queue:
+                channel.pending.popleft()
+                self.dropped += 1
+            channel.pending.append(Notification(text, parse_mode, coalesce_key))
+            channel.wakeup.set()
+
+    def submit_threadsafe(self, chat_ids, text, parse_mode='Markdown', coalesce_key=None):
+        """Giống submit nhưng gọi được từ thread khác (sampler, collector)"""
+        if self._loop is None:
+            raise RuntimeError("dispatcher has not been used inside its event loop yet")
+        self._loop.call_soon_threadsafe(self.submit, chat_ids, text, parse_mode, coalesce_key)
+
+    def bind(self, loop=None):
+        """Gắn dispatcher với event loop hiện tại để submit_threadsafe dùng được ngay"""
+        self._loop = loop or asyncio.get_running_loop()
+
+    async def _worker(self, channel):
+        while True:
+            if not channel.pending:
+                if self._closing:
+                    return
+                channel.wakeup.clear()
+                await channel.wakeup.wait()
+                continue
+
+            first = channel.pending[0]
+            if first.coalesce_key is not None and self.coalesce_seconds > 0 and not self._closing:
+                # Chờ hết cửa sổ gộp để các alert bắn gần nhau đi chung một message
+                remaining = first.enqueued_at + self.coalesce_seconds - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                batch = [n for n in channel.pending if n.coalesce_key == first.coalesce_key]
+                for notification in batch:
+                    channel.pending.remove(notification)
+                self.coalesced += len(batch) - 1
+            else:
+                batch = [channel.pending.popleft()]
+
+            text = '\n\n'.join(n.text for n in batch)
+            ok = True
+            for chunk in _split(text):
+                ok = await self._deliver(channel, chunk, first.parse_mode) and ok
+            now = time.monotonic()
+            for notification in batch:
+                if ok:
+                    self._latencies.append(now - notification.enqueued_at)
+
+    async def _deliver(self, channel, text, parse_mode):
+        attempt = 0
+        migrated = False
+        while True:
+            await self.global_bucket.acquire()
+            await channel.bucket.acquire()
+            try:
+                async with self._concurrency:
+                    # Chỉ tính thời gian gọi Bot API, không tính lúc chờ lượt trong semaphore
+                    started = time.perf_counter()
+                    await self.bot.send_message(chat_id=channel.chat_id, text=text, parse_mode=parse_mode)
+                self.delivered += 1
+                self._observe(started, True)
+                return True
+            except RetryAfter as e:
+                # Flood control: dừng chat này đúng khoảng Telegram yêu cầu rồi thử lại
+                self._observe(started, False)
+                self.retry_after += 1
+                channel.bucket.block(float(e.retry_after))
+                print(f"⏳ Telegram flood limit for {channel.chat_id}, retrying in {e.retry_after}s")
+                continue
+            except BadRequest as e:
+                self._observe(started, False)
+                if parse_mode and 'parse' in str(e).lower():
+                    # Markdown lỗi (ký tự đặc biệt trong tên mount/process) -> gửi lại dạng text thường
+                    parse_mode = None
+                    continue
+                error = e
+            except Forbidden as e:
+                self._observe(started, False)
+                error = e
+            except ChatMigrated as e:
+                # Group được nâng cấp lên supergroup -> gửi tới chat id mới (một lần) và dùng nó cho các message sau
+                self._observe(started, False)
+                if not migrated:
+                    migrated = True
+                    print(f"🔄 Telegram chat {channel.chat_id} migrated to {e.new_chat_id}")
+                    channel.chat_id = e.new_chat_id
+                    continue
+                error = e
+            except NetworkError as e:
+                self._observe(started, False)
+                if attempt < self.max_retries:
+                    attempt += 1
+                    self.retries += 1
+                    await asyncio.sleep(min(30, 2 ** attempt))
+                    continue
+                error = e
+            except Exception as e:
+                # Lỗi không lường trước: tính là gửi thất bại, worker của chat vẫn chạy tiếp
+                self._observe(started, False)
+                error = e
+            self.failed += 1
+            print(f"❌ Failed to send notification to {channel.chat_id}: {error}")
+            return False
+
+    def _observe(self, started, ok):
+        if self.observer is not None:
+            self.observer('telegram.send', time.perf_counter() - started, ok)
+
+    async def stop(self, timeout=10):
+        """Gửi nốt các message đang chờ (tối đa 'timeout' giây) rồi dừng các worker"""
+        self._closing = True
+        tasks = []
+        for channel in self._channels.values():
+            channel.wakeup.set()
+            tasks.append(channel.task)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def pick(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            "queue_depth": sum(len(c.pending) for c in self._channels.values()),
+            "chats": {str(chat_id): len(c.pending) for chat_id, c in self._channels.items()},
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "retry_after": self.retry_after,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "latency_p50_ms": pick(0.5),
+            "latency_p95_ms": pick(0.95),
+            "latency_max_ms": round(latencies[-1] * 1000, 1) if latencies else None
+        }
@@ -0,0 +1,186 @@
+"""Encode snapshot metrics sang định dạng OpenMetrics text cho Prometheus"""
+import math
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PREFIX = 'server_'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _seconds(ms):
+    """Thời gian trong snapshot (ms) sang đơn vị gốc giây của OpenMetrics"""
+    return ms / 1000 if ms is not None else None
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class MetricWriter:
+    """Gom sample theo metric family để mỗi family chỉ có một khối HELP/TYPE"""
+
+    def __init__(self, base_labels):
+        self.base_labels = base_labels
+        self._families = {}
+
+    def add(self, name, metric_type, help_text, value, labels=None, unit=None):
+        """Thêm một sample; counter tự động có hậu tố _total"""
+        if value is None:
+            return
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (metric_type, help_text, unit, [])
+        family[3].append((dict(self.base_labels, **(labels or {})), value))
+
+    def render(self):
+        out = []
+        for name, (metric_type, help_text, unit, samples) in self._families.items():
+            full_name = PREFIX + name
+            out.append(f"# TYPE {full_name} {metric_type}")
+            if unit:
+                out.append(f"# UNIT {full_name} {unit}")
+            out.append(f"# HELP {full_name} {_escape(help_text)}")
+            sample_name = full_name + '_total' if metric_type == 'counter' else full_name
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                out.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+        out.append('# EOF')
+        return '\n'.join(out) + '\n'
+
+
+def encode_openmetrics(metrics):
+    """Chuyển một snapshot (dict từ collect_metrics) thành text OpenMetrics"""
+    w = MetricWriter({"host": metrics['system']['hostname']})
+
+    system = metrics['system']
+    w.add('boot_time_seconds', 'gauge', 'Unix time the host booted', system.get('boot_time'), unit='seconds')
+    w.add('uptime_hours', 'gauge', 'Host uptime in hours', system['uptime_hours'])
+
+    cpu = metrics['cpu']
+    w.add('cpu_logical_cores', 'gauge', 'Number of logical CPU cores', cpu['logical_cores'])
+    w.add('cpu_usage_percent', 'gauge', 'Total CPU utilisation over the last sample interval', cpu['usage_percent'])
+    for mode, percent in cpu.get('modes_percent', {}).items():
+        w.add('cpu_mode_percent', 'gauge', 'CPU utilisation by mode over the last sample interval', percent, {"mode": mode})
+    for mode, seconds in cpu.get('seconds_total', {}).items():
+        w.add('cpu_seconds', 'counter', 'CPU time spent in each mode since boot', seconds, {"mode": mode}, unit='seconds')
+    for core, percent in enumerate(cpu.get('per_core_percent', [])):
+        w.add('cpu_core_usage_percent', 'gauge', 'Per-core CPU utilisation over the last sample interval', percent, {"core": str(core)})
+    w.add('load1', 'gauge', '1-minute load average', cpu['load_1min'])
+    w.add('load5', 'gauge', '5-minute load average', cpu['load_5min'])
+    w.add('load15', 'gauge', '15-minute load average', cpu['load_15min'])
+
+    mem = metrics['memory']
+    w.add('memory_total_bytes', 'gauge', 'Total physical memory', mem.get('total_bytes'), unit='bytes')
+    w.add('memory_used_bytes', 'gauge', 'Used physical memory', mem.get('used_bytes'), unit='bytes')
+    w.add('memory_available_bytes', 'gauge', 'Memory available for new processes', mem.get('available_bytes'), unit='bytes')
+    w.add('memory_usage_percent', 'gauge', 'Memory utilisation', mem['usage_percent'])
+
+    disk = metrics['disk']
+    w.add('disk_total_bytes', 'gauge', 'Total size of monitored filesystems', disk.get('total_bytes'), unit='bytes')
+    w.add('disk_used_bytes', 'gauge', 'Used space on monitored filesystems', disk.get('used_bytes'), unit='bytes')
+    w.add('disk_usage_percent', 'gauge', 'Disk space utilisation', disk['usage_percent'])
+    for mountpoint, usage in disk.get('mounts', {}).items():
+        labels = {"mountpoint": mountpoint, "device": usage['device'], "fstype": usage['fstype']}
+        w.add('filesystem_size_bytes', 'gauge', 'Filesystem size', usage['total_bytes'], labels, unit='bytes')
+        w.add('filesystem_used_bytes', 'gauge', 'Filesystem space in use', usage['used_bytes'], labels, unit='bytes')
+        w.add('filesystem_avail_bytes', 'gauge', 'Filesystem space available to non-root users', usage['free_bytes'], labels, unit='bytes')
+        w.add('filesystem_files', 'gauge', 'Total inodes on the filesystem', usage['inodes_total'], labels)
+        w.add('filesystem_files_free', 'gauge', 'Free inodes on the filesystem', usage['inodes_free'], labels)
+    for mountpoint in disk.get('quarantined', []):
+        w.add('filesystem_quarantined', 'gauge', 'Mount skipped because statvfs timed out', 1, {"mountpoint": mountpoint})
+    for device, io in disk.get('io', {}).items():
+        labels = {"device": device}
+        w.add('disk_read_bytes', 'counter', 'Bytes read from the block device', io['read_bytes'], labels, unit='bytes')
+        w.add('disk_written_bytes', 'counter', 'Bytes written to the block device', io['write_bytes'], labels, unit='bytes')
+        w.add('disk_reads_completed', 'counter', 'Read operations completed', io['read_count'], labels)
+        w.add('disk_writes_completed', 'counter', 'Write operations completed', io['write_count'], labels)
+        w.add('disk_await_ms', 'gauge', 'Average I/O latency over the last sample interval in milliseconds', io['await_ms'], labels)
+        w.add('disk_util_percent', 'gauge', 'Share of the last sample interval the device was busy', io['util_percent'], labels)
+
+    for nic, net in metrics['network'].get('interfaces', {}).items():
+        labels = {"nic": nic}
+        w.add('network_transmit_bytes', 'counter', 'Bytes transmitted by the interface', net['bytes_sent'], labels, unit='bytes')
+        w.add('network_receive_bytes', 'counter', 'Bytes received by the interface', net['bytes_recv'], labels, unit='bytes')
+        w.add('network_transmit_packets', 'counter', 'Packets transmitted by the interface', net['packets_sent'], labels)
+        w.add('network_receive_packets', 'counter', 'Packets received by the interface', net['packets_recv'], labels)
+        w.add('network_errors', 'counter', 'Transmit and receive errors on the interface', net['errors'], labels)
+        w.add('network_drops', 'counter', 'Transmit and receive drops on the interface', net['drops'], labels)
+
+    for gpu in metrics.get('gpus') or ([metrics['gpu']] if metrics.get('gpu') else []):
+        labels = {"gpu": str(gpu['index']), "gpu_name": gpu['name']}
+        w.add('gpu_usage_percent', 'gauge', 'GPU compute utilisation', gpu['usage_percent'], labels)
+        w.add('gpu_temperature_celsius', 'gauge', 'GPU temperature', gpu['temperature_c'], labels, unit='celsius')
+        w.add('gpu_memory_usage_percent', 'gauge', 'GPU memory utilisation', gpu['memory']['usage_percent'], labels)
+        w.add('gpu_memory_used_bytes', 'gauge', 'GPU memory in use', int(gpu['memory']['used_gb'] * 1024**3), labels, unit='bytes')
+        w.add('gpu_power_draw_watts', 'gauge', 'GPU power draw', gpu['power_draw_w'], labels, unit='watts')
+        for clock, mhz in (gpu.get('clocks') or {}).items():
+            w.add('gpu_clock_mhz', 'gauge', 'Current GPU clock in MHz', mhz, dict(labels, clock=clock.replace('_mhz', '')))
+        for kind, count in (gpu.get('ecc_errors') or {}).items():
+            w.add('gpu_ecc_errors', 'counter', 'Volatile ECC errors since driver load', count, dict(labels, type=kind))
+        for reason in gpu.get('throttle_reasons') or []:
+            w.add('gpu_throttle_active', 'gauge', 'Active clock throttle reasons', 1, dict(labels, reason=reason))
+        for proc in gpu.get('processes') or []:
+            w.add('gpu_process_memory_bytes', 'gauge', 'GPU memory used by a process', int(proc['used_memory_mb'] * 1024**2),
+                  dict(labels, pid=str(proc['pid'])), unit='bytes')
+
+    agent = metrics.get('agent')
+    if agent:
+        w.add('agent_cpu_percent', 'gauge', 'CPU used by the agent process (100 = one core)', agent['cpu_percent'])
+        w.add('agent_cpu_seconds', 'counter', 'CPU time used by the agent process', agent['cpu_seconds'], unit='seconds')
+        w.add('agent_resident_memory_bytes', 'gauge', 'Resident memory of the agent process', agent['rss_bytes'], unit='bytes')
+        w.add('agent_threads', 'gauge', 'Threads in the agent process', agent['threads'])
+        w.add('agent_open_fds', 'gauge', 'Open file descriptors of the agent process', agent['open_fds'])
+        w.add('agent_event_loop_lag_seconds', 'gauge', 'Worst event loop lag since the previous sample', _seconds(agent['event_loop_lag_ms']), unit='seconds')
+        w.add('agent_scheduler_lag_seconds', 'gauge', 'Worst scheduled job start delay since the previous sample', _seconds(agent['scheduler_lag_ms']), unit='seconds')
+        w.add('agent_scheduler_missed', 'counter', 'Scheduled job runs missed', agent['scheduler_missed'])
+        w.add('agent_influx_dropped_points', 'counter', 'InfluxDB points dropped', agent.get('influx_dropped_points'))
+        w.add('agent_sample_interval_seconds', 'gauge', 'Current sampling interval (changes with adaptive sampling)', agent.get('sample_interval_seconds'), unit='seconds')
+        for stage, stats in agent['stages'].items():
+            labels = {"stage": stage}
+            w.add('agent_stage_runs', 'counter', 'Times each agent stage ran', stats['count'], labels)
+            w.add('agent_stage_failures', 'counter', 'Failed runs of each agent stage', stats['failures'], labels)
+            w.add('agent_stage_duration_seconds', 'counter', 'Total time spent in each agent stage', _seconds(stats['total_ms']), labels, unit='seconds')
+            w.add('agent_stage_p99_seconds', 'gauge', 'Approximate p99 duration of each agent stage', _seconds(stats['p99_ms']), labels, unit='seconds')
+
+    # PSI: stall tích luỹ (counter, giây) để tự tính rate, cùng % trong chu kỳ và avg của kernel
+    for resource, stats in (metrics.get('pressure') or {}).items():
+        for kind in ('some', 'full'):
+            if f'{kind}_total_us' not in stats:
+                continue
+            labels = {"resource": resource, "kind": kind}
+            w.add('pressure_stalled_seconds', 'counter', 'Time tasks were stalled waiting for the resource', stats[f'{kind}_total_us'] / 1e6, labels, unit='seconds')
+            w.add('pressure_stall_percent', 'gauge', 'Share of wall time stalled since the previous sample', stats[f'{kind}_stall_percent'], labels)
+            for window in ('avg10', 'avg60', 'avg300'):
+                w.add(f'pressure_{window}', 'gauge', f'Kernel {window} stall percentage', stats[f'{kind}_{window}'], labels)
+
+    # Mỗi cgroup v2 (container, service, slice...) một bộ series theo nhãn cgroup/name/kind
+    cgroups = metrics.get('cgroups')
+    if cgroups:
+        w.add('cgroups', 'gauge', 'Cgroups found in the cgroup v2 tree', cgroups['count'])
+        for path, group in cgroups['groups'].items():
+            labels = {"cgroup": path, "name": group['name'], "kind": group['kind']}
+            w.add('cgroup_cpu_seconds', 'counter', 'CPU time used by the cgroup', group['cpu_usage_seconds'], labels, unit='seconds')
+            w.add('cgroup_cpu_percent', 'gauge', 'CPU used by the cgroup (100 = one core)', group['cpu_percent'], labels)
+            w.add('cgroup_cpu_throttled_percent', 'gauge', 'Share of CFS periods in which the cgroup was throttled', group['cpu_throttled_percent'], labels)
+            w.add('cgroup_memory_bytes', 'gauge', 'Memory charged to the cgroup', group['memory_bytes'], labels, unit='bytes')
+            w.add('cgroup_memory_limit_bytes', 'gauge', 'Memory limit of the cgroup', group['memory_limit_bytes'], labels, unit='bytes')
+            w.add('cgroup_pids', 'gauge', 'Tasks in the cgroup', group['pids'], labels)
+            w.add('cgroup_io_read_bytes', 'counter', 'Bytes read by the cgroup', group['io_read_bytes'], labels, unit='bytes')
+            w.add('cgroup_io_written_bytes', 'counter', 'Bytes written by the cgroup', group['io_write_bytes'], labels, unit='bytes')
+            for resource in ('cpu', 'memory', 'io'):
+                for kind in ('some', 'full'):
+                    w.add('cgroup_pressure_stall_percent', 'gauge', 'Share of wall time tasks in the cgroup were stalled since the previous sample',
+                          group.get(f'{resource}_pressure_{kind}_percent'), dict(labels, resource=resource, kind=kind))
+
+    return w.render()
+
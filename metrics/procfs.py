@@ -0,0 +1,303 @@
+"""Fast path Linux: đọc trực tiếp /proc/stat, meminfo, net/dev và diskstats thay cho psutil
+
+Mỗi file được mở một lần, mỗi lần lấy mẫu chỉ là một preadv ở offset 0 vào buffer dùng lại rồi parse ngay
+trên bytes. Kết quả cùng đơn vị và cách tính với psutil (giây CPU, byte, ms) nên CpuAccountant, NetworkRates
+và DiskRates dùng được như nguồn psutil. /proc/loadavg không cần: os.getloadavg() (psutil.getloadavg) đã là
+một lời gọi C duy nhất và nhanh hơn pread + parse trong Python.
+
+Kiểm tra với psutil:  python procfs.py --check [thư mục /proc đã ghi lại]
+Ghi lại /proc hiện tại làm fixture:  python procfs.py --record DIR
+"""
+import json
+import math
+import os
+import shutil
+import sys
+import threading
+from collections import namedtuple
+
+# Thư mục procfs (benchmark trỏ sang cây /proc giả lập hoặc bản ghi lại)
+PROC_PATH = '/proc'
+
+# Các file fast path đọc, cũng là nội dung của một bản ghi /proc
+FILES = ('stat', 'meminfo', 'net/dev', 'diskstats')
+
+CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice')
+NET_FIELDS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin', 'errout', 'dropin', 'dropout')
+DISK_FIELDS = ('read_count', 'write_count', 'read_bytes', 'write_bytes', 'read_time', 'write_time',
+               'read_merged_count', 'write_merged_count', 'busy_time')
+
+# /proc/diskstats luôn đếm theo sector 512 byte, bất kể kích thước sector thật của thiết bị
+SECTOR_SIZE = 512
+
+# Parse cả mảng số nguyên trong C thay vì gọi int() cho từng token
+_parse_ints = json.JSONDecoder().decode
+
+vmem = namedtuple('vmem', 'total available percent used free buffers cached shared')
+
+
+class ProcFile:
+    """Một file /proc giữ fd mở; read() là một preadv ở offset 0, kernel sinh lại nội dung mỗi lần"""
+
+    def __init__(self, path, size=8192):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+        self._buffer = bytearray(size)
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            while True:
+                n = os.preadv(self._fd, [self._buffer], 0)
+                if n < len(self._buffer):
+                    return bytes(memoryview(self._buffer)[:n])
+                # Buffer đầy -> có thể còn dữ liệu (nhiều core/NIC/device): nới gấp đôi và đọc lại từ đầu
+                self._buffer = bytearray(len(self._buffer) * 2)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+def _meminfo_bytes(data, key):
+    """Giá trị của một dòng meminfo (kB -> byte), None nếu kernel không có dòng này"""
+    start = data.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    return int(data[start:data.index(b'\n', start)].split()[0]) * 1024
+
+
+class ProcReader:
+    """Đọc các metric nóng từ procfs với cùng kết quả như psutil.cpu_times/virtual_memory/
+    net_io_counters(pernic=True)/disk_io_counters(perdisk=True)
+
+    Khác psutil: bộ đếm mạng/disk là giá trị thô (không bù tràn như nowrap) vì CounterRates đã tự xử lý tràn.
+    """
+
+    def __init__(self, root=None):
+        if not sys.platform.startswith('linux'):
+            raise OSError("procfs fast path is only available on Linux")
+        self.root = root or PROC_PATH
+        self._ticks = os.sysconf('SC_CLK_TCK')
+        self._files = {}
+        try:
+            for name in FILES:
+                self._files[name] = ProcFile(os.path.join(self.root, name))
+        except OSError:
+            self.close()
+            raise
+        # Số trường CPU tuỳ phiên bản kernel (7-10), giống namedtuple scputimes của psutil
+        first = self._files['stat'].read().split(b'\n', 1)[0].split()
+        self._cpu_columns = len(first) - 1
+        self._cpu_width = min(self._cpu_columns, len(CPU_FIELDS))
+        self._cputimes = namedtuple('scputimes', CPU_FIELDS[:self._cpu_width])
+        # Tên NIC/device ít khi đổi -> decode một lần
+        self._names = {}
+
+    def _name(self, raw):
+        name = self._names.get(raw)
+        if name is None:
+            name = self._names[raw] = raw.decode('utf-8', 'replace')
+        return name
+
+    def cpu_times(self):
+        """(tổng, [từng core]) từ một lần đọc /proc/stat, giây CPU như psutil.cpu_times()/cpu_times(percpu=True)"""
+        data = self._files['stat'].read()
+        # Các dòng cpu liền nhau ở đầu file: cắt tới hết dòng cpu cuối, bỏ qua dòng intr rất dài
+        end = data.find(b'\n', data.rfind(b'\ncpu') + 1)
+        tokens = (data[:end] if end >= 0 else data).split()
+        # Mọi dòng cpu có cùng số cột: bỏ nhãn cpuN theo bước cố định, số còn lại parse một lượt bằng parser C của json
+        step = self._cpu_columns + 1
+        del tokens[::step]
+        ticks = self._ticks
+        values = [v / ticks for v in _parse_ints('[' + b','.join(tokens).decode('ascii') + ']')]
+        make, width, columns = self._cputimes._make, self._cpu_width, self._cpu_columns
+        rows = [make(values[i:i + width]) for i in range(0, len(values), columns)]
+        return rows[0], rows[1:]
+
+    def virtual_memory(self):
+        """total/available/used/percent theo cách tính của psutil.virtual_memory() (giống lệnh free)"""
+        data = self._files['meminfo'].read()
+        total = _meminfo_bytes(data, b'MemTotal:')
+        free = _meminfo_bytes(data, b'\nMemFree:')
+        buffers = _meminfo_bytes(data, b'\nBuffers:') or 0
+        cached = (_meminfo_bytes(data, b'\nCached:') or 0) + (_meminfo_bytes(data, b'\nSReclaimable:') or 0)
+        shared = _meminfo_bytes(data, b'\nShmem:') or 0
+        used = total - free - cached - buffers
+        if used < 0:
+            # Trong container LXC các giá trị này có thể lệch -> tính như psutil
+            used = total - free
+        available = _meminfo_bytes(data, b'\nMemAvailable:')
+        if not available:
+            # Kernel < 3.14 (hoặc MemAvailable = 0): ước lượng như psutil trước 4.4
+            available = free + buffers + cached
+        percent = round((total - available) / total * 100, 1) if total else 0.0
+        return vmem(total, available, percent, used, free, buffers, cached, shared)
+
+    def net_io_counters(self):
+        """{nic: {bytes_sent, bytes_recv, packets_sent, packets_recv, errin, errout, dropin, dropout}}"""
+        data = self._files['net/dev'].read()
+        counters = {}
+        # Bỏ 2 dòng tiêu đề
+        for line in data.split(b'\n')[2:]:
+            colon = line.rfind(b':')
+            if colon < 0:
+                continue
+            f = line[colon + 1:].split()
+            counters[self._name(line[:colon].strip())] = {
+                'bytes_sent': int(f[8]),
+                'bytes_recv': int(f[0]),
+                'packets_sent': int(f[9]),
+                'packets_recv': int(f[1]),
+                'errin': int(f[2]),
+                'errout': int(f[10]),
+                'dropin': int(f[3]),
+                'dropout': int(f[11])
+            }
+        return counters
+
+    def disk_io_counters(self):
+        """{device: {read_count, write_count, read_bytes, write_bytes, read_time, write_time, ...}} gồm cả partition"""
+        data = self._files['diskstats'].read()
+        counters = {}
+        for line in data.split(b'\n'):
+            f = line.split()
+            n = len(f)
+            if n == 14 or n >= 18:
+                # Linux 2.6+, dòng của cả disk (4.18+ thêm 4 trường discard, 5.5+ thêm 2 trường flush)
+                name = f[2]
+                reads, reads_merged, rsectors, rtime, writes, writes_merged, wsectors, wtime = f[3:11]
+                busy = f[12]
+            elif n == 7:
+                # Partition trên kernel cũ chỉ có 4 bộ đếm
+                name = f[2]
+                reads, rsectors, writes, wsectors = f[3:7]
+                rtime = wtime = reads_merged = writes_merged = busy = 0
+            elif n == 15:
+                # Linux 2.4
+                name = f[3]
+                reads = f[2]
+                reads_merged, rsectors, rtime, writes, writes_merged, wsectors, wtime = f[4:11]
+                busy = f[12]
+            else:
+                continue
+            counters[self._name(name)] = {
+                'read_count': int(reads),
+                'write_count': int(writes),
+                'read_bytes': int(rsectors) * SECTOR_SIZE,
+                'write_bytes': int(wsectors) * SECTOR_SIZE,
+                'read_time': int(rtime),
+                'write_time': int(wtime),
+                'read_merged_count': int(reads_merged),
+                'write_merged_count': int(writes_merged),
+                'busy_time': int(busy)
+            }
+        return counters
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+def open_reader(mode='auto', root=None):
+    """ProcReader theo PROCFS_FAST_PATH: off -> None; auto -> None nếu không dùng được; on -> lỗi nếu không dùng được"""
+    if mode == 'off':
+        return None
+    try:
+        return ProcReader(root)
+    except OSError:
+        if mode == 'on':
+            raise
+        return None
+
+
+# ---------- kiểm tra với psutil ----------
+
+def _close(a, b, rel_tol, abs_tol):
+    return a is not None and b is not None and math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol)
+
+
+def compare_with_psutil(root=None, rel_tol=0.01, abs_tol=1.0):
+    """[(metric, fast path, psutil)] lệch quá tolerance; psutil đọc cùng thư mục qua psutil.PROCFS_PATH
+
+    Trên bản ghi /proc (file tĩnh) hai bên phải khớp tuyệt đối; trên /proc thật cần tolerance vì bộ đếm
+    tăng giữa hai lần đọc.
+    """
+    import psutil
+
+    reader = ProcReader(root)
+    saved = psutil.PROCFS_PATH
+    psutil.PROCFS_PATH = reader.root
+    mismatches = []
+
+    def check(metric, fast, reference):
+        if not _close(fast, reference, rel_tol, abs_tol):
+            mismatches.append((metric, fast, reference))
+
+    try:
+        total, cores = reader.cpu_times()
+        ref_total, ref_cores = psutil.cpu_times(), psutil.cpu_times(percpu=True)
+        check('cpu.fields', len(total), len(ref_total))
+        check('cpu.cores', len(cores), len(ref_cores))
+        for field in ref_total._fields:
+            check(f'cpu.{field}', getattr(total, field, None), getattr(ref_total, field))
+        for i, (core, ref) in enumerate(zip(cores, ref_cores)):
+            for field in ref._fields:
+                check(f'cpu{i}.{field}', getattr(core, field, None), getattr(ref, field))
+
+        memory, ref_memory = reader.virtual_memory(), psutil.virtual_memory()
+        for field in ('total', 'available', 'used', 'free', 'buffers', 'cached', 'shared', 'percent'):
+            check(f'memory.{field}', getattr(memory, field), getattr(ref_memory, field))
+
+        for name, (fast, reference) in (('net', (reader.net_io_counters(), psutil.net_io_counters(pernic=True, nowrap=False))),
+                                        ('disk', (reader.disk_io_counters(), psutil.disk_io_counters(perdisk=True, nowrap=False)))):
+            check(f'{name}.devices', len(fast), len(reference))
+            for dev, ref in reference.items():
+                for field in ref._fields:
+                    check(f'{name}.{dev}.{field}', (fast.get(dev) or {}).get(field), getattr(ref, field))
+    finally:
+        psutil.PROCFS_PATH = saved
+        reader.close()
+    return mismatches
+
+
+def record(target, root=None):
+    """Chép các file fast path đọc (stat, meminfo, ...) từ procfs sang target để làm fixture"""
+    root = root or PROC_PATH
+    for name in FILES:
+        path = os.path.join(target, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(os.path.join(root, name), 'rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the procfs fast path against psutil')
+    parser.add_argument('--check', nargs='?', const=PROC_PATH, metavar='DIR', help='procfs directory or recorded fixture')
+    parser.add_argument('--record', metavar='DIR', help='copy the files read by the fast path into DIR')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='relative tolerance for a live /proc')
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record(args.record)
+        print(f"💾 Recorded {', '.join(FILES)} into {args.record}")
+    if args.check or not args.record:
+        root = args.check or PROC_PATH
+        live = os.path.realpath(root) == '/proc'
+        mismatches = compare_with_psutil(root, rel_tol=args.tolerance if live else 1e-9, abs_tol=1.0 if live else 1e-9)
+        for metric, fast, reference in mismatches:
+            print(f"❌ {metric}: fast path {fast} != psutil {reference}")
+        if mismatches:
+            return 1
+        print(f"✅ procfs fast path matches psutil on {root}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,104 @@
+"""Bảng process lấy mẫu một lượt, tính CPU% từ delta cpu_times và chọn top N bằng heap"""
+import heapq
+import threading
+import time
+
+import psutil
+
+# Các tiêu chí sắp xếp được hỗ trợ cho top N
+SORT_KEYS = {
+    'cpu': lambda p: (p['cpu_percent'], p['rss_bytes']),
+    'mem': lambda p: (p['rss_bytes'], p['cpu_percent']),
+    'rss': lambda p: (p['rss_bytes'], p['cpu_percent']),
+    'io': lambda p: (p['io_bytes_per_sec'] or 0, p['cpu_percent']),
+    'files': lambda p: (p['open_files'] or 0, p['rss_bytes']),
+}
+
+PROCESS_ATTRS = ['pid', 'name', 'username', 'create_time', 'cpu_times', 'memory_info', 'memory_percent', 'num_threads']
+
+
+class ProcessTable:
+    """Giữ cpu_times/io của từng process giữa các lần lấy mẫu, không sleep theo từng process"""
+
+    def __init__(self, with_io=True, with_files=True):
+        self.with_io = with_io
+        self.with_files = with_files
+        self._lock = threading.Lock()
+        # (pid, create_time) -> (cpu seconds, io bytes) ở lần lấy mẫu trước
+        self._prev = {}
+        self._prev_time = None
+        self.processes = []
+        self.sampled_at = None
+        self.sample_duration = None
+
+    def sample(self):
+        """Một lượt process_iter qua tất cả process, trả về danh sách dict"""
+        started = time.monotonic()
+        cpu_count = psutil.cpu_count() or 1
+        attrs = list(PROCESS_ATTRS)
+        if self.with_io:
+            attrs.append('io_counters')
+        if self.with_files and hasattr(psutil.Process, 'num_fds'):
+            attrs.append('num_fds')
+
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._prev_time if self._prev_time is not None else None
+            current = {}
+            processes = []
+            # process_iter(attrs) đọc mọi thuộc tính trong oneshot(), lỗi quyền trả về None
+            for proc in psutil.process_iter(attrs, ad_value=None):
+                info = proc.info
+                if info['create_time'] is None or info['cpu_times'] is None:
+                    continue
+                key = (info['pid'], info['create_time'])
+                cpu_seconds = info['cpu_times'].user + info['cpu_times'].system
+                io = info.get('io_counters')
+                io_bytes = io.read_bytes + io.write_bytes if io is not None else None
+                current[key] = (cpu_seconds, io_bytes)
+
+                prev = self._prev.get(key)
+                cpu_percent = 0.0
+                io_rate = None
+                if prev is not None and elapsed:
+                    # Chuẩn hoá CPU về 100% (chia cho số cores)
+                    cpu_percent = max(0.0, (cpu_seconds - prev[0]) / elapsed / cpu_count * 100)
+                    if io_bytes is not None and prev[1] is not None:
+                        io_rate = max(0.0, (io_bytes - prev[1]) / elapsed)
+                memory_info = info['memory_info']
+                processes.append({
+                    'pid': info['pid'],
+                    'name': info['name'] or '?',
+                    'username': info['username'],
+                    'cpu_percent': round(cpu_percent, 2),
+                    'memory_percent': round(info['memory_percent'] or 0, 2),
+                    'rss_bytes': memory_info.rss if memory_info is not None else 0,
+                    'num_threads': info['num_threads'],
+                    'io_bytes_per_sec': round(io_rate, 2) if io_rate is not None else None,
+                    'open_files': info.get('num_fds')
+                })
+
+            # Process đã thoát thì tự rơi khỏi bảng mốc
+            self._prev = current
+            self._prev_time = now
+            self.processes = processes
+            self.sampled_at = time.time()
+            self.sample_duration = time.monotonic() - started
+            return processes
+
+    def top(self, n=10, sort='cpu', processes=None):
+        """Top N theo cpu/mem/rss/io/files bằng heap (O(P log N) thay vì sort toàn bộ)"""
+        key = SORT_KEYS.get(sort)
+        if key is None:
+            raise ValueError(f"Unknown sort key '{sort}', expected one of {', '.join(SORT_KEYS)}")
+        if processes is None:
+            with self._lock:
+                processes = self.processes
+        return heapq.nlargest(n, processes, key=key)
+
+    def stats(self):
+        return {
+            "count": len(self.processes),
+            "sampled_at": self.sampled_at,
+            "sample_duration_ms": round(self.sample_duration * 1000, 2) if self.sample_duration is not None else None
+        }
@@ -0,0 +1,189 @@
+"""Pressure Stall Information (PSI): thời gian task bị chặn vì thiếu CPU, RAM hoặc IO
+
+Khác CPU%/RAM%: RAM 95% mà phần lớn là page cache thì 'memory full' vẫn 0, còn máy đang thrashing ở RAM 60%
+thì stall tăng vọt. Tín hiệu chính là stall time tăng thêm trong mỗi chu kỳ (delta của total, micro giây) quy ra
+% thời gian; avg10/avg60/avg300 của kernel được giữ nguyên để tham khảo. Trigger PSI (ghi ngưỡng vào file
+pressure rồi poll POLLPRI) cho phép kernel đánh thức agent ngay khi stall vượt ngưỡng trong một cửa sổ.
+"""
+import os
+import select
+import threading
+import time
+
+from procfs import ProcFile
+from rates import CounterRates
+
+PRESSURE_PATH = '/proc/pressure'
+
+RESOURCES = ('cpu', 'memory', 'io')
+
+# some: ít nhất một task bị chặn; full: mọi task không idle cùng bị chặn (cpu 'full' chỉ có từ kernel 5.13)
+KINDS = ('some', 'full')
+
+# Giới hạn cửa sổ trigger của kernel (micro giây)
+TRIGGER_MIN_WINDOW = 500000
+TRIGGER_MAX_WINDOW = 10000000
+
+
+def parse_pressure(data):
+    """'some avg10=.. avg60=.. avg300=.. total=..' (và dòng full) -> {'some': (avg10, avg60, avg300, total_us)}"""
+    result = {}
+    for line in data.split(b'\n'):
+        kind, _, fields = line.partition(b' ')
+        if not fields:
+            continue
+        avg10, avg60, avg300, total = (field.partition(b'=')[2] for field in fields.split())
+        result[kind.decode('ascii')] = (float(avg10), float(avg60), float(avg300), int(total))
+    return result
+
+
+def stall_fields(parsed, elapsed, deltas):
+    """Số đo của một file pressure: avg của kernel, total tích luỹ và % thời gian bị stall trong chu kỳ"""
+    fields = {}
+    for kind in KINDS:
+        if kind not in parsed:
+            continue
+        avg10, avg60, avg300, total = parsed[kind]
+        fields[f"{kind}_avg10"] = avg10
+        fields[f"{kind}_avg60"] = avg60
+        fields[f"{kind}_avg300"] = avg300
+        fields[f"{kind}_total_us"] = total
+        fields[f"{kind}_stall_percent"] = stall_percent(deltas.get(kind), elapsed)
+    return fields
+
+
+def stall_percent(usec_delta, elapsed):
+    """Micro giây stall tăng thêm trong chu kỳ -> % thời gian thực (tối đa 100)"""
+    if usec_delta is None or not elapsed or elapsed <= 0:
+        return None
+    return round(min(100.0, usec_delta / 1e6 / elapsed * 100), 2)
+
+
+class PressureMonitor:
+    """Đọc /proc/pressure/{cpu,memory,io} bằng fd giữ mở và tính stall theo chu kỳ"""
+
+    def __init__(self, path=None):
+        self.path = path or PRESSURE_PATH
+        self._files = {}
+        for resource in RESOURCES:
+            try:
+                self._files[resource] = ProcFile(os.path.join(self.path, resource), size=512)
+            except OSError:
+                continue
+        if not self._files:
+            # Kernel < 4.20, CONFIG_PSI tắt hoặc boot với psi=0
+            raise OSError(f"no pressure stall information in {self.path}")
+        self._rates = CounterRates()
+        self._lock = threading.Lock()
+
+    @property
+    def resources(self):
+        return tuple(self._files)
+
+    def sample(self):
+        """{resource: {some_avg10, ..., some_total_us, some_stall_percent, full_...}}"""
+        with self._lock:
+            parsed = {}
+            for resource, proc_file in self._files.items():
+                try:
+                    parsed[resource] = parse_pressure(proc_file.read())
+                except (OSError, ValueError):
+                    continue
+            deltas = self._rates.update({resource: {kind: values[3] for kind, values in p.items()}
+                                         for resource, p in parsed.items()})
+            return {resource: stall_fields(p, *deltas[resource]) for resource, p in parsed.items()}
+
+    def close(self):
+        with self._lock:
+            for proc_file in self._files.values():
+                proc_file.close()
+            self._files = {}
+
+
+def parse_triggers(spec):
+    """'memory:full:100:2000,io:some:500:2000' (resource:kind:stall ms:window ms) -> [(resource, kind, stall_us, window_us)]
+
+    Không có CAP_SYS_RESOURCE thì kernel chỉ nhận cửa sổ là bội số của 2 giây.
+    """
+    triggers = []
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        try:
+            resource, kind, stall_ms, window_ms = item.split(':')
+            stall, window = int(float(stall_ms) * 1000), int(float(window_ms) * 1000)
+        except ValueError:
+            raise ValueError(f"invalid PSI trigger '{item}' (expected resource:some|full:stall_ms:window_ms)")
+        if resource not in RESOURCES or kind not in KINDS:
+            raise ValueError(f"invalid PSI trigger '{item}': resource must be one of {RESOURCES}, kind one of {KINDS}")
+        if not TRIGGER_MIN_WINDOW <= window <= TRIGGER_MAX_WINDOW or not 0 < stall <= window:
+            raise ValueError(f"invalid PSI trigger '{item}': window must be 500-10000 ms and stall within it")
+        triggers.append((resource, kind, stall, window))
+    return triggers
+
+
+class PressureTriggers:
+    """Trigger PSI của kernel: một thread poll POLLPRI trên các fd trigger và gọi callback(resource, kind)
+
+    Kernel chỉ báo tối đa một lần mỗi cửa sổ cho mỗi trigger; trigger bị huỷ (POLLERR) thì bị bỏ đi.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or PRESSURE_PATH
+        self._fds = {}
+        self._poll = select.poll()
+        self._stop = threading.Event()
+        self._thread = None
+        self.events = 0
+        self.last_event = None
+
+    def add(self, resource, kind, stall_us, window_us):
+        fd = os.open(os.path.join(self.path, resource), os.O_RDWR | os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        try:
+            os.write(fd, f"{kind} {stall_us} {window_us}".encode('ascii') + b'\0')
+        except OSError:
+            os.close(fd)
+            raise
+        self._fds[fd] = (resource, kind)
+        self._poll.register(fd, select.POLLPRI)
+
+    def __len__(self):
+        return len(self._fds)
+
+    def stats(self):
+        return {
+            "armed": [f"{resource} {kind}" for resource, kind in self._fds.values()],
+            "events": self.events,
+            "last_event": self.last_event
+        }
+
+    def _run(self, callback):
+        while not self._stop.is_set():
+            # Timeout ngắn để close() không phải chờ lâu
+            for fd, events in self._poll.poll(500):
+                target = self._fds.get(fd)
+                if target is None:
+                    continue
+                if events & (select.POLLERR | select.POLLNVAL):
+                    self._poll.unregister(fd)
+                    print(f"⚠️  PSI trigger {target[0]} {target[1]} removed by the kernel")
+                    continue
+                if events & select.POLLPRI:
+                    self.events += 1
+                    self.last_event = time.time()
+                    try:
+                        callback(*target)
+                    except Exception as e:
+                        print(f"❌ PSI trigger callback failed: {e}")
+
+    def start(self, callback):
+        if self._fds and self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(callback,), name="psi-triggers", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = {}
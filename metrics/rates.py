@@ -0,0 +1,151 @@
+"""Tính tốc độ thực theo từng chu kỳ từ delta của các bộ đếm mạng và ổ đĩa"""
+import os
+import threading
+import time
+
+import psutil
+
+COUNTER_32_MAX = 2**32
+COUNTER_64_MAX = 2**64
+
+# Bỏ qua các block device ảo không phản ánh I/O thật
+IGNORED_DISK_PREFIXES = ('loop', 'ram')
+
+# Thư mục sysfs liệt kê block device nguyên ổ (benchmark trỏ sang cây giả lập)
+SYS_BLOCK_PATH = '/sys/block'
+
+
+def counter_delta(prev, cur):
+    """Delta của bộ đếm tăng dần, xử lý tràn 32/64-bit; None nếu bộ đếm bị reset"""
+    if cur >= prev:
+        return cur - prev
+    # Chỉ coi là tràn khi giá trị trước đó đã gần đỉnh, còn lại là reset (driver reload, device mới)
+    if COUNTER_32_MAX * 3 // 4 <= prev < COUNTER_32_MAX:
+        return cur + COUNTER_32_MAX - prev
+    if COUNTER_64_MAX * 3 // 4 <= prev < COUNTER_64_MAX:
+        return cur + COUNTER_64_MAX - prev
+    return None
+
+
+class CounterRates:
+    """Giữ snapshot bộ đếm trước đó cho từng key (NIC, device) và trả về delta mỗi chu kỳ"""
+
+    def __init__(self):
+        self._prev = {}
+        self._lock = threading.Lock()
+
+    def update(self, counters, now=None):
+        """counters: {key: {field: value}} -> {key: (giây đã trôi qua, {field: delta hoặc None})}"""
+        now = time.monotonic() if now is None else now
+        deltas = {}
+        with self._lock:
+            for key, fields in counters.items():
+                prev = self._prev.get(key)
+                if prev is None:
+                    # Device mới (hot-plug) -> chưa có mốc, bắt đầu tính từ chu kỳ sau
+                    deltas[key] = (None, {})
+                    continue
+                prev_time, prev_fields = prev
+                elapsed = now - prev_time
+                deltas[key] = (elapsed, {
+                    name: counter_delta(prev_fields[name], value) if name in prev_fields else None
+                    for name, value in fields.items()
+                })
+            # Device đã bị gỡ thì bỏ mốc cũ đi
+            self._prev = {key: (now, dict(fields)) for key, fields in counters.items()}
+        return deltas
+
+
+def _per_sec(delta, elapsed):
+    if delta is None or not elapsed or elapsed <= 0:
+        return None
+    return round(delta / elapsed, 2)
+
+
+def psutil_net_counters():
+    return {nic: c._asdict() for nic, c in psutil.net_io_counters(pernic=True).items()}
+
+
+def psutil_disk_counters():
+    return {dev: c._asdict() for dev, c in (psutil.disk_io_counters(perdisk=True) or {}).items()}
+
+
+class NetworkRates:
+    """Tốc độ bytes/s, packets/s, lỗi/s của từng NIC"""
+
+    def __init__(self, source=None):
+        """source: hàm trả về {nic: {field: value}}, vd. ProcReader.net_io_counters; mặc định psutil"""
+        self._rates = CounterRates()
+        self._source = source or psutil_net_counters
+        # Tổng các bộ đếm của mọi NIC (gồm loopback) từ lần đọc gần nhất, như psutil.net_io_counters()
+        self.totals = {}
+
+    def sample(self):
+        raw = self._source()
+        self.totals = {field: sum(c[field] for c in raw.values()) for field in next(iter(raw.values()), {})}
+        interfaces = {}
+        for nic, (elapsed, d) in self._rates.update(raw).items():
+            c = raw[nic]
+            errors = None if d.get('errin') is None or d.get('errout') is None else d['errin'] + d['errout']
+            drops = None if d.get('dropin') is None or d.get('dropout') is None else d['dropin'] + d['dropout']
+            interfaces[nic] = {
+                "bytes_sent": c['bytes_sent'],
+                "bytes_recv": c['bytes_recv'],
+                "packets_sent": c['packets_sent'],
+                "packets_recv": c['packets_recv'],
+                "errors": c['errin'] + c['errout'],
+                "drops": c['dropin'] + c['dropout'],
+                "sent_bytes_per_sec": _per_sec(d.get('bytes_sent'), elapsed),
+                "recv_bytes_per_sec": _per_sec(d.get('bytes_recv'), elapsed),
+                "sent_packets_per_sec": _per_sec(d.get('packets_sent'), elapsed),
+                "recv_packets_per_sec": _per_sec(d.get('packets_recv'), elapsed),
+                "errors_per_sec": _per_sec(errors, elapsed),
+                "drops_per_sec": _per_sec(drops, elapsed)
+            }
+        return interfaces
+
+
+def _is_whole_disk(name):
+    """Chỉ lấy disk vật lý/ảo (sda, nvme0n1, vda), không lấy partition hay loop"""
+    if name.startswith(IGNORED_DISK_PREFIXES):
+        return False
+    if os.path.isdir(SYS_BLOCK_PATH):
+        return os.path.exists(os.path.join(SYS_BLOCK_PATH, name))
+    return True
+
+
+class DiskRates:
+    """IOPS, throughput, await và % utilisation của từng block device"""
+
+    def __init__(self, source=None):
+        """source: hàm trả về {device: {field: value}}, vd. ProcReader.disk_io_counters; mặc định psutil"""
+        self._rates = CounterRates()
+        self._source = source or psutil_disk_counters
+
+    def sample(self):
+        raw = {dev: c for dev, c in self._source().items() if _is_whole_disk(dev)}
+        devices = {}
+        for dev, (elapsed, d) in self._rates.update(raw).items():
+            c = raw[dev]
+            reads, writes = d.get('read_count'), d.get('write_count')
+            read_time, write_time = d.get('read_time'), d.get('write_time')
+            ops = None if reads is None or writes is None else reads + writes
+            io_time = None if read_time is None or write_time is None else read_time + write_time
+            busy = d.get('busy_time')
+            devices[dev] = {
+                "read_bytes": c['read_bytes'],
+                "write_bytes": c['write_bytes'],
+                "read_count": c['read_count'],
+                "write_count": c['write_count'],
+                "read_bytes_per_sec": _per_sec(d.get('read_bytes'), elapsed),
+                "write_bytes_per_sec": _per_sec(d.get('write_bytes'), elapsed),
+                "read_iops": _per_sec(reads, elapsed),
+                "write_iops": _per_sec(writes, elapsed),
+                # await = tổng thời gian chờ I/O (ms) / số I/O hoàn thành trong chu kỳ
+                "read_await_ms": round(read_time / reads, 2) if reads and read_time is not None else (0.0 if reads == 0 else None),
+                "write_await_ms": round(write_time / writes, 2) if writes and write_time is not None else (0.0 if writes == 0 else None),
+                "await_ms": round(io_time / ops, 2) if ops and io_time is not None else (0.0 if ops == 0 else None),
+                # busy_time (ms) chỉ có trên Linux/FreeBSD
+                "util_percent": round(min(100.0, busy / (elapsed * 1000) * 100), 2) if busy is not None and elapsed else None
+            }
+        return devices
@@ -0,0 +1,119 @@
+"""Bộ lấy mẫu nền và cache snapshot metrics dùng chung cho mọi consumer"""
+import asyncio
+import threading
+import time
+
+
+class SnapshotCache:
+    """Lưu snapshot metrics mới nhất, thread-safe và có version tăng dần"""
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+        self._updated_at = 0.0
+
+    def publish(self, snapshot):
+        """Thay snapshot hiện tại bằng snapshot mới, trả về version mới"""
+        with self._cond:
+            self._version += 1
+            self._snapshot = snapshot
+            self._updated_at = time.monotonic()
+            self._cond.notify_all()
+            return self._version
+
+    def get(self):
+        """Trả về (version, snapshot, tuổi tính bằng giây)"""
+        with self._cond:
+            if self._snapshot is None:
+                return 0, None, None
+            return self._version, self._snapshot, time.monotonic() - self._updated_at
+
+    def get_fresh(self):
+        """Trả về snapshot nếu chưa quá max_age, ngược lại None"""
+        version, snapshot, age = self.get()
+        if snapshot is None or age > self.max_age:
+            return None
+        return snapshot
+
+    @property
+    def version(self):
+        with self._cond:
+            return self._version
+
+    def wait_for_update(self, version, timeout=None):
+        """Chờ đến khi có snapshot mới hơn version, trả về (version, snapshot)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > version, timeout=timeout)
+            return self._version, self._snapshot
+
+
+class MetricsSampler:
+    """Task nền trên event loop thu thập metrics theo chu kỳ riêng và ghi vào SnapshotCache"""
+
+    def __init__(self, collect_func, cache, interval):
+        self.collect_func = collect_func
+        self.cache = cache
+        self.interval = interval
+        self._collect_lock = threading.Lock()
+        self._task = None
+        self._listeners = []
+
+    def add_listener(self, func):
+        """Đăng ký hàm nhận (version, snapshot) ngay sau mỗi lần publish (history, alert...)"""
+        self._listeners.append(func)
+
+    def refresh(self):
+        """Thu thập ngay một snapshot mới (chỉ một lần dù nhiều thread cùng gọi)"""
+        version = self.cache.version
+        with self._collect_lock:
+            # Thread khác vừa thu thập xong trong lúc chờ lock -> dùng luôn kết quả đó
+            if self.cache.version != version:
+                return self.cache.get()[1]
+            snapshot = self.collect_func()
+            version = self.cache.publish(snapshot)
+            for listener in self._listeners:
+                try:
+                    listener(version, snapshot)
+                except Exception as e:
+                    print(f"❌ Snapshot listener {getattr(listener, '__name__', listener)} failed: {e}")
+            return snapshot
+
+    def get_snapshot(self):
+        """Lấy snapshot mới nhất, chỉ thu thập đồng bộ khi cache rỗng hoặc quá cũ"""
+        snapshot = self.cache.get_fresh()
+        if snapshot is not None:
+            return snapshot
+        return self.refresh()
+
+    def get_versioned_snapshot(self):
+        """Giống get_snapshot nhưng trả về kèm version, dùng làm khoá cho cache encode"""
+        version, snapshot, age = self.cache.get()
+        if snapshot is None or age > self.cache.max_age:
+            self.refresh()
+            version, snapshot, _ = self.cache.get()
+        return version, snapshot
+
+    async def run(self):
+        """Vòng lấy mẫu; phần thu thập (psutil, chặn) chạy trên executor mặc định của loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                print(f"❌ Sampler failed to collect metrics: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (loop.time() - started)))
+
+    def start(self):
+        """Tạo task lấy mẫu trong event loop đang chạy"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run(), name="metrics-sampler")
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,230 @@
+"""Chi phí của chính agent: histogram thời gian theo stage, bộ đếm, độ trễ scheduler/event loop và CPU/RSS của process"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+# Biên trên (ms) của các bucket histogram; bucket cuối là +Inf
+BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0, 30000.0)
+
+
+class StageStats:
+    """Histogram cố định cho một stage: observe O(số bucket), không giữ từng mẫu"""
+
+    __slots__ = ('count', 'failures', 'total', 'max', 'last', 'window_max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+        # Max kể từ lần export trước (snapshot), để đồ thị thấy được từng đợt chậm
+        self.window_max = None
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, ms, ok=True):
+        self.count += 1
+        if not ok:
+            self.failures += 1
+        self.total += ms
+        self.last = ms
+        if ms > self.max:
+            self.max = ms
+        if self.window_max is None or ms > self.window_max:
+            self.window_max = ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q):
+        """Biên trên của bucket chứa quantile q (ước lượng, không vượt max thực tế)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return round(min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max, 3)
+        return round(self.max, 3)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "total_ms": round(self.total, 3),
+            "avg_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 3),
+            "last_ms": round(self.last, 3) if self.last is not None else None
+        }
+
+
+class SelfStats:
+    """Sổ đo dùng chung cho mọi stage của agent, an toàn giữa các thread"""
+
+    def __init__(self, process_sample_interval=1.0):
+        self.started = time.time()
+        self.process_sample_interval = process_sample_interval
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._process = psutil.Process(os.getpid())
+        self._process_lock = threading.Lock()
+        self._prev_cpu = None
+        self._process_info = None
+        self._loop_task = None
+
+    # ---------- stage timers ----------
+
+    def observe(self, stage, seconds, ok=True):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.observe(seconds * 1000, ok)
+
+    @contextmanager
+    def timer(self, stage):
+        """with self_stats.timer('influx.write'): ... -> ghi thời gian, exception được tính là failure"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - started, ok=False)
+            raise
+        self.observe(stage, time.perf_counter() - started)
+
+    def timed(self, stage):
+        """Decorator của timer cho cả hàm thường lẫn coroutine"""
+        def decorate(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(stage):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    # ---------- scheduler và event loop ----------
+
+    def watch_scheduler(self, scheduler):
+        """Độ trễ từ giờ hẹn tới lúc job được submit, số job bị lỡ/lỗi/bỏ vì còn đang chạy"""
+        from apscheduler.events import (EVENT_JOB_ERROR, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED,
+                                        EVENT_JOB_SUBMITTED)
+
+        def on_event(event):
+            if event.code == EVENT_JOB_SUBMITTED:
+                if event.scheduled_run_times:
+                    lag = time.time() - event.scheduled_run_times[-1].timestamp()
+                    self.observe('scheduler.lag', max(0.0, lag))
+            elif event.code == EVENT_JOB_MISSED:
+                self.count('scheduler.missed')
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                self.count('scheduler.skipped')
+            elif event.code == EVENT_JOB_ERROR:
+                self.count('scheduler.errors')
+
+        scheduler.add_listener(on_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_ERROR)
+
+    async def _watch_loop(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            # Ngủ lâu hơn hẹn = event loop bị chặn bởi một callback khác trong khoảng đó
+            self.observe('event_loop.lag', max(0.0, loop.time() - started - interval))
+
+    def start_loop_monitor(self, interval=1.0):
+        self._loop_task = asyncio.get_running_loop().create_task(self._watch_loop(interval), name="loop-lag-monitor")
+        return self._loop_task
+
+    async def stop_loop_monitor(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+    # ---------- process ----------
+
+    def process(self):
+        """CPU% (delta từ lần đọc trước), RSS, số thread và fd của agent; đọc lại tối đa mỗi process_sample_interval"""
+        with self._process_lock:
+            now = time.monotonic()
+            if self._process_info is not None and now - self._prev_cpu[0] < self.process_sample_interval:
+                return self._process_info
+            proc = self._process
+            with proc.oneshot():
+                times = proc.cpu_times()
+                cpu_seconds = times.user + times.system
+                memory = proc.memory_info()
+                threads = proc.num_threads()
+                fds = proc.num_fds() if hasattr(proc, 'num_fds') else None
+            cpu_percent = None
+            if self._prev_cpu is not None and now > self._prev_cpu[0]:
+                cpu_percent = round(max(0.0, (cpu_seconds - self._prev_cpu[1]) / (now - self._prev_cpu[0]) * 100), 2)
+            self._prev_cpu = (now, cpu_seconds)
+            self._process_info = {
+                "cpu_percent": cpu_percent,
+                "cpu_seconds": round(cpu_seconds, 2),
+                "rss_bytes": memory.rss,
+                "threads": threads,
+                "open_fds": fds,
+                "uptime_seconds": round(time.time() - self.started, 1)
+            }
+            return self._process_info
+
+    # ---------- export ----------
+
+    def stats(self):
+        """Toàn bộ số đo cho /health"""
+        with self._lock:
+            stages = {name: stats.summary() for name, stats in sorted(self._stages.items())}
+            counters = dict(sorted(self._counters.items()))
+        return {"process": self.process(), "stages": stages, "counters": counters}
+
+    def summary(self, extra=None):
+        """Section 'agent' của snapshot: process, độ trễ scheduler/loop và số đo từng stage
+
+        count/failures/total_ms là bộ đếm tích luỹ (lấy rate được); window_max_ms là max kể từ snapshot trước.
+        """
+        with self._lock:
+            stages = {}
+            for name, stats in sorted(self._stages.items()):
+                summary = stats.summary()
+                stages[name] = {
+                    "count": summary["count"],
+                    "failures": summary["failures"],
+                    "total_ms": summary["total_ms"],
+                    "p99_ms": summary["p99_ms"],
+                    "window_max_ms": round(stats.window_max, 3) if stats.window_max is not None else None
+                }
+                stats.window_max = None
+            counters = dict(self._counters)
+        return {
+            **self.process(),
+            "event_loop_lag_ms": (stages.get('event_loop.lag') or {}).get('window_max_ms'),
+            "scheduler_lag_ms": (stages.get('scheduler.lag') or {}).get('window_max_ms'),
+            "scheduler_missed": counters.get('scheduler.missed', 0),
+            "failures": sum(s["failures"] for s in stages.values()),
+            **(extra or {}),
+            "stages": stages
+        }
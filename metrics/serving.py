@@ -0,0 +1,160 @@
+"""Phục vụ HTTP cho production: encode một lần mỗi version snapshot, ETag/304, nén gzip/zstd, encoder JSON tuỳ chọn"""
+import asyncio
+import gzip
+import json
+import threading
+import time
+
+from aiohttp import web
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Payload nhỏ hơn ngưỡng này không đáng để nén
+MIN_COMPRESS_BYTES = 1024
+
+
+def make_json_encoder(name='json'):
+    """Trả về hàm obj -> bytes; 'orjson' nhanh hơn nhiều với payload lớn (process, per-core)"""
+    if name == 'orjson':
+        if orjson is None:
+            print("⚠️  JSON_ENCODER=orjson but orjson is not installed - falling back to json")
+        else:
+            return lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return lambda obj: json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def available_encodings():
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding, enabled=('zstd', 'gzip')):
+    """Chọn content-coding tốt nhất mà client chấp nhận (ưu tiên zstd, rồi gzip)"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    for coding in enabled:
+        if coding in available_encodings() and accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return 'identity'
+
+
+def compress(body, coding, level=None):
+    if coding == 'gzip':
+        return gzip.compress(body, compresslevel=level or 6)
+    if coding == 'zstd':
+        return zstandard.ZstdCompressor(level=level or 3).compress(body)
+    return body
+
+
+def make_etag(epoch, version, coding):
+    # Mỗi content-coding là một representation khác nhau nên có ETag riêng;
+    # epoch khác nhau sau mỗi lần khởi động vì version snapshot đếm lại từ 1
+    return f'"{epoch}-{version}-{coding}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # So sánh yếu: bỏ tiền tố W/ theo RFC 9110
+    # (không dùng str.removeprefix: cần Python 3.9, README vẫn hỗ trợ 3.8)
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+class VersionedPayload:
+    """Cache payload đã encode (và đã nén theo từng coding) cho version snapshot hiện tại"""
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self._lock = threading.Lock()
+        self._version = None
+        self._bodies = {}
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, version, data, coding='identity'):
+        with self._lock:
+            if version != self._version:
+                self._bodies = {'identity': self.encoder(data)}
+                self._version = version
+                self.encodes += 1
+            body = self._bodies.get(coding)
+            if body is None:
+                body = self._bodies[coding] = compress(self._bodies['identity'], coding)
+            else:
+                self.hits += 1
+            return body
+
+
+class ResponseFactory:
+    """Dựng response có ETag/304 và nén; encode/nén chạy trên executor riêng để không chặn event loop"""
+
+    def __init__(self, executor=None, json_encoder='json', encodings=('zstd', 'gzip')):
+        self.executor = executor
+        self.json_encoder = 'orjson' if json_encoder == 'orjson' and orjson is not None else 'json'
+        self.encode_json = make_json_encoder(json_encoder)
+        self.encodings = encodings
+        self.epoch = format(int(time.time()), 'x')
+        self.not_modified = 0
+
+    def _coding(self, request, size=None):
+        if size is not None and size < MIN_COMPRESS_BYTES:
+            return 'identity'
+        return negotiate_encoding(request.headers.get('Accept-Encoding'), self.encodings)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def versioned(self, request, version, data, cache, content_type):
+        """Response cho dữ liệu gắn version snapshot: 304 nếu client đã có bản này"""
+        coding = self._coding(request)
+        etag = make_etag(self.epoch, version, coding)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        body = await self._run(cache.get, version, data, coding)
+        headers['Content-Type'] = content_type
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return web.Response(body=body, headers=headers)
+
+    async def json(self, request, data, status=200):
+        """JSON không cache (tham số thay đổi theo request) nhưng vẫn dùng encoder và nén"""
+        body = await self._run(self.encode_json, data)
+        coding = self._coding(request, len(body))
+        headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+        if coding != 'identity':
+            body = await self._run(compress, body, coding)
+            headers['Content-Encoding'] = coding
+        return web.Response(body=body, status=status, headers=headers)
+
+    def stats(self, **caches):
+        return {
+            "json_encoder": self.json_encoder,
+            "encodings": [c for c in self.encodings if c in available_encodings()],
+            "not_modified": self.not_modified,
+            **{name: {"encodes": cache.encodes, "hits": cache.hits} for name, cache in caches.items()}
+        }
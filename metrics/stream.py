@@ -0,0 +1,185 @@
+"""Đẩy snapshot tới nhiều client (SSE/WebSocket) từ một vòng lấy mẫu chung, bỏ frame cho client chậm"""
+import asyncio
+import time
+
+from history import parse_duration
+
+
+def parse_subscription(params):
+    """Đọc fields / interval / changes từ query string hoặc message JSON của client"""
+    fields = params.get('fields') or ()
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    interval = params.get('interval') or 0
+    interval = parse_duration(str(interval)) if interval else 0.0
+    changes = params.get('changes', False)
+    if isinstance(changes, str):
+        changes = changes.strip().lower() in ('1', 'true', 'yes', 'on')
+    return tuple(fields), interval, bool(changes)
+
+
+def project(snapshot, fields):
+    """Chỉ giữ các field được chọn (đường dẫn dạng 'cpu.usage_percent'), giữ nguyên cấu trúc lồng nhau"""
+    if not fields:
+        return snapshot
+    out = {}
+    for path in fields:
+        keys = path.split('.')
+        value = snapshot
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                value = None
+                break
+            value = value[key]
+        if value is None:
+            continue
+        target = out
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return out
+
+
+def diff(old, new):
+    """Các field thay đổi giữa hai projection; field bị xoá có giá trị None, list được thay nguyên"""
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+        elif old[key] != value:
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                changes[key] = diff(old[key], value)
+            else:
+                changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+class Subscriber:
+    """Một client đang nghe; hộp thư chỉ giữ snapshot mới nhất nên client chậm bị bỏ frame thay vì dồn hàng"""
+
+    def __init__(self, fields=(), min_interval=0.0, changes_only=False):
+        self.fields = fields
+        self.min_interval = min_interval
+        self.changes_only = changes_only
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self._latest = None
+        self._last_sent = None
+        self._event = asyncio.Event()
+
+    def update(self, fields, min_interval, changes_only):
+        self.fields = fields
+        self.min_interval = min_interval
+        self.changes_only = changes_only
+        # Frame tiếp theo là bản đầy đủ theo subscription mới
+        self._last_sent = None
+
+    def offer(self, version, snapshot):
+        if self._latest is not None:
+            self.dropped += 1
+        self._latest = (version, snapshot)
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def next(self, timeout=None):
+        """Frame tiếp theo (dict) hoặc None khi hết timeout/đã đóng; bỏ qua snapshot không có gì đổi"""
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            self._event.clear()
+            if self.closed or self._latest is None:
+                continue
+            version, snapshot = self._latest
+            self._latest = None
+
+            data = project(snapshot, self.fields)
+            frame = {"type": "snapshot", "version": version, "timestamp": snapshot.get('timestamp'), "data": data}
+            if self.changes_only and self._last_sent is not None:
+                changes = diff(self._last_sent, data)
+                changes.pop('timestamp', None)
+                if not changes:
+                    continue
+                frame = {"type": "delta", "version": version, "timestamp": snapshot.get('timestamp'), "data": changes}
+            self._last_sent = data
+            self.sent += 1
+            return frame
+        return None
+
+
+class StreamHub:
+    """Phân phối mỗi snapshot mới tới mọi subscriber; frame đầy đủ được encode một lần cho mỗi bộ field"""
+
+    def __init__(self, encoder, max_subscribers=100):
+        self.encoder = encoder
+        self.max_subscribers = max_subscribers
+        self.rejected = 0
+        # Tổng dồn của các subscriber đã ngắt kết nối
+        self._sent = 0
+        self._dropped = 0
+        self._subscribers = set()
+        self._loop = None
+        self._frame_version = None
+        self._frame_cache = {}
+
+    def bind(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+
+    def publish_threadsafe(self, version, snapshot):
+        """Listener của sampler (chạy trên thread thu thập) -> chuyển sang event loop"""
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self.publish, version, snapshot)
+
+    def publish(self, version, snapshot):
+        for subscriber in list(self._subscribers):
+            subscriber.offer(version, snapshot)
+
+    def subscribe(self, fields=(), min_interval=0.0, changes_only=False):
+        if len(self._subscribers) >= self.max_subscribers:
+            self.rejected += 1
+            return None
+        subscriber = Subscriber(fields, min_interval, changes_only)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        if subscriber in self._subscribers:
+            self._subscribers.discard(subscriber)
+            self._sent += subscriber.sent
+            self._dropped += subscriber.dropped
+
+    def encode(self, subscriber, frame):
+        """bytes JSON của frame; frame 'snapshot' giống nhau giữa các client cùng fields nên được cache"""
+        if frame["type"] != "snapshot":
+            return self.encoder(frame)
+        if frame["version"] != self._frame_version:
+            self._frame_version = frame["version"]
+            self._frame_cache = {}
+        body = self._frame_cache.get(subscriber.fields)
+        if body is None:
+            body = self._frame_cache[subscriber.fields] = self.encoder(frame)
+        return body
+
+    def close(self):
+        for subscriber in list(self._subscribers):
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        subscribers = list(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "max_subscribers": self.max_subscribers,
+            "rejected": self.rejected,
+            "frames_sent": self._sent + sum(s.sent for s in subscribers),
+            "frames_dropped": self._dropped + sum(s.dropped for s in subscribers)
+        }
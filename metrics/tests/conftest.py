@@ -0,0 +1,5 @@
+"""Các module của agent nằm phẳng trong metrics/ và import lẫn nhau theo tên (như khi chạy python app.py)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
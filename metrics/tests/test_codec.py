@@ -0,0 +1,54 @@
+"""Định dạng snapshot gọn: decode ra đúng snapshot gốc, kể cả timestamp quanh lúc đổi giờ DST"""
+import time
+from datetime import datetime
+
+import pytest
+
+from codec import decode_block, encode_block
+
+
+@pytest.fixture
+def berlin(monkeypatch):
+    # Múi giờ có DST: 2026-03-29 02:00-03:00 không tồn tại, 2026-10-25 02:00-03:00 lặp lại hai lần
+    if not hasattr(time, 'tzset'):
+        pytest.skip("time.tzset is not available")
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _snapshot(timestamp, usage):
+    return {"timestamp": timestamp, "cpu": {"usage_percent": usage, "cores": [usage, 1.5]}, "gpus": []}
+
+
+def test_round_trip():
+    snapshots = [_snapshot(datetime(2026, 10, 17, 10, 0, i, i * 1001).isoformat(), 10.25 + i) for i in range(10)]
+    snapshots[4]["cpu"]["usage_percent"] = 1 / 3
+    assert decode_block(encode_block(snapshots, keyframe_interval=3)) == snapshots
+
+
+@pytest.mark.parametrize("timestamps", [
+    # Giờ lặp lại khi lùi đồng hồ: datetime.now() đi 02:59 -> 02:00 -> 03:00
+    ["2026-10-25T02:59:59.900000", "2026-10-25T02:00:00.100000", "2026-10-25T02:30:00", "2026-10-25T03:00:00.500000"],
+    # Quanh lúc tiến đồng hồ, gồm cả giờ không tồn tại trong múi giờ local
+    ["2026-03-29T01:59:59.999999", "2026-03-29T02:30:00", "2026-03-29T03:00:00.000001"],
+])
+def test_timestamps_across_dst(berlin, timestamps):
+    snapshots = [_snapshot(ts, 5.0) for ts in timestamps]
+    assert [s["timestamp"] for s in decode_block(encode_block(snapshots))] == timestamps
+
+
+def test_timestamp_does_not_depend_on_local_zone(berlin, monkeypatch):
+    # Block ghi ở múi giờ này phải giải mã y hệt ở múi giờ khác (spill được replay sau khi đổi TZ)
+    snapshots = [_snapshot("2026-10-25T02:15:00.250000", 1.0), _snapshot("2026-10-25T02:15:05", 2.0)]
+    block = encode_block(snapshots)
+    monkeypatch.setenv('TZ', 'Asia/Ho_Chi_Minh')
+    time.tzset()
+    assert decode_block(block) == snapshots
+
+
+def test_aware_timestamp_is_stored_as_utc():
+    decoded = decode_block(encode_block([_snapshot("2026-10-25T02:30:00+02:00", 1.0)]))
+    assert decoded[0]["timestamp"] == "2026-10-25T00:30:00"
@@ -0,0 +1,94 @@
+"""GPU collector qua NVML trên shim fake_nvml (GPU_BACKEND=fake): format dict, process, throttle và lỗi driver"""
+import pytest
+
+import fake_nvml
+import gpu
+
+
+@pytest.fixture
+def nvml(monkeypatch):
+    # Mỗi test một bộ GPU giả mới, số lượng đọc từ FAKE_NVML_GPUS như khi chạy agent
+    monkeypatch.setenv('FAKE_NVML_GPUS', '2')
+    monkeypatch.setattr(fake_nvml, 'devices', [])
+    monkeypatch.setattr(fake_nvml, '_initialized', False)
+    return fake_nvml
+
+
+@pytest.fixture
+def backend(nvml):
+    backend = gpu.NvmlBackend(nvml=nvml)
+    yield backend
+    backend.close()
+
+
+def test_collect(backend, nvml):
+    assert backend.available()
+    gpus = backend.collect()
+    assert [g["index"] for g in gpus] == [0, 1]
+    first = gpus[0]
+    device = nvml.devices[0]
+    assert first["name"] == device.name
+    assert first["uuid"] == device.uuid
+    assert first["temperature_c"] == device.temperature
+    assert first["usage_percent"] == device.utilization
+    assert first["memory"]["total_gb"] == 24.0
+    assert first["memory"]["used_gb"] == 1.0
+    assert first["memory"]["usage_percent"] == round(1 / 24 * 100, 2)
+    assert first["power_draw_w"] == 75.0
+    assert first["power_limit_w"] == 350.0
+    assert first["clocks"] == {"graphics_mhz": 1500, "sm_mhz": 1500, "memory_mhz": 9500}
+    assert first["ecc_errors"] == {"corrected": 0, "uncorrected": 0}
+    assert first["throttle_reasons"] == ['gpu_idle']
+    assert first["processes"] == [{"pid": 1000, "used_memory_mb": 1024.0}]
+
+
+def test_device_count_from_env(monkeypatch, nvml):
+    monkeypatch.setenv('FAKE_NVML_GPUS', '4')
+    backend = gpu.NvmlBackend(nvml=nvml)
+    try:
+        assert [g["index"] for g in backend.collect()] == [0, 1, 2, 3]
+    finally:
+        backend.close()
+
+
+def test_throttle_reasons_and_processes(backend, nvml):
+    backend.collect()
+    device = nvml.devices[1]
+    device.throttle_reasons = 0x4 | 0x40
+    device.processes = [fake_nvml.ProcessInfo(pid=7, usedGpuMemory=512 * 1024**2),
+                        fake_nvml.ProcessInfo(pid=8, usedGpuMemory=2 * 1024**3)]
+    info = backend.collect()[1]
+    assert info["throttle_reasons"] == ['sw_power_cap', 'hw_thermal_slowdown']
+    # Process dùng nhiều VRAM nhất đứng đầu
+    assert info["processes"] == [{"pid": 8, "used_memory_mb": 2048.0}, {"pid": 7, "used_memory_mb": 512.0}]
+
+
+def test_unsupported_field_is_none(backend, nvml, monkeypatch):
+    # GPU không có quạt / driver không hỗ trợ truy vấn -> trường đó None, các trường khác vẫn đủ
+    def no_fan(handle):
+        raise fake_nvml.NVMLError('Not Supported')
+
+    monkeypatch.setattr(nvml, 'nvmlDeviceGetFanSpeed', no_fan)
+    gpus = backend.collect()
+    assert [g["fan_speed_percent"] for g in gpus] == [None, None]
+    assert gpus[0]["temperature_c"] == nvml.devices[0].temperature
+
+
+def test_collector_fake_backend(nvml):
+    collector = gpu.GpuCollector(backend='fake')
+    try:
+        assert len(collector.collect()) == 2
+        assert collector.backend.name == 'nvml'
+    finally:
+        collector.close()
+
+
+def test_collector_without_gpu(nvml, monkeypatch):
+    # Driver không nạp được -> không có backend, collector trả về [] thay vì ném lỗi vào sampler
+    def broken():
+        raise fake_nvml.NVMLError('Driver Not Loaded')
+
+    monkeypatch.setattr(nvml, 'nvmlInit', broken)
+    collector = gpu.GpuCollector(backend='fake')
+    assert collector.collect() == []
+    assert collector.backend is None
@@ -0,0 +1,83 @@
+"""parse_duration/parse_since và HistoryStore: các khoảng thời gian bot và API quảng cáo phải parse được"""
+import os
+import re
+
+import pytest
+
+from history import HistoryStore, flatten_snapshot, parse_duration, parse_since
+from mmstore import DEFAULT_TIERS, parse_tiers
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def _advertised_spans():
+    """Các khoảng trong '/history <metric> [1h|1d|...]' của help và thông báo cách dùng"""
+    with open(APP, encoding='utf-8') as f:
+        source = f.read()
+    spans = set()
+    for group in re.findall(r'/history <metric> \[([0-9a-z|]+)\]', source):
+        spans.update(group.split('|'))
+    return sorted(spans)
+
+
+def test_advertised_spans_parse():
+    spans = _advertised_spans()
+    assert '1y' in spans
+    for span in spans:
+        assert parse_duration(span) > 0
+
+
+@pytest.mark.parametrize('value, seconds', [
+    ('90', 90), ('15m', 900), ('2h', 7200), ('1d', 86400), ('30d', 30 * 86400), ('1y', 365 * 86400), ('1.5h', 5400)
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '1w', '-5m'])
+def test_parse_duration_invalid(value):
+    with pytest.raises(ValueError):
+        parse_duration(value)
+
+
+def test_parse_since_relative_and_absolute():
+    now = 1_800_000_000
+    assert parse_since('1y', now) == now - 365 * 86400
+    assert parse_since('1700000000', now) == 1_700_000_000
+
+
+def test_one_year_fits_default_tiers():
+    # Tầng thô nhất mặc định (1h:365d) giữ trọn khoảng /history ... 1y
+    assert parse_tiers(DEFAULT_TIERS)[-1].retention >= parse_duration('1y')
+
+
+def test_cgroup_series_keyed_by_path():
+    # Hai unit cùng tên hiển thị ở hai nhánh khác nhau không được gộp vào một series
+    group = {"name": "web", "cpu_percent": 1.0, "memory_bytes": 10}
+    metrics = {
+        "cpu": {"usage_percent": 1.0}, "memory": {"usage_percent": 1.0}, "disk": {"usage_percent": 1.0},
+        "network": {"sent_mb_per_sec": 0.0, "recv_mb_per_sec": 0.0},
+        "cgroups": {"groups": {"system.slice/web.service": group, "user.slice/web.service": dict(group, cpu_percent=2.0)}}
+    }
+    values = flatten_snapshot(metrics)
+    assert values["cgroup_cpu_percent:system.slice/web.service"] == 1.0
+    assert values["cgroup_cpu_percent:user.slice/web.service"] == 2.0
+
+
+def test_only_fresh_sources_are_flattened():
+    metrics = {"cpu": {"usage_percent": 5.0, "load_1min": 0.5}, "memory": {"usage_percent": 1.0},
+               "disk": {"usage_percent": 1.0}, "network": {"sent_mb_per_sec": 0.0, "recv_mb_per_sec": 0.0}}
+    assert set(flatten_snapshot(metrics, {'load'})) == {'load_1min'}
+
+
+def test_stale_series_expire_and_free_room():
+    store = HistoryStore(retention=120, interval=10, max_series=2)
+    store.record(1000, {"a": 1.0, "b": 1.0})
+    store.record(1010, {"c": 1.0})
+    assert store.rejected_series == 1
+    # 'b' ngừng cập nhật quá retention -> bị bỏ, series mới lại được ghi
+    for t in range(1020, 1200, 10):
+        store.record(t, {"a": 1.0})
+    store.record(1200, {"a": 1.0, "c": 2.0})
+    assert store.series() == ['a', 'c']
+    assert store.expired_series == 1
@@ -0,0 +1,121 @@
+"""NotificationDispatcher với bot giả: flood control (RetryAfter), gộp alert, fallback Markdown, chat migrate"""
+import asyncio
+import time
+
+from telegram.error import BadRequest, ChatMigrated, RetryAfter
+
+from fake_botapi import FakeBotApi
+from notifier import NotificationDispatcher
+
+
+class ScriptedBot:
+    """bot.send_message ghi lại mọi lời gọi; lỗi trong 'errors' được ném lần lượt trước khi gửi thành công"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.calls.append({"chat_id": chat_id, "text": text, "parse_mode": parse_mode, "at": time.monotonic()})
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+class FakeApiBot:
+    """Chuyển send_message thành lời gọi FakeBotApi, mã lỗi 429 thành RetryAfter như python-telegram-bot"""
+
+    def __init__(self, api):
+        self.api = api
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.attempts.append(time.monotonic())
+        status, body = self.api.handle('sendMessage', {"chat_id": chat_id, "text": text, "parse_mode": parse_mode})
+        if status == 429:
+            raise RetryAfter(body["parameters"]["retry_after"])
+        assert status == 200, body
+
+
+def run(bot, send, settle=0, **options):
+    """Chạy send(dispatcher) trong event loop mới, chờ 'settle' giây rồi dừng dispatcher (gửi nốt hàng đợi)"""
+    options.setdefault('coalesce_seconds', 0)
+
+    async def main():
+        dispatcher = NotificationDispatcher(bot, **options)
+        send(dispatcher)
+        # stop() bỏ qua cửa sổ gộp nên test gộp phải chờ hết cửa sổ trước
+        await asyncio.sleep(settle)
+        await dispatcher.stop(timeout=10)
+        return dispatcher
+
+    return asyncio.run(main())
+
+
+def test_retry_after_blocks_chat():
+    # Bot API chỉ nhận 20 message/giây mỗi chat và trả về retry_after=1 khi vượt
+    api = FakeBotApi(chat_rate=20)
+    bot = FakeApiBot(api)
+    dispatcher = run(bot, lambda d: [d.submit([1], f"m{i}") for i in range(2)], chat_rate=100, chat_burst=10)
+    assert [m["text"] for m in api.messages] == ["m0", "m1"]
+    assert api.flood_responses == 1
+    assert dispatcher.retry_after == 1
+    assert dispatcher.delivered == 2 and dispatcher.failed == 0
+    # Sau 429 chat bị chặn đúng retry_after, không gửi dồn lại ngay
+    assert bot.attempts[2] - bot.attempts[1] >= 0.95
+
+
+def test_retry_after_blocks_only_that_chat():
+    bot = ScriptedBot(RetryAfter(0.3))
+    dispatcher = run(bot, lambda d: (d.submit([1], "slow"), d.submit([2], "fast")))
+    sent = {call["chat_id"]: call for call in bot.calls[1:]}
+    assert sent[2]["at"] - bot.calls[0]["at"] < 0.2
+    assert sent[1]["at"] - bot.calls[0]["at"] >= 0.25
+    assert dispatcher.delivered == 2
+
+
+def test_coalesce_alerts():
+    def send(dispatcher):
+        dispatcher.submit([1], "cpu high", coalesce_key='alert')
+        dispatcher.submit([1], "ram high", coalesce_key='alert')
+        dispatcher.submit([1], "status")
+
+    bot = ScriptedBot()
+    dispatcher = run(bot, send, settle=0.3, coalesce_seconds=0.1)
+    # Hai alert trong cùng cửa sổ đi chung một message, message không có key gửi riêng
+    assert [call["text"] for call in bot.calls] == ["cpu high\n\nram high", "status"]
+    assert dispatcher.coalesced == 1
+    assert dispatcher.delivered == 2
+
+
+def test_markdown_fallback_on_bad_request():
+    bot = ScriptedBot(BadRequest("Can't parse entities: can't find end of the entity starting at byte offset 7"))
+    dispatcher = run(bot, lambda d: d.submit([1], "/mnt/my_disk"))
+    assert [call["parse_mode"] for call in bot.calls] == ['Markdown', None]
+    assert bot.calls[1]["text"] == "/mnt/my_disk"
+    assert dispatcher.delivered == 1 and dispatcher.failed == 0
+
+
+def test_other_bad_request_fails():
+    bot = ScriptedBot(BadRequest("Chat not found"))
+    dispatcher = run(bot, lambda d: d.submit([1], "hello"))
+    assert len(bot.calls) == 1
+    assert dispatcher.failed == 1 and dispatcher.delivered == 0
+
+
+def test_chat_migration():
+    def send(dispatcher):
+        dispatcher.submit([-100], "first")
+        dispatcher.submit([-100], "second")
+
+    bot = ScriptedBot(ChatMigrated(-1001234))
+    dispatcher = run(bot, send)
+    # Gửi lại tới supergroup mới và dùng luôn chat id đó cho các message sau
+    assert [(call["chat_id"], call["text"]) for call in bot.calls] == [(-100, "first"), (-1001234, "first"), (-1001234, "second")]
+    assert dispatcher.delivered == 2
+
+
+def test_split_long_message():
+    bot = ScriptedBot()
+    text = "\n\n".join("x" * 3000 for _ in range(3))
+    run(bot, lambda d: d.submit([1], text))
+    assert [len(call["text"]) for call in bot.calls] == [3000, 3000, 3000]
@@ -0,0 +1,87 @@
+"""procfs fast path trên bản ghi /proc tĩnh: kết quả phải khớp giá trị parse thẳng từ file và khớp psutil"""
+import os
+import sys
+
+import psutil
+import pytest
+
+import procfs
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'benchmarks', 'proc_fixtures', 'linux-6.18-vm')
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="procfs fast path is Linux-only")
+
+
+def _lines(name):
+    with open(os.path.join(FIXTURE, name)) as f:
+        return f.read().splitlines()
+
+
+def _meminfo():
+    return {line.split(':')[0]: int(line.split()[1]) * 1024 for line in _lines('meminfo')}
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    # Cả fast path lẫn psutil cùng đọc bản ghi thay cho /proc của máy chạy test
+    monkeypatch.setattr(procfs, 'PROC_PATH', FIXTURE)
+    monkeypatch.setattr(psutil, 'PROCFS_PATH', FIXTURE)
+    reader = procfs.ProcReader()
+    yield reader
+    reader.close()
+
+
+def test_cpu_times(reader):
+    ticks = os.sysconf('SC_CLK_TCK')
+    rows = [line.split() for line in _lines('stat') if line.startswith('cpu')]
+    total, cores = reader.cpu_times()
+    assert tuple(total) == tuple(int(v) / ticks for v in rows[0][1:])
+    assert total._fields == procfs.CPU_FIELDS
+    assert [tuple(core) for core in cores] == [tuple(int(v) / ticks for v in row[1:]) for row in rows[1:]]
+
+
+def test_virtual_memory(reader):
+    info = _meminfo()
+    cached = info['Cached'] + info['SReclaimable']
+    memory = reader.virtual_memory()
+    assert memory.total == info['MemTotal']
+    assert memory.free == info['MemFree']
+    assert memory.available == info['MemAvailable']
+    assert memory.buffers == info['Buffers']
+    assert memory.cached == cached
+    assert memory.shared == info['Shmem']
+    assert memory.used == info['MemTotal'] - info['MemFree'] - cached - info['Buffers']
+    assert memory.percent == round((info['MemTotal'] - info['MemAvailable']) / info['MemTotal'] * 100, 1)
+
+
+def test_net_io_counters(reader):
+    expected = {}
+    for line in _lines('net/dev')[2:]:
+        nic, fields = line.split(':')
+        f = [int(v) for v in fields.split()]
+        expected[nic.strip()] = {
+            'bytes_sent': f[8], 'bytes_recv': f[0], 'packets_sent': f[9], 'packets_recv': f[1],
+            'errin': f[2], 'errout': f[10], 'dropin': f[3], 'dropout': f[11]
+        }
+    assert reader.net_io_counters() == expected
+    assert expected['eth0']['bytes_recv'] == 12616493
+
+
+def test_disk_io_counters(reader):
+    expected = {}
+    for line in _lines('diskstats'):
+        f = line.split()
+        expected[f[2]] = {
+            'read_count': int(f[3]), 'write_count': int(f[7]),
+            'read_bytes': int(f[5]) * procfs.SECTOR_SIZE, 'write_bytes': int(f[9]) * procfs.SECTOR_SIZE,
+            'read_time': int(f[6]), 'write_time': int(f[10]),
+            'read_merged_count': int(f[4]), 'write_merged_count': int(f[8]), 'busy_time': int(f[12])
+        }
+    assert reader.disk_io_counters() == expected
+    assert expected['vda']['read_bytes'] == 1597890 * 512
+
+
+def test_matches_psutil():
+    # Bản ghi tĩnh -> hai bên phải khớp tuyệt đối
+    assert procfs.compare_with_psutil(FIXTURE, rel_tol=1e-9, abs_tol=1e-9) == []